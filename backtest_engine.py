@@ -0,0 +1,325 @@
+"""
+Backtest Engine - Chạy điều kiện Doji trên lịch sử dài và đo kết quả SAU tín hiệu
+- Điều kiện giống hệt Bot Live (DojiDetector.is_doji_with_low_volume) nhưng tính bằng NumPy trên toàn bộ lịch sử
+- Gắn nhãn mỗi tín hiệu: lợi nhuận sau N nến + chạm TP/SL trước (tìm kiếm vectorized)
+- Tổng hợp win rate, expectancy, drawdown theo symbol/timeframe
+"""
+import os
+import time
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from tabulate import tabulate
+from kline_client import get_default_client, INTERVAL_MS
+from exchanges import COLUMNS, rows_to_arrays
+from kline_archive import ARCHIVE_EXT, ARCHIVE_ERRORS, read_index, read_archive, write_archive, append_archive
+
+# ========== CẤU HÌNH ==========
+SYMBOLS = ["BTCUSDT", "ETHUSDT", "BNBUSDT", "SOLUSDT"]
+TIMEFRAMES = ["1h", "2h", "4h", "1d"]
+HISTORY_DAYS = 3 * 365
+HISTORY_DIR = "history"
+HORIZONS = [1, 3, 6, 12]  # Lợi nhuận sau N nến
+TP_PERCENT = 2.0          # Take-profit (% từ giá đóng cửa nến Doji)
+SL_PERCENT = 1.0          # Stop-loss (% từ giá đóng cửa nến Doji)
+MAX_HOLD = 24             # Số nến tối đa giữ lệnh
+
+# Tham số giống DojiDetector (cùng tên thuộc tính)
+DEFAULT_PARAMS = {
+    "doji_threshold": 10,
+    "volume_ratio": 0.9,
+    "min_body_position": 35,
+    "max_body_position": 65,
+    "min_shadow_percent": 5,
+    "prev_shadow_threshold": 65,
+    "prev_body_threshold": 65
+}
+
+# Kết quả lệnh
+OUTCOME_TIMEOUT = 0
+OUTCOME_TP = 1
+OUTCOME_SL = 2
+OUTCOME_OPEN = 3  # Chưa chạm TP/SL và lịch sử hết trước max_hold nến → chưa có kết quả (lợi nhuận NaN)
+
+
+def params_from_detector(detector):
+    """Lấy tham số hiện tại của DojiDetector để backtest đúng như Bot Live"""
+    return {name: getattr(detector, name) for name in DEFAULT_PARAMS}
+
+
+# ========== DỮ LIỆU ==========
+def _history_path(symbol, interval, history_dir):
+    return os.path.join(history_dir, f"{symbol}_{interval}{ARCHIVE_EXT}")
+
+
+def load_history(symbol, interval, days=HISTORY_DAYS, history_dir=HISTORY_DIR, kline_client=None):
+    """
+    Lấy lịch sử nến đã đóng trong `days` ngày gần nhất
+    Cache ra archive nén (kline_archive), lần sau chỉ tải + ghi thêm phần nến mới,
+    đọc chỉ các khối nằm trong khoảng cần (cache .npz cũ: python kline_archive.py convert)
+    """
+    client = kline_client or get_default_client()
+    now_ms = int(time.time() * 1000)
+    start_ms = now_ms - days * 24 * 60 * 60 * 1000
+    path = _history_path(symbol, interval, history_dir)
+
+    cached_last = None
+    if os.path.exists(path):
+        try:
+            chunks = read_index(path)["chunks"]
+        except ARCHIVE_ERRORS:
+            chunks = []  # Archive hỏng → tải lại từ đầu
+        # Cache không đủ xa về quá khứ → tải lại từ đầu
+        if chunks and chunks[0]["first"] <= start_ms + INTERVAL_MS.get(interval, 0):
+            cached_last = chunks[-1]["last"]
+
+    fetch_from = start_ms if cached_last is None else cached_last + 1
+    new = rows_to_arrays(client.get_klines_range(symbol, interval, fetch_from))
+
+    # Chỉ giữ nến đã đóng
+    closed = new["close_time"] < now_ms
+    new = {col: new[col][closed] for col in COLUMNS}
+
+    os.makedirs(history_dir, exist_ok=True)
+    if cached_last is None:
+        write_archive(path, new, symbol, interval)
+        return read_archive(path, start_ms=start_ms)
+
+    try:
+        append_archive(path, new, symbol, interval)
+        return read_archive(path, start_ms=start_ms)
+    except ARCHIVE_ERRORS:
+        # Khối trong archive hỏng (chỉ mục vẫn đọc được) → xóa và tải lại từ đầu
+        os.remove(path)
+        return load_history(symbol, interval, days, history_dir, kline_client)
+
+
+# ========== ĐIỀU KIỆN DOJI (VECTORIZED) ==========
+def compute_features(arrays):
+    """
+    Tính các đặc trưng nến 1 lần cho toàn bộ lịch sử
+    Phần tử i = nến Doji ứng viên, nến trước = i-1 (phần tử 0 không hợp lệ)
+    Công thức giữ đúng thứ tự phép tính như bản scalar để kết quả khớp tuyệt đối
+    """
+    o, h, l, c, v = (arrays[col] for col in ["open", "high", "low", "close", "volume"])
+
+    price_range = h - l
+    body = np.abs(c - o)
+    body_top = np.maximum(o, c)
+    body_bottom = np.minimum(o, c)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        body_percent = (body / price_range) * 100
+        body_position = ((body_bottom - l) / price_range) * 100
+        upper_shadow_pct = ((h - body_top) / price_range) * 100
+        lower_shadow_pct = ((body_bottom - l) / price_range) * 100
+
+    # Nến trước: đỏ = -1, xanh = 1, doji = 0
+    direction = np.sign(c - o)
+    upper_shadow_prev = np.where(direction < 0, h - c, np.where(direction > 0, h - o, 0.0))
+
+    def shift(x, fill):
+        out = np.empty_like(x)
+        out[:1] = fill
+        out[1:] = x[:-1]
+        return out
+
+    prev_range = shift(price_range, 0.0)
+    prev_volume = shift(v, 0.0)
+
+    return {
+        "valid": (price_range != 0) & (prev_range != 0) & (prev_volume != 0),
+        "body_percent": body_percent,
+        "body_position": body_position,
+        "upper_shadow_pct": upper_shadow_pct,
+        "lower_shadow_pct": lower_shadow_pct,
+        "volume": v,
+        "prev_volume": prev_volume,
+        "prev_range": prev_range,
+        "prev_body": shift(body, 0.0),
+        "prev_direction": shift(direction, 0.0),
+        "prev_upper_shadow": shift(upper_shadow_prev, 0.0)
+    }
+
+
+def signal_masks(features, params, timeframe):
+    """Mask LONG/SHORT cho toàn bộ lịch sử - cùng điều kiện với is_doji_with_low_volume"""
+    is_doji = features["valid"] & \
+        (features["body_percent"] <= params["doji_threshold"]) & \
+        (features["body_position"] >= params["min_body_position"]) & \
+        (features["body_position"] <= params["max_body_position"]) & \
+        (features["upper_shadow_pct"] >= params["min_shadow_percent"]) & \
+        (features["lower_shadow_pct"] >= params["min_shadow_percent"])
+
+    # Volume thấp - bỏ qua khung 1d
+    if timeframe != "1d":
+        is_doji &= features["volume"] <= params["volume_ratio"] * features["prev_volume"]
+
+    prev_ok = (features["prev_upper_shadow"] > (params["prev_shadow_threshold"] / 100) * features["prev_range"]) & \
+        (features["prev_body"] >= (params["prev_body_threshold"] / 100) * features["prev_range"])
+
+    long_mask = is_doji & prev_ok & (features["prev_direction"] < 0)
+    short_mask = is_doji & prev_ok & (features["prev_direction"] > 0)
+    return long_mask, short_mask
+
+
+# ========== GẮN NHÃN KẾT QUẢ ==========
+def label_outcomes(arrays, entry_idx, direction, horizons=HORIZONS,
+                   tp_percent=TP_PERCENT, sl_percent=SL_PERCENT, max_hold=MAX_HOLD):
+    """
+    Gắn nhãn kết quả cho các lệnh vào tại close của nến entry_idx
+    direction: +1 LONG, -1 SHORT
+    TP và SL chạm cùng 1 nến → tính là SL (thận trọng)
+    Lệnh cuối lịch sử chưa chạm TP/SL và chưa đủ max_hold nến → OUTCOME_OPEN, trade_return NaN
+    (không tính như TIMEOUT với lợi nhuận dở dang), bars_held = số nến đã có
+    """
+    close, high, low = arrays["close"], arrays["high"], arrays["low"]
+    n = len(close)
+    entry_idx = np.asarray(entry_idx, dtype=np.int64)
+    direction = np.asarray(direction, dtype=float)
+    entry = close[entry_idx]
+
+    # Lợi nhuận sau N nến (NaN nếu chưa đủ nến)
+    forward = {}
+    for horizon in horizons:
+        exit_idx = entry_idx + horizon
+        ok = exit_idx < n
+        ret = np.full(len(entry_idx), np.nan)
+        ret[ok] = direction[ok] * (close[exit_idx[ok]] / entry[ok] - 1) * 100
+        forward[horizon] = ret
+
+    # Cửa sổ max_hold nến sau entry - pad NaN ở cuối lịch sử
+    pad = np.full(max_hold, np.nan)
+    high_windows = sliding_window_view(np.concatenate([high, pad]), max_hold)[entry_idx + 1]
+    low_windows = sliding_window_view(np.concatenate([low, pad]), max_hold)[entry_idx + 1]
+
+    is_long = (direction > 0)[:, None]
+    tp_price = np.where(direction > 0, entry * (1 + tp_percent / 100), entry * (1 - tp_percent / 100))[:, None]
+    sl_price = np.where(direction > 0, entry * (1 - sl_percent / 100), entry * (1 + sl_percent / 100))[:, None]
+
+    with np.errstate(invalid="ignore"):
+        tp_hit = np.where(is_long, high_windows >= tp_price, low_windows <= tp_price)
+        sl_hit = np.where(is_long, low_windows <= sl_price, high_windows >= sl_price)
+
+    tp_bar = np.where(tp_hit.any(axis=1), tp_hit.argmax(axis=1), max_hold)
+    sl_bar = np.where(sl_hit.any(axis=1), sl_hit.argmax(axis=1), max_hold)
+
+    outcome = np.full(len(entry_idx), OUTCOME_TIMEOUT)
+    outcome[tp_bar < sl_bar] = OUTCOME_TP
+    outcome[(sl_bar <= tp_bar) & (sl_bar < max_hold)] = OUTCOME_SL
+    outcome[(outcome == OUTCOME_TIMEOUT) & (entry_idx + max_hold >= n)] = OUTCOME_OPEN
+
+    # Hết thời gian giữ → thoát ở close nến thứ max_hold (lệnh OPEN: nến cuối cùng có dữ liệu)
+    timeout_exit = np.minimum(entry_idx + max_hold, n - 1)
+    timeout_ret = direction * (close[timeout_exit] / entry - 1) * 100
+
+    trade_return = np.where(outcome == OUTCOME_TP, tp_percent,
+                            np.where(outcome == OUTCOME_SL, -sl_percent,
+                                     np.where(outcome == OUTCOME_OPEN, np.nan, timeout_ret)))
+    bars_held = np.where(outcome == OUTCOME_TP, tp_bar + 1,
+                         np.where(outcome == OUTCOME_SL, sl_bar + 1, timeout_exit - entry_idx))
+
+    return {
+        "outcome": outcome,
+        "trade_return": trade_return,
+        "bars_held": bars_held,
+        "forward": forward
+    }
+
+
+def summarize(trade_return, forward=None):
+    """
+    Win rate, expectancy và max drawdown (theo đường equity cộng dồn %)
+    Lệnh chưa có kết quả (NaN - OUTCOME_OPEN) không tính, chỉ đếm vào "open"
+    """
+    trade_return = np.asarray(trade_return, dtype=float)
+    closed = ~np.isnan(trade_return)
+    open_count = int(len(trade_return) - closed.sum())
+    trade_return = trade_return[closed]
+    count = len(trade_return)
+    if count == 0:
+        return {"trades": 0, "open": open_count, "win_rate": 0.0, "expectancy": 0.0, "total_return": 0.0,
+                "max_drawdown": 0.0}
+
+    equity = np.cumsum(trade_return)
+    peak = np.maximum.accumulate(np.concatenate([[0.0], equity]))[1:]
+
+    stats = {
+        "trades": count,
+        "open": open_count,
+        "win_rate": float((trade_return > 0).mean() * 100),
+        "expectancy": float(trade_return.mean()),
+        "total_return": float(equity[-1]),
+        "max_drawdown": float((peak - equity).max())
+    }
+    for horizon, ret in (forward or {}).items():
+        stats[f"fwd_{horizon}"] = float(np.nanmean(ret)) if np.isfinite(ret).any() else float("nan")
+    return stats
+
+
+# ========== BACKTEST ==========
+def backtest_arrays(arrays, timeframe, params=None, horizons=HORIZONS,
+                    tp_percent=TP_PERCENT, sl_percent=SL_PERCENT, max_hold=MAX_HOLD):
+    """Backtest 1 lịch sử đã tải: trả về (trades, stats)"""
+    params = params or DEFAULT_PARAMS
+    features = compute_features(arrays)
+    long_mask, short_mask = signal_masks(features, params, timeframe)
+
+    entry_idx = np.flatnonzero(long_mask | short_mask)
+    direction = np.where(long_mask[entry_idx], 1.0, -1.0)
+    labels = label_outcomes(arrays, entry_idx, direction, horizons, tp_percent, sl_percent, max_hold)
+
+    trades = {
+        "index": entry_idx,
+        "close_time": arrays["close_time"][entry_idx],
+        "price": arrays["close"][entry_idx],
+        "direction": direction,
+        **labels
+    }
+    return trades, summarize(labels["trade_return"], labels["forward"])
+
+
+def run_engine(symbols=SYMBOLS, timeframes=TIMEFRAMES, days=HISTORY_DAYS, params=None):
+    """Backtest toàn bộ watchlist và in bảng tổng hợp"""
+    print("\n" + "="*100)
+    print("🔍 BACKTEST ENGINE - TÍN HIỆU DOJI + KẾT QUẢ SAU TÍN HIỆU")
+    print("="*100)
+    print(f"\n📊 {len(symbols)} symbols × {len(timeframes)} khung, {days} ngày lịch sử")
+    print(f"🎯 TP {TP_PERCENT}% / SL {SL_PERCENT}% / giữ tối đa {MAX_HOLD} nến\n")
+
+    results = []
+    started = time.perf_counter()
+
+    for symbol in symbols:
+        for timeframe in timeframes:
+            try:
+                arrays = load_history(symbol, timeframe, days)
+            except Exception as e:
+                print(f"❌ Lỗi khi lấy dữ liệu {symbol} {timeframe}: {e}")
+                continue
+
+            _, stats = backtest_arrays(arrays, timeframe, params)
+            results.append((symbol, timeframe, len(arrays["close"]), stats))
+
+    elapsed = time.perf_counter() - started
+
+    table = []
+    for symbol, timeframe, bars, stats in results:
+        table.append([
+            symbol, timeframe, bars, f"{stats['trades']}" + (f" (+{stats['open']} mở)" if stats["open"] else ""),
+            f"{stats['win_rate']:.1f}%", f"{stats['expectancy']:.2f}%",
+            f"{stats['total_return']:.1f}%", f"{stats['max_drawdown']:.1f}%",
+            *[f"{stats.get(f'fwd_{h}', float('nan')):.2f}%" for h in HORIZONS]
+        ])
+
+    headers = ["Symbol", "TF", "Nến", "Lệnh", "Win", "Expectancy", "Tổng", "Max DD",
+               *[f"+{h} nến" for h in HORIZONS]]
+    print(tabulate(table, headers=headers, tablefmt="grid"))
+    print(f"\n⏱️ Hoàn thành trong {elapsed:.1f}s")
+    return results
+
+
+if __name__ == "__main__":
+    try:
+        run_engine()
+    except KeyboardInterrupt:
+        print("\n\n⛔ Đã dừng!")
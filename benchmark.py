@@ -0,0 +1,224 @@
+"""
+Benchmark - Đo tốc độ các hot path của detector và SR calculator trên fixtures offline cố định
+- Fixtures: nến tổng hợp xác định (SyntheticKlines) tại 1 mốc thời gian cố định → mọi lần chạy cùng dữ liệu
+- Lưu kết quả mỗi lần chạy vào BENCH_HISTORY (JSONL), so với median các lần trước trên cùng máy
+- Exit code 1 nếu có benchmark chậm hơn baseline quá ngưỡng
+"""
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import statistics
+from clock import VirtualClock
+from kline_client import KlineClient, INTERVAL_MS
+from detector import DojiDetector
+from sr_calculator import SupportResistanceCalculator
+from mock_binance import MockBinanceServer, SyntheticKlines, synthetic_symbols
+
+# ========== CẤU HÌNH ==========
+BENCH_HISTORY = "bench_history.jsonl"
+REGRESSION_THRESHOLD = 0.25   # Chậm hơn baseline > 25% → fail
+BASELINE_RUNS = 5             # Baseline = median của N lần chạy gần nhất
+FIXTURE_END_MS = 1_700_006_400_000   # Mốc cố định (đầu 1 ngày UTC)
+FIXTURE_SYMBOLS = synthetic_symbols(8)
+
+
+# ========== FIXTURES ==========
+def fixture_rows(symbol, interval, limit):
+    """Raw rows Binance cố định: `limit` nến kết thúc tại FIXTURE_END_MS (nến cuối đang hình thành)"""
+    step = INTERVAL_MS[interval]
+    last = FIXTURE_END_MS // step + 1
+    arrays = SyntheticKlines().arrays(symbol, interval, last - limit, last)
+    return [
+        [int(arrays["open_time"][i]), repr(float(arrays["open"][i])), repr(float(arrays["high"][i])),
+         repr(float(arrays["low"][i])), repr(float(arrays["close"][i])), repr(float(arrays["volume"][i])),
+         int(arrays["close_time"][i]), "0", 0, "0", "0", "0"]
+        for i in range(limit)
+    ]
+
+
+class FixtureClient:
+    """Thay KlineClient: trả rows từ fixtures, không có I/O"""
+
+    def __init__(self):
+        self.stats = {"requests": 0, "cache_hits": 0, "coalesced": 0, "rate_limited": 0, "used_weight": 0}
+        self._rows = {}
+
+    def get_klines(self, symbol, interval, limit=500):
+        key = (symbol, interval, limit)
+        if key not in self._rows:
+            self._rows[key] = fixture_rows(symbol, interval, limit)
+        return self._rows[key]
+
+    async def fetch_klines(self, symbol, interval, limit=500):
+        return self.get_klines(symbol, interval, limit)
+
+
+def candle_pairs(count=5000):
+    """Các cặp (nến trước, nến hiện tại) dạng dict như detector nhận"""
+    detector = DojiDetector(kline_client=FixtureClient())
+    candles = []
+    for symbol in FIXTURE_SYMBOLS:
+        candles.extend(detector.get_klines(symbol, "1h", limit=count // len(FIXTURE_SYMBOLS) + 1))
+    return [(candles[i - 1], candles[i]) for i in range(1, len(candles))][:count]
+
+
+# ========== BENCHMARKS ==========
+def bench_is_true_doji():
+    detector = DojiDetector(kline_client=FixtureClient())
+    pairs = candle_pairs()
+    return lambda: [detector.is_true_doji(current) for _, current in pairs]
+
+
+def bench_is_doji_with_low_volume():
+    detector = DojiDetector(kline_client=FixtureClient())
+    pairs = candle_pairs()
+    return lambda: [detector.is_doji_with_low_volume(current, previous, "X", "1h") for previous, current in pairs]
+
+
+def bench_find_pivots():
+    calculator = SupportResistanceCalculator(kline_client=FixtureClient())
+    frames = [calculator.get_klines(symbol, "1h", 500) for symbol in FIXTURE_SYMBOLS]
+    return lambda: [calculator.find_pivots(df) for df in frames]
+
+
+def bench_get_sr_vals():
+    calculator = SupportResistanceCalculator(kline_client=FixtureClient())
+    df = calculator.get_klines(FIXTURE_SYMBOLS[0], "1h", 500)
+    pivots = calculator.find_pivots(df)
+    cwidth = (df['high'].tail(300).max() - df['low'].tail(300).min()) * calculator.channel_width_pct / 100
+    return lambda: [calculator.get_sr_vals(pivots, i, cwidth) for i in range(len(pivots))]
+
+
+def bench_calculate_sr_levels():
+    calculator = SupportResistanceCalculator(kline_client=FixtureClient())
+    return lambda: calculator.calculate_sr_levels(FIXTURE_SYMBOLS[0], "1h")
+
+
+def bench_vectorized_sr():
+    """S/R engine mặc định của detector (NumPy, cùng kết quả reference) cho cả watchlist"""
+    from sr_engines import create_sr_engine
+    calculator = create_sr_engine("vectorized", kline_client=FixtureClient())
+    return lambda: [calculator.calculate_sr_levels(symbol, "1h") for symbol in FIXTURE_SYMBOLS]
+
+
+def bench_volume_profile_sr():
+    """Volume profile S/R cho cả watchlist (tính lại mỗi lần nến đóng)"""
+    from sr_engines import VolumeProfileSRCalculator
+    calculator = VolumeProfileSRCalculator(kline_client=FixtureClient())
+    return lambda: [calculator.calculate_sr_levels(symbol, "1h") for symbol in FIXTURE_SYMBOLS]
+
+
+def bench_scan_symbols():
+    """
+    1 lượt scan_symbols đầy đủ qua HTTP tới MockBinanceServer, ngay sau khi nến 1d đóng
+    Đồng hồ ảo (mỗi lần chạy bắt đầu lại cùng thời điểm) → bản chậm hơn không bị shed / quá hạn mà "nhanh" hơn
+    Server khởi động 1 lần, ngoài phần đo
+    """
+    server = MockBinanceServer(SyntheticKlines(FIXTURE_SYMBOLS), VirtualClock(FIXTURE_END_MS / 1000 + 15)).start()
+
+    def run():
+        clock = server.clock = VirtualClock(FIXTURE_END_MS / 1000 + 15)
+        client = KlineClient(url=server.klines_url, clock=clock)
+        detector = DojiDetector(kline_client=client, clock=clock)
+        asyncio.run(detector.scan_symbols(FIXTURE_SYMBOLS))
+    run.close = server.stop
+    return run
+
+
+BENCHMARKS = {
+    "is_true_doji": (bench_is_true_doji, 20),
+    "is_doji_with_low_volume": (bench_is_doji_with_low_volume, 20),
+    "find_pivots": (bench_find_pivots, 20),
+    "get_sr_vals": (bench_get_sr_vals, 20),
+    "calculate_sr_levels": (bench_calculate_sr_levels, 3),
+    "vectorized_sr": (bench_vectorized_sr, 20),
+    "volume_profile_sr": (bench_volume_profile_sr, 20),
+    "scan_symbols": (bench_scan_symbols, 3)
+}
+
+
+def measure(fn, repeat):
+    """Chạy fn `repeat` lần, trả về thời gian nhỏ nhất (giây) - ít nhiễu nhất; fn.close (nếu có) dọn dẹp sau cùng"""
+    try:
+        fn()  # Warm-up
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - started)
+        return min(timings)
+    finally:
+        if hasattr(fn, "close"):
+            fn.close()
+
+
+# ========== LỊCH SỬ & SO SÁNH ==========
+def load_history(path, host):
+    runs = []
+    try:
+        with open(path) as f:
+            for line in f:
+                run = json.loads(line)
+                if run.get("host") == host:
+                    runs.append(run)
+    except FileNotFoundError:
+        pass
+    return runs
+
+
+def baseline(runs, name, count=BASELINE_RUNS):
+    values = [run["results"][name] for run in runs if name in run.get("results", {})][-count:]
+    return statistics.median(values) if values else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark detector/SR hot paths")
+    parser.add_argument("-k", "--filter", default="", help="Chỉ chạy benchmark có tên chứa chuỗi này")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    parser.add_argument("--history", default=BENCH_HISTORY)
+    parser.add_argument("--no-record", action="store_true", help="Không lưu kết quả lần chạy này")
+    args = parser.parse_args()
+
+    host = socket.gethostname()
+    runs = load_history(args.history, host)
+    results = {}
+    regressions = []
+
+    print(f"\n{'Benchmark':<26}{'Thời gian':>14}{'Baseline':>14}{'Thay đổi':>12}")
+    print("-" * 66)
+    for name, (factory, repeat) in BENCHMARKS.items():
+        if args.filter not in name:
+            continue
+
+        seconds = measure(factory(), repeat)
+        results[name] = seconds
+        base = baseline(runs, name)
+
+        change = ""
+        if base:
+            ratio = seconds / base - 1
+            change = f"{ratio * 100:+.1f}%"
+            if ratio > args.threshold:
+                regressions.append(name)
+                change += " ❌"
+        base_text = f"{base * 1000:.2f}ms" if base else "-"
+        print(f"{name:<26}{seconds * 1000:>12.2f}ms{base_text:>14}{change:>12}")
+
+    # Lần chạy bị regression không được ghi → baseline không trôi dần theo bản chậm
+    if not args.no_record and results and not regressions:
+        with open(args.history, "a") as f:
+            f.write(json.dumps({"time": int(time.time()), "host": host, "results": results}) + "\n")
+
+    if regressions:
+        print(f"\n❌ Chậm hơn baseline > {args.threshold * 100:.0f}%: {', '.join(regressions)}")
+        return 1
+
+    print("\n✅ Không có regression")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,42 @@
 import os
+import html
 import json
+import time
 import asyncio
+import logging
 from telegram import Update
 from telegram.ext import Application, CommandHandler, ContextTypes
 from detector import DojiDetector
+from exchanges import EXCHANGE, EXCHANGES
+from kline_client import get_client, INTERVAL_MS
+from sr_engines import SR_ENGINES
+from signal_history import SignalHistory, HISTORY_QUERY_LIMIT
+from subscriptions import SubscriptionManager, parse_filter, format_filter
+from loop_monitor import LoopLagMonitor
+from metrics import METRICS_PORT, COUNTER, register, start_metrics_server
+from profiling import PROFILE_SCANS
+from early_warning import (EARLY_WARNING, STREAM_AVAILABLE, PRE_ALERT, CONFIRMED, CANCELLED, EarlyWarningMonitor,
+                           run_early_warning)
+from structured_log import log_event, setup_logging, sampler as log_sampler
+from state_snapshot import STATE_FILE, SNAPSHOT_INTERVAL, load_snapshot, save_snapshot, snapshot_venues, write_snapshot
 from datetime import datetime
 
 # ========== FILE LƯU DANH SÁCH SYMBOLS ==========
 SYMBOLS_FILE = "symbols.json"
 
+# ========== SÀN QUÉT (sàn đầu tiên là sàn chính: /status, profiling) ==========
+SCAN_EXCHANGES = [name for name in os.getenv("SCAN_EXCHANGES", EXCHANGE).replace(" ", "").split(",") if name]
+
+# ========== SR ENGINE THEO KHUNG (vd. 1h:volume_profile,4h:vectorized - khung khác dùng engine mặc định) ==========
+SR_ENGINE_BY_TIMEFRAME = [item.split(":", 1) for item in
+                          os.getenv("SR_ENGINE_BY_TIMEFRAME", "").replace(" ", "").split(",") if item]
+
+# ========== LỌC VOLUME TƯƠNG ĐỐI (vd. 0.8: volume Doji ≤ 80% trung bình 20 nến trước, trống = tắt) ==========
+RELATIVE_VOLUME_MAX = os.getenv("RELATIVE_VOLUME_MAX", "").strip()
+
+# ========== ADMIN (lệnh vận hành như /profile) ==========
+ADMIN_IDS = {int(x) for x in os.getenv("TELEGRAM_ADMIN_IDS", "").replace(" ", "").split(",") if x}
+
 # ========== CLASS QUẢN LÝ SYMBOLS ==========
 class SymbolManager:
     def __init__(self, filename=SYMBOLS_FILE):
@@ -96,6 +124,11 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "➕ <b>Quản lý coin:</b>\n"
         "/add BTCUSDT - Thêm coin vào danh sách\n"
         "/remove BTCUSDT - Xóa coin khỏi danh sách\n\n"
+        "🔔 <b>Nhận tín hiệu riêng:</b>\n"
+        "/subscribe BTCUSDT 4h LONG [sàn] - Đăng ký (bỏ trống hoặc * = tất cả)\n"
+        "/unsubscribe - Hủy đăng ký (tất cả hoặc theo bộ lọc)\n"
+        "/subscriptions - Xem đăng ký của chat này\n"
+        "/history BTCUSDT 4h 30 [sàn] - Tín hiệu đã gửi (khung, số ngày, sàn tùy chọn)\n\n"
         "💡 <b>Ví dụ:</b>\n"
         "<code>/add SOLUSDT</code>\n"
         "<code>/remove BNBUSDT</code>",
@@ -108,6 +141,19 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     detector = context.bot_data.get('detector')
     
     symbols = symbol_manager.get_symbols()
+    kline_stats = detector.kline_client.stats
+    loop_monitor = context.bot_data.get('loop_monitor')
+    scheduler_stats = detector.scheduler.stats
+    
+    loop_text = ""
+    if loop_monitor is not None:
+        lag = loop_monitor.stats()
+        loop_text = (f"\n🫀 Event loop lag: p50 {lag['p50'] * 1000:.0f}ms | p95 {lag['p95'] * 1000:.0f}ms | "
+                     f"p99 {lag['p99'] * 1000:.0f}ms | max {lag['max'] * 1000:.0f}ms\n"
+                     f"🐢 Callback chặn loop: {lag['slow_callbacks']}")
+        location = loop_monitor.last_slow_location()
+        if location:
+            loop_text += f" (gần nhất: <code>{html.escape(location)}</code>)"
     
     await update.message.reply_text(
         f"✅ <b>Bot đang hoạt động</b>\n\n"
@@ -116,7 +162,12 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"🎯 Chế độ: Realtime Detection\n"
         f"📏 Ngưỡng Doji: {detector.doji_threshold}%\n"
         f"📉 Ngưỡng Volume: {detector.volume_ratio * 100}%\n"
-        f"💾 Tín hiệu đã cache: {len(detector.signal_cache)}",
+        f"💾 Tín hiệu đã cache: {len(detector.signal_cache)}\n"
+        f"🌐 Kline API: {kline_stats['requests']} request | "
+        f"{kline_stats['cache_hits']} cache hit | {kline_stats['coalesced']} gộp\n"
+        f"⏰ Hạn chót: {scheduler_stats['missed']} trễ | {scheduler_stats['shed']} bỏ qua | "
+        f"trễ nhất {scheduler_stats['max_lateness_ms'] / 1000:.0f}s"
+        f"{loop_text}",
         parse_mode="HTML"
     )
 
@@ -185,7 +236,257 @@ async def remove_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             parse_mode="HTML"
         )
 
+async def subscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handler cho lệnh /subscribe - nhận tín hiệu theo bộ lọc ngay trong chat này"""
+    subscriptions = context.bot_data.get('subscriptions')
+    
+    try:
+        flt = parse_filter(context.args or [])
+    except ValueError as e:
+        await update.message.reply_text(
+            f"❌ {html.escape(str(e))}\n\n"
+            f"📝 Cú pháp: <code>/subscribe [SYMBOL] [1h|2h|4h|1d] [LONG|SHORT] [{'|'.join(EXCHANGES)}]</code>\n"
+            "💡 Ví dụ: <code>/subscribe BTCUSDT 4h</code>, <code>/subscribe * 1d SHORT binance_futures</code>",
+            parse_mode="HTML"
+        )
+        return
+    
+    success, message = subscriptions.subscribe(update.effective_chat.id, flt)
+    await update.message.reply_text(message)
+
+async def unsubscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handler cho lệnh /unsubscribe - không tham số hoặc 'all' = hủy tất cả"""
+    subscriptions = context.bot_data.get('subscriptions')
+    
+    flt = None
+    if context.args and context.args != ["all"]:
+        try:
+            flt = parse_filter(context.args)
+        except ValueError as e:
+            await update.message.reply_text(f"❌ {e}")
+            return
+    
+    success, message = subscriptions.unsubscribe(update.effective_chat.id, flt)
+    await update.message.reply_text(message)
+
+async def subscriptions_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handler cho lệnh /subscriptions - các bộ lọc của chat này"""
+    subscriptions = context.bot_data.get('subscriptions')
+    filters = subscriptions.get_filters(update.effective_chat.id)
+    
+    if not filters:
+        await update.message.reply_text(
+            "📭 Chat này chưa đăng ký tín hiệu nào\n\n"
+            "💡 Ví dụ: <code>/subscribe BTCUSDT 4h LONG</code>",
+            parse_mode="HTML"
+        )
+        return
+    
+    filters_text = "\n".join([f"  • {format_filter(flt)}" for flt in filters])
+    await update.message.reply_text(
+        f"🔔 <b>Đăng ký của chat này:</b>\n\n{filters_text}",
+        parse_mode="HTML"
+    )
+
+async def history_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handler cho lệnh /history SYMBOL [tf] [days] [venue]"""
+    history = context.bot_data.get('history')
+    detector = context.bot_data.get('detector')
+    
+    usage = (f"📝 Cú pháp: <code>/history BTCUSDT [1h|2h|4h|1d] [số ngày] [{'|'.join(SCAN_EXCHANGES)}]</code>\n"
+             "💡 Ví dụ: <code>/history ETHUSDT 4h 30</code>")
+    if not context.args:
+        await update.message.reply_text("❌ Vui lòng nhập symbol\n\n" + usage, parse_mode="HTML")
+        return
+    
+    symbol = context.args[0].upper()
+    timeframe = venue = None
+    days = 30
+    for arg in context.args[1:]:
+        if arg.isdigit():
+            days = int(arg)
+        elif arg.lower() in detector.timeframes:
+            timeframe = arg.lower()
+        elif arg.lower() in SCAN_EXCHANGES:
+            venue = arg.lower()
+        else:
+            await update.message.reply_text(
+                f"❌ Không hiểu '{html.escape(arg)}' (khung {'/'.join(detector.timeframes)}, số ngày "
+                f"hoặc sàn {'/'.join(SCAN_EXCHANGES)})\n\n" + usage,
+                parse_mode="HTML"
+            )
+            return
+    
+    since_ms = int((detector.clock.time() - days * 24 * 3600) * 1000)
+    rows = await asyncio.to_thread(history.query, symbol, timeframe, since_ms, None, HISTORY_QUERY_LIMIT,
+                                   venue=venue)
+    if not rows:
+        await update.message.reply_text(f"📭 Không có tín hiệu {symbol} trong {days} ngày qua")
+        return
+    
+    total = await asyncio.to_thread(history.count, symbol, timeframe, since_ms, venue)
+    # Quét nhiều sàn: ghi rõ sàn của từng tín hiệu (cùng 1 nến có thể có 1 dòng mỗi sàn)
+    show_venue = len(SCAN_EXCHANGES) > 1 or any(row['venue'] != SCAN_EXCHANGES[0] for row in rows)
+    lines = [f"  • {detector.timestamp_to_datetime(row['close_time_ms'])} | "
+             f"{detector.timeframe_to_text(row['interval'])} | {row['signal_type']} @ ${row['price']:.4f}"
+             + (f" | {getattr(EXCHANGES.get(row['venue']), 'label', row['venue'])}" if show_venue else "")
+             for row in rows]
+    more = f"\n... và {total - len(rows)} tín hiệu khác" if total > len(rows) else ""
+    await update.message.reply_text(
+        f"🗂️ <b>Lịch sử {symbol}</b> ({days} ngày, {total} tín hiệu)\n\n" + "\n".join(lines) + more,
+        parse_mode="HTML"
+    )
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handler cho lệnh /profile N (chỉ admin) - profile N lượt quét tiếp theo"""
+    if update.effective_user is None or update.effective_user.id not in ADMIN_IDS:
+        await update.message.reply_text("⛔ Lệnh này chỉ dành cho admin")
+        return
+    
+    detector = context.bot_data.get('detector')
+    try:
+        passes = int(context.args[0]) if context.args else 1
+    except ValueError:
+        await update.message.reply_text(
+            "❌ Số lượt không hợp lệ\n\n📝 Cú pháp: <code>/profile 3</code>",
+            parse_mode="HTML"
+        )
+        return
+    
+    passes = detector.profiler.arm(passes)
+    if passes == 0:
+        await update.message.reply_text("⏹️ Đã tắt profiling")
+        return
+    await update.message.reply_text(
+        f"🔬 Sẽ profile {passes} lượt quét tiếp theo\n"
+        f"📁 Kết quả: <code>{html.escape(detector.profiler.output_dir)}/</code>",
+        parse_mode="HTML"
+    )
+
 # ========== HÀM CHẠY SCANNER ==========
+def format_signal_message(signal):
+    """Nội dung tin nhắn Telegram cho 1 tín hiệu"""
+    message = (
+        f"👀 <b>PHÁT HIỆN NẾN DOJI</b>\n"
+        f"━━━━━━━━━━━━━━━\n"
+        f"🔶 <b>Token:</b> {signal['symbol']}\n"
+        f"⏰ <b>Khung thời gian:</b> {signal['timeframe']}\n"
+        f"💰 <b>Giá xác nhận:</b> ${signal['price']:.4f}"
+    )
+    if signal.get('venue'):
+        message += f"\n🏦 <b>Sàn:</b> {signal['venue']}"
+    if signal.get('sr_zone'):
+        zone_low, zone_high = signal['sr_zone']
+        message += f"\n🧱 <b>Vùng S/R:</b> ${zone_low:.4f} - ${zone_high:.4f}"
+    elif signal.get('sr_checked') is False:
+        message += "\n🧱 <b>Vùng S/R:</b> chưa kiểm tra (chưa có dữ liệu vùng)"
+    indicators = signal.get('indicators')
+    if indicators:
+        message += f"\n📐 <b>ATR:</b> ${indicators['atr']:.4f} ({indicators['atr_percent']:.2f}%)"
+        if indicators['relative_volume'] is not None:
+            message += (f"\n📊 <b>Volume:</b> {indicators['relative_volume']:.2f}× TB "
+                        f"(z {indicators['volume_z']:+.1f})")
+        message += f"\n〰️ <b>EMA:</b> ${indicators['ema']:.4f} ({indicators['ema_distance_percent']:+.2f}%)"
+    if signal.get('early_warning'):
+        message += "\n⏳ Đã cảnh báo sớm khi nến đang chạy"
+    return message
+
+async def dispatch_signals(bot, channel_id, signals, subscriptions=None):
+    """Gửi các tín hiệu lên channel + các chat đã đăng ký bộ lọc khớp"""
+    for signal in signals:
+        message = format_signal_message(signal)
+        recipients = [channel_id]
+        if subscriptions is not None:
+            recipients += sorted(subscriptions.signal_recipients(signal) - {channel_id})
+        
+        for chat_id in recipients:
+            started = time.perf_counter()
+            try:
+                await bot.send_message(
+                    chat_id=chat_id,
+                    text=message,
+                    parse_mode="HTML"
+                )
+                log_event("signal_sent", symbol=signal['symbol'], timeframe=signal['interval'],
+                          close_time=signal['close_time'], chat_id=chat_id, outcome="sent",
+                          latency_ms=round((time.perf_counter() - started) * 1000, 2))
+            except Exception as e:
+                log_event("send_error", logging.ERROR, symbol=signal['symbol'], timeframe=signal['interval'],
+                          chat_id=chat_id, outcome="error", error=str(e),
+                          latency_ms=round((time.perf_counter() - started) * 1000, 2))
+
+EARLY_WARNING_HEADERS = {
+    PRE_ALERT: "⏳ <b>DOJI ĐANG HÌNH THÀNH</b>",
+    CONFIRMED: "✅ <b>XÁC NHẬN DOJI</b>",
+    CANCELLED: "🚫 <b>HỦY CẢNH BÁO DOJI</b>"
+}
+
+def format_early_warning(kind, symbol, timeframe_text, signal_type, candle):
+    """Nội dung tin nhắn cảnh báo sớm (nến đang chạy) / xác nhận / hủy khi nến đóng"""
+    price_label = "Giá hiện tại" if kind == PRE_ALERT else "Giá đóng cửa"
+    message = (
+        f"{EARLY_WARNING_HEADERS[kind]}\n"
+        f"━━━━━━━━━━━━━━━\n"
+        f"🔶 <b>Token:</b> {symbol}\n"
+        f"⏰ <b>Khung thời gian:</b> {timeframe_text}\n"
+        f"🧭 <b>Hướng:</b> {signal_type}\n"
+        f"💰 <b>{price_label}:</b> ${candle['close']:.4f}"
+    )
+    if kind == PRE_ALERT:
+        message += "\n⚠️ Nến chưa đóng - chờ xác nhận"
+    return message
+
+def early_warning_notifier(bot, channel_id, detector, subscriptions=None):
+    """
+    notify(...) cho run_early_warning: gửi lên channel + chat đăng ký bộ lọc khớp
+    Không gửi CONFIRMED: tín hiệu của scanner cho cùng nến là tin xác nhận (đánh dấu "đã cảnh báo sớm")
+    """
+    async def notify(kind, symbol, timeframe, signal_type, candle):
+        if kind == CONFIRMED:
+            log_event("early_warning_confirmed", symbol=symbol, timeframe=timeframe, outcome="merged_into_signal")
+            return
+        message = format_early_warning(kind, symbol, detector.timeframe_to_text(timeframe), signal_type, candle)
+        recipients = [channel_id]
+        if subscriptions is not None:
+            recipients += sorted(subscriptions.recipients(symbol, timeframe, signal_type,
+                                                          detector.kline_client.exchange.name) - {channel_id})
+        for chat_id in recipients:
+            try:
+                await bot.send_message(chat_id=chat_id, text=message, parse_mode="HTML")
+                log_event("early_warning_sent", symbol=symbol, timeframe=timeframe, kind=kind, chat_id=chat_id)
+            except Exception as e:
+                log_event("send_error", logging.ERROR, symbol=symbol, timeframe=timeframe, kind=kind,
+                          chat_id=chat_id, outcome="error", error=str(e))
+    return notify
+
+def early_warning_stopped(task):
+    """Done-callback của task cảnh báo sớm: task dừng vì lỗi → log thay vì mất lặng lẽ"""
+    if task.cancelled() or task.exception() is None:
+        return
+    log_event("stream_error", logging.ERROR, exc_info=task.exception(), error=str(task.exception()),
+              outcome="stopped")
+
+async def scan_once(detector, symbols, bot, channel_id, subscriptions=None, history=None, early_warning=None):
+    """
+    1 lượt quét, mỗi tín hiệu được gửi ngay khi cặp đó quét xong; trả về thời gian chờ đến lượt sau (giây)
+    early_warning: EarlyWarningMonitor (nếu bật) - tín hiệu của nến đã báo sớm được đánh dấu
+    """
+    async def send(signal):
+        if early_warning is not None and detector is early_warning.detector:
+            signal["early_warning"] = early_warning.was_pre_alerted(signal["symbol"], signal["interval"],
+                                                                    signal["close_time_ms"])
+        if history is not None:
+            history.record(signal)
+        await dispatch_signals(bot, channel_id, [signal], subscriptions)
+    
+    started = time.perf_counter()
+    async with detector.profiler.scan_pass():
+        signals = await detector.scan_symbols(symbols, on_signal=send)
+    scan_ms = round((time.perf_counter() - started) * 1000, 2)
+    wait_time = detector.calculate_wait_time()
+    log_event("scan_done", symbols=len(symbols), signals=len(signals), latency_ms=scan_ms, wait_s=wait_time)
+    return wait_time
+
 async def run_scanner(context: ContextTypes.DEFAULT_TYPE):
     """
     Chạy scanner liên tục và tự động gửi tín hiệu lên channel
@@ -194,46 +495,32 @@ async def run_scanner(context: ContextTypes.DEFAULT_TYPE):
     symbol_manager = context.bot_data.get('symbol_manager')
     detector = context.bot_data.get('detector')
     channel_id = context.bot_data.get('channel_id')
+    subscriptions = context.bot_data.get('subscriptions')
+    history = context.bot_data.get('history')
+    early_warning = context.bot_data.get('early_warning')
+    detectors = [detector] + context.bot_data.get('venue_detectors', [])
     
     print("🤖 Scanner đã khởi động!")
     print(f"📢 Channel: {channel_id}")
     
+    last_snapshot = detector.clock.time()
     while True:
         try:
-            # Lấy danh sách symbols mới nhất
+            # Lấy danh sách symbols mới nhất, quét các sàn song song và gửi tín hiệu
             symbols = symbol_manager.get_symbols()
+            wait_times = await asyncio.gather(*(scan_once(d, symbols, bot, channel_id, subscriptions, history,
+                                                          early_warning) for d in detectors))
+            wait_time = min(wait_times)
             
-            # Quét và gửi tín hiệu
-            signals = await detector.scan_symbols(symbols)
-            
-            # Gửi tín hiệu lên channel
-            for signal in signals: 
-                message = (
-                    f"👀 <b>PHÁT HIỆN NẾN DOJI</b>\n"
-                    f"━━━━━━━━━━━━━━━\n"
-                    f"🔶 <b>Token:</b> {signal['symbol']}\n"
-                    f"⏰ <b>Khung thời gian:</b> {signal['timeframe']}\n"
-                    f"💰 <b>Giá xác nhận:</b> ${signal['price']:.4f}"
-                )
-                
-                try:
-                    await bot.send_message(
-                        chat_id=channel_id,
-                        text=message,
-                        parse_mode="HTML"
-                    )
-                    print(f"✅ Đã gửi: {signal['symbol']} - {signal['timeframe']} - {signal['close_time']}")
-                except Exception as e:
-                    print(f"❌ Lỗi gửi message: {e}")
-            
-            # Tính thời gian chờ thông minh
-            wait_time = detector.calculate_wait_time()
-            print(f"⏳ Đợi {wait_time}s đến lần quét tiếp theo...")
+            # Lưu snapshot định kỳ (chụp trạng thái trên loop, nén + ghi file trong thread)
+            if detector.clock.time() - last_snapshot >= SNAPSHOT_INTERVAL:
+                await asyncio.to_thread(write_snapshot, snapshot_venues(detectors), STATE_FILE)
+                last_snapshot = detector.clock.time()
             
             await asyncio.sleep(wait_time)
             
         except Exception as e:
-            print(f"❌ Lỗi scanner: {e}")
+            log_event("scanner_error", logging.ERROR, exc_info=e, error=str(e))
             await asyncio.sleep(10)
 
 # ========== MAIN ==========
@@ -248,13 +535,59 @@ async def main():
         print("💡 Cần setup environment variables trước khi chạy")
         return
     
+    unknown = [name for name in SCAN_EXCHANGES if name not in EXCHANGES]
+    if not SCAN_EXCHANGES or unknown:
+        print(f"❌ SCAN_EXCHANGES không hợp lệ: {', '.join(unknown) or '(trống)'} (có: {', '.join(EXCHANGES)})")
+        return
+    
+    invalid = [":".join(item) for item in SR_ENGINE_BY_TIMEFRAME
+               if len(item) != 2 or item[0] not in INTERVAL_MS or item[1] not in SR_ENGINES]
+    if invalid:
+        print(f"❌ SR_ENGINE_BY_TIMEFRAME không hợp lệ: {', '.join(invalid)} "
+              f"(dạng khung:engine, engine có: {', '.join(SR_ENGINES)})")
+        return
+    
+    relative_volume_max = None
+    if RELATIVE_VOLUME_MAX:
+        try:
+            relative_volume_max = float(RELATIVE_VOLUME_MAX)
+        except ValueError:
+            pass
+        if relative_volume_max is None or relative_volume_max <= 0:
+            print(f"❌ RELATIVE_VOLUME_MAX không hợp lệ: {RELATIVE_VOLUME_MAX} (cần số > 0, vd. 0.8)")
+            return
+    
+    # Log JSON qua queue + thread nền (LOG_FILE, LOG_LEVEL, LOG_SAMPLE)
+    setup_logging()
+    
     print("\n" + "="*60)
     print("🚀 ĐANG KHỞI ĐỘNG BOT DOJI DETECTOR")
     print("="*60)
     
     # Khởi tạo components
     symbol_manager = SymbolManager()
-    detector = DojiDetector()
+    subscriptions = SubscriptionManager()
+    history = SignalHistory()
+    detector = DojiDetector(kline_client=get_client(SCAN_EXCHANGES[0]))
+    venue_detectors = [DojiDetector(kline_client=get_client(name)) for name in SCAN_EXCHANGES[1:]]
+    if venue_detectors:
+        for d in [detector] + venue_detectors:
+            d.venue = d.kline_client.exchange.label
+        print(f"🏦 Quét {len(SCAN_EXCHANGES)} sàn: {', '.join(SCAN_EXCHANGES)}")
+    if SR_ENGINE_BY_TIMEFRAME:
+        for d in [detector] + venue_detectors:
+            d.sr_engine_by_timeframe = dict(SR_ENGINE_BY_TIMEFRAME)
+        print(f"🧱 SR engine theo khung: {', '.join(':'.join(item) for item in SR_ENGINE_BY_TIMEFRAME)} "
+              f"(còn lại: {detector.sr_engine})")
+    if relative_volume_max is not None:
+        for d in [detector] + venue_detectors:
+            d.relative_volume_max = relative_volume_max
+        print(f"📊 Lọc volume tương đối: bật (volume Doji ≤ {relative_volume_max:g}× trung bình)")
+        log_event("filter_enabled", filter="relative_volume_max", value=relative_volume_max)
+    load_snapshot([detector] + venue_detectors, STATE_FILE)
+    if PROFILE_SCANS:
+        detector.profiler.arm(PROFILE_SCANS)
+        print(f"🔬 Profiling {PROFILE_SCANS} lượt quét đầu → {detector.profiler.output_dir}/")
     
     print(f"\n📊 Symbols ban đầu: {', '.join(symbol_manager.get_symbols())}")
     print(f"📢 Channel ID: {TELEGRAM_CHANNEL_ID}")
@@ -265,7 +598,10 @@ async def main():
     # Lưu vào bot_data
     application.bot_data['symbol_manager'] = symbol_manager
     application.bot_data['detector'] = detector
+    application.bot_data['venue_detectors'] = venue_detectors
     application.bot_data['channel_id'] = TELEGRAM_CHANNEL_ID
+    application.bot_data['subscriptions'] = subscriptions
+    application.bot_data['history'] = history
     
     # Thêm command handlers
     application.add_handler(CommandHandler("start", start_command))
@@ -273,17 +609,58 @@ async def main():
     application.add_handler(CommandHandler("list", list_command))
     application.add_handler(CommandHandler("add", add_command))
     application.add_handler(CommandHandler("remove", remove_command))
+    application.add_handler(CommandHandler("subscribe", subscribe_command))
+    application.add_handler(CommandHandler("unsubscribe", unsubscribe_command))
+    application.add_handler(CommandHandler("subscriptions", subscriptions_command))
+    application.add_handler(CommandHandler("history", history_command))
+    application.add_handler(CommandHandler("profile", profile_command))
     
     # Khởi động bot
     await application.initialize()
     await application.start()
     await application.updater.start_polling()
     
+    # Theo dõi độ trễ event loop (polling Telegram + scanner chạy chung 1 loop)
+    application.bot_data['loop_monitor'] = LoopLagMonitor().start().register_metrics()
+    for d in [detector] + venue_detectors:
+        labels = {"venue": d.kline_client.exchange.name}
+        for name in ["requests", "cache_hits", "coalesced", "rate_limited", "throttled"]:
+            register(f"bot_kline_{name}", lambda d=d, name=name: d.kline_client.stats[name], f"Kline client {name}",
+                     labels, COUNTER)
+        register("bot_kline_used_weight", lambda d=d: d.kline_client.stats["used_weight"],
+                 "Request weight used in the current minute (exchange header)", labels)
+        d.scheduler.register_metrics(labels=labels)
+        register("bot_signal_cache_size", lambda d=d: len(d.signal_cache), "Cached signal keys", labels)
+    register("bot_subscribed_chats", lambda: len(subscriptions.subscriptions), "Chats with subscriptions")
+    register("bot_history_written", lambda: history.written, "Signals written to history", metric_type=COUNTER)
+    register("bot_log_sampled_out", lambda: log_sampler.dropped, "Log events dropped by sampling", metric_type=COUNTER)
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+        print(f"📈 Metrics: http://0.0.0.0:{METRICS_PORT}/metrics")
+    
+    # Cảnh báo sớm trên kline stream (tùy chọn, cần gói websockets)
+    early_warning_task = None
+    if EARLY_WARNING and not STREAM_AVAILABLE:
+        print("⚠️ Cảnh báo sớm: tắt - cần gói websockets (pip install websockets)")
+    elif EARLY_WARNING:
+        monitor = EarlyWarningMonitor(detector).register_metrics()
+        application.bot_data['early_warning'] = monitor
+        notify = early_warning_notifier(application.bot, TELEGRAM_CHANNEL_ID, detector, subscriptions)
+        early_warning_task = asyncio.create_task(run_early_warning(monitor, symbol_manager.get_symbols, notify))
+        early_warning_task.add_done_callback(early_warning_stopped)
+        print(f"⏳ Cảnh báo sớm: bật (giữ ≥ {monitor.hold:.0%} độ dài nến)")
+    
     print("\n✅ Bot đã sẵn sàng!")
     print("🔄 Scanner sẽ bắt đầu quét...\n")
     
-    # Chạy scanner
-    await run_scanner(application)
+    # Chạy scanner (lưu snapshot lần cuối khi dừng)
+    try:
+        await run_scanner(application)
+    finally:
+        if early_warning_task is not None:
+            early_warning_task.cancel()
+        save_snapshot([detector] + venue_detectors, STATE_FILE)
+        history.close()
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,70 @@
+"""
+Clock - Nguồn thời gian cho detector/kline client
+- RealClock: thời gian thật (mặc định của bot live)
+- SimulatedClock: thời gian mô phỏng chạy nhanh gấp `speed` lần, dùng cho load test
+- VirtualClock: thời gian chỉ tiến khi sleep → kết quả xác định (replay, benchmark)
+"""
+import time
+import asyncio
+import threading
+
+
+class RealClock:
+
+    def time(self) -> float:
+        """Unix timestamp (giây)"""
+        return time.time()
+
+    async def sleep(self, seconds: float):
+        await asyncio.sleep(seconds)
+
+    def sleep_blocking(self, seconds: float):
+        """Sleep chặn thread (dùng trong worker thread, vd. chờ Retry-After)"""
+        time.sleep(seconds)
+
+
+class SimulatedClock:
+    """
+    Đồng hồ tăng tốc: 1 giây thật = `speed` giây mô phỏng
+    Bắt đầu từ start_time (giây) tại thời điểm tạo đối tượng
+    """
+
+    def __init__(self, start_time: float, speed: float = 100.0):
+        self.start_time = start_time
+        self.speed = speed
+        self._started = time.monotonic()
+
+    def time(self) -> float:
+        return self.start_time + (time.monotonic() - self._started) * self.speed
+
+    async def sleep(self, seconds: float):
+        await asyncio.sleep(seconds / self.speed)
+
+    def sleep_blocking(self, seconds: float):
+        time.sleep(seconds / self.speed)
+
+
+class VirtualClock:
+    """
+    Đồng hồ ảo: đứng yên khi code chạy, chỉ tiến đúng bằng thời gian sleep / sleep_blocking
+    → thời gian CPU / HTTP thật không lọt vào thời gian mô phỏng, chạy lại cho cùng kết quả trên mọi máy
+    Dùng cho 1 luồng công việc tuần tự (vòng quét): các sleep đồng thời sẽ cộng dồn
+    """
+
+    def __init__(self, start_time: float):
+        self._now = start_time
+        self._lock = threading.Lock()
+
+    def time(self) -> float:
+        return self._now
+
+    def advance(self, seconds: float):
+        with self._lock:
+            self._now += max(seconds, 0.0)
+
+    async def sleep(self, seconds: float):
+        self.advance(seconds)
+        await asyncio.sleep(0)
+
+    def sleep_blocking(self, seconds: float):
+        self.advance(seconds)
@@ -1,18 +1,53 @@
-import requests
-import asyncio
 import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
-from sr_calculator import SupportResistanceCalculator
+from kline_client import get_default_client, rows_to_candles, last_closed_close_time, INTERVAL_MS
+from clock import RealClock
+from zone_index import SRZoneIndex
+from profiling import ScanProfiler
+from scan_scheduler import DeadlineScheduler
+from indicators import RollingIndicators, INDICATOR_WARMUP
+from structured_log import log_event
+
+SR_REFRESH_WORKERS = 2    # Thread tính lại S/R (executor riêng, không chiếm executor mặc định của fetch_klines)
+SR_REFRESH_EVERY = 4      # Zones của 1 cặp chỉ tính lại sau N nến đóng (vùng S/R ~290 nến đổi rất chậm)
+SIGNAL_CACHE_SIZE = 1000  # Số nến đã xử lý (có / bị lọc tín hiệu) giữ lại để chống gửi trùng
 
 class DojiDetector:
-    def __init__(self, doji_threshold=10, volume_ratio=0.9):
+    # Thời gian tối đa sau khi nến đóng mà tín hiệu vẫn được gửi
+    MAX_DELAY_MS = {
+        "1h": 5 * 60 * 1000,
+        "2h": 10 * 60 * 1000,
+        "4h": 15 * 60 * 1000,
+        "1d": 30 * 60 * 1000
+    }
+    
+    def __init__(self, doji_threshold=10, volume_ratio=0.9, kline_client=None, clock=None):
         self.doji_threshold = doji_threshold
         self.volume_ratio = volume_ratio
         self.signal_cache = {}
         self.timeframes = ["1h", "2h", "4h", "1d"]
-        self.sr_calculator = SupportResistanceCalculator()
-        self.sr_cache = {}
-        self.sr_cache_time = {}
+        self.clock = clock or RealClock()
+        self.kline_client = kline_client or get_default_client()
+        self.venue = None  # Tên sàn ghi trong tín hiệu khi quét nhiều sàn, vd. "Binance Futures"
+        self.sr_engine = "vectorized"  # Tên engine trong sr_engines.SR_ENGINES
+        self.sr_engine_by_timeframe = {}  # Engine riêng cho từng khung, vd. {"1h": "volume_profile"}
+        self._sr_calculator = None     # Tạo khi cần S/R lần đầu (xem sr_calculator)
+        self._sr_engines = {}          # Tên engine → instance (engine theo khung)
+        self.sr_cache = {}       # (symbol, timeframe) -> SRZoneIndex
+        self.sr_cache_time = {}  # (symbol, timeframe) -> close_time lúc tính zones
+        self.sr_refresh_queue = {}  # (symbol, timeframe) -> close_time: zones cần tính lại sau lượt quét
+        self._sr_refresh_task = None  # Task nền xử lý sr_refresh_queue (tối đa 1)
+        self._sr_executor = None      # ThreadPoolExecutor riêng cho S/R, tạo khi cần
+        self._scanning = False
+        self.sr_confluence_filter = False  # True: chỉ gửi tín hiệu chạm vùng S/R
+        self.indicators = RollingIndicators()  # ATR / volume TB / EMA theo từng cặp, cập nhật mỗi nến đóng
+        self.relative_volume_max = None  # vd. 0.8: volume Doji ≤ 80% trung bình 20 nến trước (None = tắt)
+        self.last_close_times = {}  # (symbol, timeframe) -> close_time của nến đóng đã xử lý xong
+        self.profiler = ScanProfiler()  # Tắt mặc định - bật bằng profiler.arm(n)
+        self.scheduler = DeadlineScheduler(self.MAX_DELAY_MS)  # Thứ tự quét theo hạn chót
         
         # Tham số cho True Doji
         self.min_body_position = 35  # Thân nến tối thiểu 35% từ Low
@@ -23,36 +58,54 @@ class DojiDetector:
         self.prev_shadow_threshold = 65  # Bóng trên ≥ 65%
         self.prev_body_threshold = 65    # Body ≥ 70% (MỚI!)
     
+    @property
+    def sr_calculator(self):
+        """
+        SR engine, chỉ tạo (và import) khi cần tính S/R lần đầu
+        Mặc định "vectorized" (NumPy, cùng kết quả với SupportResistanceCalculator - xem test_sr.py)
+        → đường quét live không import pandas/scipy
+        """
+        if self._sr_calculator is None:
+            from sr_engines import create_sr_engine
+            self._sr_calculator = create_sr_engine(self.sr_engine, kline_client=self.kline_client)
+        return self._sr_calculator
+    
+    @sr_calculator.setter
+    def sr_calculator(self, calculator):
+        self._sr_calculator = calculator
+    
+    def sr_calculator_for(self, timeframe):
+        """SR engine của khung (sr_engine_by_timeframe), không cấu hình riêng thì dùng sr_calculator"""
+        name = self.sr_engine_by_timeframe.get(timeframe)
+        if name is None or name == self.sr_engine:
+            return self.sr_calculator
+        if name not in self._sr_engines:
+            from sr_engines import create_sr_engine
+            self._sr_engines[name] = create_sr_engine(name, kline_client=self.kline_client)
+        return self._sr_engines[name]
+    
     def get_klines(self, symbol, interval, limit=3):
-        """Lấy dữ liệu nến từ Binance API"""
-        url = "https://api.binance.com/api/v3/klines"
-        params = {
-            "symbol": symbol,
-            "interval": interval,
-            "limit": limit
-        }
-        
+        """Lấy dữ liệu nến từ Binance API (qua kline client dùng chung)"""
         try:
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            candles = []
-            for candle in data:
-                candles.append({
-                    "open_time": candle[0],
-                    "open": float(candle[1]),
-                    "high": float(candle[2]),
-                    "low": float(candle[3]),
-                    "close": float(candle[4]),
-                    "volume": float(candle[5]),
-                    "close_time": candle[6]
-                })
-            return candles
+            data = self.kline_client.get_klines(symbol, interval, limit)
+            return rows_to_candles(data)
         except Exception as e:
-            print(f"❌ Lỗi khi lấy dữ liệu {symbol}: {e}")
+            log_event("kline_error", logging.WARNING, symbol=symbol, timeframe=interval, error=str(e))
             return None
     
+    async def fetch_klines(self, symbol, interval, limit=3):
+        """Bản async của get_klines - không chặn event loop, gộp request trùng"""
+        started = time.perf_counter()
+        try:
+            data = await self.kline_client.fetch_klines(symbol, interval, limit)
+        except Exception as e:
+            log_event("kline_error", logging.WARNING, symbol=symbol, timeframe=interval, error=str(e),
+                      latency_ms=round((time.perf_counter() - started) * 1000, 2))
+            return None
+        log_event("kline_fetched", logging.DEBUG, symbol=symbol, timeframe=interval,
+                  latency_ms=round((time.perf_counter() - started) * 1000, 2))
+        return rows_to_candles(data)
+    
     def is_true_doji(self, candle):
         """
         Kiểm tra nến có THỰC SỰ là Doji không (tránh nhầm với Pinbar/Hammer)
@@ -213,90 +266,217 @@ class DojiDetector:
         }
         return mapping.get(timeframe, timeframe)
     
+    async def refresh_zone_index(self, symbol, timeframe, close_time):
+        """Tính lại zone index S/R của (symbol, timeframe) trên executor riêng của S/R"""
+        if self._sr_executor is None:
+            self._sr_executor = ThreadPoolExecutor(max_workers=SR_REFRESH_WORKERS, thread_name_prefix="sr-refresh")
+        key = (symbol, timeframe)
+        try:
+            sr_levels = await asyncio.get_running_loop().run_in_executor(
+                self._sr_executor, self.profiler.run, f"sr_{symbol}_{timeframe}",
+                self.sr_calculator_for(timeframe).calculate_sr_levels, symbol, timeframe)
+            self.sr_cache[key] = SRZoneIndex(sr_levels)
+            self.sr_cache_time[key] = close_time
+        except Exception as e:
+            log_event("sr_error", logging.WARNING, symbol=symbol, timeframe=timeframe, error=str(e))
+    
+    def queue_zone_refresh(self, symbol, timeframe, close_time):
+        """Nến đóng: đưa cặp vào hàng đợi tính lại nếu zones chưa có hoặc cũ hơn SR_REFRESH_EVERY nến"""
+        computed = self.sr_cache_time.get((symbol, timeframe))
+        if computed is None or close_time - computed >= SR_REFRESH_EVERY * INTERVAL_MS.get(timeframe, 0):
+            self.sr_refresh_queue[(symbol, timeframe)] = close_time
+    
+    def start_zone_refreshes(self):
+        """Sau lượt quét: xử lý hàng đợi trong 1 task nền (nếu chưa chạy)"""
+        if self.sr_refresh_queue and self._sr_refresh_task is None:
+            self._sr_refresh_task = asyncio.create_task(self._drain_zone_refreshes())
+    
+    async def _drain_zone_refreshes(self):
+        """
+        Tính lại zones, mỗi lần SR_REFRESH_WORKERS cặp
+        Dừng khi lượt quét mới bắt đầu → request của lượt quét không phải xếp sau request S/R
+        (phần còn lại chạy tiếp sau lượt quét đó)
+        """
+        try:
+            while self.sr_refresh_queue and not self._scanning:
+                batch = [self.sr_refresh_queue.popitem() for _ in range(min(SR_REFRESH_WORKERS,
+                                                                                len(self.sr_refresh_queue)))]
+                await asyncio.gather(*(self.refresh_zone_index(symbol, timeframe, close_time)
+                                       for (symbol, timeframe), close_time in batch))
+        finally:
+            self._sr_refresh_task = None
+    
+    def find_sr_confluence(self, symbol, timeframe, candle):
+        """
+        Vùng S/R mà nến Doji chạm vào - chỉ tra zone index đã có (tính ở lần nến đóng trước), không I/O
+        Trả về (zones đã sẵn sàng?, vùng hoặc None)
+        """
+        zone_index = self.sr_cache.get((symbol, timeframe))
+        if zone_index is None:
+            return False, None
+        return True, zone_index.confluence(candle["low"], candle["high"])
+    
     def get_cache_key(self, symbol, timeframe, close_time):
         """Tạo key cho cache"""
         return f"{symbol}_{timeframe}_{close_time}"
     
-    async def scan_symbols(self, symbols):
-        """Quét tất cả symbols và trả về danh sách tín hiệu"""
-        signals = []
-        current_time = int(time.time() * 1000)
-        
-        for symbol in symbols:
-            for timeframe in self.timeframes:
-                candles = self.get_klines(symbol, timeframe, limit=3)
-                
-                if not candles or len(candles) < 3:
-                    continue
+    def remember_signal(self, cache_key, sent):
+        """Ghi nhận nến đã xử lý (sent: đã gửi tín hiệu / bị lọc) - mọi nhánh đều qua đây để giới hạn cache"""
+        self.signal_cache.pop(cache_key, None)
+        self.signal_cache[cache_key] = sent
+        while len(self.signal_cache) > SIGNAL_CACHE_SIZE:
+            del self.signal_cache[next(iter(self.signal_cache))]
+    
+    async def scan_pair(self, symbol, timeframe, current_time):
+        """Kiểm tra nến vừa đóng của 1 cặp, trả về tín hiệu (hoặc None)"""
+        # Lần đầu gặp cặp này (hoặc chỉ báo bị hụt nến): lấy thêm nến để làm nóng (cùng weight API với limit=3)
+        boundary = last_closed_close_time(timeframe, current_time)
+        since = boundary - 2 * INTERVAL_MS[timeframe] if boundary is not None else None
+        limit = 3
+        if not self.indicators.is_warm(symbol, timeframe, since):
+            self.indicators.reset(symbol, timeframe)
+            limit = INDICATOR_WARMUP
+        candles = await self.fetch_klines(symbol, timeframe, limit=limit)
+        
+        # Phần xử lý đồng bộ (không await) - profile riêng khi đang profile lượt quét
+        with self.profiler.section():
+            if not candles or len(candles) < 3:
+                return None
+            
+            # Lấy nến vừa đóng (index -2)
+            completed_candle = candles[-2]
+            previous_candle = candles[-3]
+            
+            # TẠO CACHE KEY TRƯỚC
+            cache_key = self.get_cache_key(symbol, timeframe, completed_candle["close_time"])
+            
+            # KIỂM TRA CACHE NGAY - BỎ QUA NẾU ĐÃ GỬI
+            if cache_key in self.signal_cache:
+                return None
+            
+            # Kiểm tra nến có vừa đóng không
+            time_since_close = current_time - completed_candle["close_time"]
+            
+            # QUAN TRỌNG: Chỉ xét nến đã đóng hoàn toàn (> 10 giây)
+            if time_since_close < 10000:  # < 10 giây
+                return None  # Chưa đóng hoàn toàn, chờ lần quét sau
+            
+            # Từ đây kết quả của nến này không đổi nữa → đánh dấu đã xử lý
+            self.last_close_times[(symbol, timeframe)] = completed_candle["close_time"]
+            self.indicators.update_many(symbol, timeframe, candles[:-1])
+            self.queue_zone_refresh(symbol, timeframe, completed_candle["close_time"])
+            
+            # NẾU QUÁ THỜI GIAN CHO PHÉP - BỎ QUA
+            if time_since_close > self.MAX_DELAY_MS.get(timeframe, 10 * 60 * 1000):
+                log_event("pair_scanned", symbol=symbol, timeframe=timeframe, outcome="too_late",
+                          delay_ms=time_since_close)
+                return None
+            
+            # Kiểm tra điều kiện Doji
+            is_signal, details = self.is_doji_with_low_volume(
+                completed_candle,
+                previous_candle,
+                symbol,
+                timeframe
+            )
+            
+            # NẾU CÓ TÍN HIỆU
+            signal = None
+            if is_signal and details:
+                indicators = self.indicators.snapshot(symbol, timeframe)
                 
-                # Lấy nến vừa đóng (index -2)
-                completed_candle = candles[-2]
-                previous_candle = candles[-3]
+                # Lọc volume tương đối (nếu bật) - so với trung bình nhiều nến thay vì chỉ nến trước
+                if self.relative_volume_max is not None and indicators and indicators["relative_volume"] is not None \
+                        and indicators["relative_volume"] > self.relative_volume_max:
+                    self.remember_signal(cache_key, False)
+                    log_event("pair_scanned", symbol=symbol, timeframe=timeframe, outcome="high_relative_volume",
+                              relative_volume=round(indicators["relative_volume"], 3))
+                    return None
                 
-                # TẠO CACHE KEY TRƯỚC
-                cache_key = self.get_cache_key(symbol, timeframe, completed_candle["close_time"])
+                sr_ready, sr_zone = self.find_sr_confluence(symbol, timeframe, completed_candle)
                 
-                # KIỂM TRA CACHE NGAY - BỎ QUA NẾU ĐÃ GỬI
-                if cache_key in self.signal_cache:
-                    continue
+                # Lọc theo vùng S/R (nếu bật) - vẫn cache để không tính lại
+                # Zones chưa có (khởi động lạnh / lỗi S/R) → vẫn gửi, tin nhắn ghi rõ chưa kiểm tra S/R
+                if self.sr_confluence_filter and sr_ready and sr_zone is None:
+                    self.remember_signal(cache_key, False)
+                    log_event("pair_scanned", symbol=symbol, timeframe=timeframe, outcome="no_sr_zone")
+                    return None
                 
-                # Kiểm tra nến có vừa đóng không
-                time_since_close = current_time - completed_candle["close_time"]
-                
-                max_delay = {
-                    "1h": 5 * 60 * 1000,
-                    "2h": 10 * 60 * 1000,
-                    "4h": 15 * 60 * 1000,
-                    "1d": 30 * 60 * 1000
+                signal = {
+                    "symbol": symbol,
+                    "interval": timeframe,
+                    "timeframe": self.timeframe_to_text(timeframe),
+                    "close_time": self.timestamp_to_datetime(details["close_time"]),
+                    "close_time_ms": details["close_time"],
+                    "price": details["close"],
+                    "signal_type": details["signal_type"],
+                    "sr_zone": sr_zone,
+                    "sr_checked": sr_ready,
+                    "indicators": indicators,
+                    "venue": self.venue,
+                    "exchange": self.kline_client.exchange.name
                 }
                 
-                # NẾU QUÁ THỜI GIAN CHO PHÉP - BỎ QUA
-                if time_since_close > max_delay.get(timeframe, 10 * 60 * 1000):
-                    continue
-                
-                # QUAN TRỌNG: Chỉ xét nến đã đóng hoàn toàn (> 10 giây)
-                if time_since_close < 10000:  # < 10 giây
-                    continue  # Chưa đóng hoàn toàn, chờ lần quét sau
+                # LƯU CACHE NGAY SAU KHI TẠO TÍN HIỆU
+                self.remember_signal(cache_key, True)
+                log_event("signal", symbol=symbol, timeframe=timeframe, outcome=details["signal_type"],
+                          price=details["close"], prev_body_percent=round(details["prev_body_percent"], 2),
+                          sr_zone=sr_zone, sr_ready=sr_ready)
+            else:
+                log_event("pair_scanned", symbol=symbol, timeframe=timeframe, outcome="no_signal",
+                          delay_ms=time_since_close)
+        
+        await self.clock.sleep(0.3)
+        return signal
+    
+    async def scan_symbols(self, symbols, on_signal=None):
+        """
+        Quét tất cả symbols và trả về danh sách tín hiệu
+        Thứ tự theo hạn chót gửi tín hiệu (xem scan_scheduler): cặp sắp hết MAX_DELAY_MS được quét trước
+        on_signal: coroutine gửi tín hiệu - gọi NGAY khi cặp có tín hiệu (không chờ hết lượt quét),
+        trễ hạn của task tính tại lúc gửi xong
+        """
+        signals = []
+        current_time = int(self.clock.time() * 1000)
+        
+        # Nến vừa đóng của cặp nào đã xử lý → không cần gọi API đến nến sau
+        boundaries = {timeframe: last_closed_close_time(timeframe, current_time) for timeframe in self.timeframes}
+        with self.profiler.section():
+            tasks = self.scheduler.plan(symbols, self.timeframes, boundaries, self.last_close_times)
+        
+        self._scanning = True
+        try:
+            while tasks:
+                task = self.scheduler.pop(tasks)
+                now = int(self.clock.time() * 1000)
                 
-                # Kiểm tra điều kiện Doji
-                is_signal, details = self.is_doji_with_low_volume(
-                    completed_candle,
-                    previous_candle,
-                    symbol,
-                    timeframe
-                )
+                # Không thể xong trước hạn chót → bỏ nến này, dành thời gian cho cặp còn kịp
+                if not self.scheduler.admit(task, now):
+                    if task.boundary is not None:
+                        self.last_close_times[(task.symbol, task.timeframe)] = task.boundary
+                    log_event("pair_scanned", symbol=task.symbol, timeframe=task.timeframe, outcome="shed",
+                              deadline_ms=task.deadline - now)
+                    continue
                 
-                # NẾU CÓ TÍN HIỆU
-                if is_signal and details:
-                    signal = {
-                        "symbol": symbol,
-                        "timeframe": self.timeframe_to_text(timeframe),
-                        "close_time": self.timestamp_to_datetime(details["close_time"]),
-                        "price": details["close"],
-                        "signal_type": details["signal_type"]
-                    }
-                    
+                signal = await self.scan_pair(task.symbol, task.timeframe, now)
+                if signal is not None:
                     signals.append(signal)
-                    
-                    # LƯU CACHE NGAY SAU KHI TẠO TÍN HIỆU
-                    self.signal_cache[cache_key] = True
-                    print(f"✅ Signal: {symbol} {timeframe} {details['signal_type']} @ ${details['close']:.4f} "
-                          f"(Prev body: {details['prev_body_percent']:.1f}%)")
-                    
-                    # Giới hạn cache
-                    if len(self.signal_cache) > 1000:
-                        oldest_key = list(self.signal_cache.keys())[0]
-                        del self.signal_cache[oldest_key]
-                
-                await asyncio.sleep(0.3)
-        
+                    if on_signal is not None:
+                        await on_signal(signal)
+                if self.last_close_times.get((task.symbol, task.timeframe)) == task.boundary:
+                    self.scheduler.complete(task, now, int(self.clock.time() * 1000))
+                else:
+                    self.scheduler.defer(task)  # Nến chưa đóng hẳn / lỗi API → lượt quét sau
+        finally:
+            self._scanning = False
+        
+        # Zones S/R tính lại sau khi lượt quét xong (không tranh request / thread với lượt quét)
+        self.start_zone_refreshes()
         return signals
     
     def calculate_wait_time(self):
         """Tính thời gian chờ thông minh"""
-        from datetime import datetime
-        
-        now = datetime.utcnow()
+        now = datetime.fromtimestamp(self.clock.time(), tz=timezone.utc)
         wait_times = []
         
         for timeframe in self.timeframes:
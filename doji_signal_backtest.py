@@ -7,9 +7,18 @@ Test ĐẦY ĐỦ các điều kiện:
    - LONG: Nến đỏ với High - Close > 65% × Range
    - SHORT: Nến xanh với High - Open > 65% × Range
 """
-import requests
+import os
+import re
+import csv
+import json
+import shutil
+import tempfile
+from collections import Counter
+from functools import partial
 from datetime import datetime, timezone, timedelta
 from tabulate import tabulate
+from kline_client import get_default_client, rows_to_candles
+from parallel_backtest import run_pairs
 
 # ========== CẤU HÌNH ==========
 SYMBOLS = ["BTCUSDT"]
@@ -21,34 +30,16 @@ MAX_BODY_POSITION = 65  # Thân nến tối đa 65% từ Low
 MIN_SHADOW_PERCENT = 5   # Mỗi bóng tối thiểu 5%
 PREV_SHADOW_THRESHOLD = 65  # Bóng trên nến trước > 65%
 BACKTEST_CANDLES = 100
+OUTPUT_DIR = "backtest_output"   # Tín hiệu/nến thất bại được ghi dần ra đây
+OUTPUT_FORMAT = "csv"            # "csv" hoặc "jsonl"
+OUTPUT_CHUNK_SIZE = 10000        # Số record mỗi lần ghi ra file
+MAX_TABLE_ROWS = 50              # Số tín hiệu tối đa in ra bảng
 
 # ========== HÀM LẤY DỮ LIỆU ==========
 def get_historical_klines(symbol, interval, limit=100):
-    """Lấy dữ liệu từ Binance API"""
-    url = "https://api.binance.com/api/v3/klines"
-    params = {
-        "symbol": symbol,
-        "interval": interval,
-        "limit": limit
-    }
-    
+    """Lấy dữ liệu nến qua adapter của sàn (EXCHANGE, mặc định Binance spot)"""
     try:
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        
-        candles = []
-        for candle in data:
-            candles.append({
-                "open_time": candle[0],
-                "open": float(candle[1]),
-                "high": float(candle[2]),
-                "low": float(candle[3]),
-                "close": float(candle[4]),
-                "volume": float(candle[5]),
-                "close_time": candle[6]
-            })
-        return candles
+        return rows_to_candles(get_default_client().get_klines(symbol, interval, limit))
     except Exception as e:
         print(f"❌ Lỗi khi lấy dữ liệu {symbol}: {e}")
         return None
@@ -286,30 +277,117 @@ def timeframe_to_text(timeframe):
     mapping = {"1h": "H1", "2h": "H2", "4h": "H4", "1d": "D1"}
     return mapping.get(timeframe, timeframe)
 
+# ========== GHI KẾT QUẢ (STREAMING) ==========
+SIGNAL_FIELDS = ["symbol", "timeframe", "time", "price", "signal_type", "doji_body", "doji_position",
+                 "prev_color", "prev_shadow", "volume_change", "prev_open", "prev_close", "prev_high", "prev_low"]
+FAILURE_FIELDS = ["symbol", "timeframe", "time", "price", "reason"]
+
+
+def reason_category(reason):
+    """Nhóm lý do thất bại: bỏ giá trị đo được (vd. 'Body 23.4% > 10%' → 'Body X% > 10%')"""
+    return re.sub(r"\d+\.\d+%", "X%", reason)
+
+
+class ChunkedWriter:
+    """Ghi record ra file theo từng chunk - định dạng theo đuôi file (.csv hoặc .jsonl)"""
+
+    def __init__(self, path, fields, chunk_size=OUTPUT_CHUNK_SIZE, header=True):
+        self.path = path
+        self.fields = fields
+        self.chunk_size = chunk_size
+        self.count = 0
+        self._buffer = []
+        self._jsonl = path.endswith(".jsonl")
+        self._file = open(path, "w", newline="")
+        if not self._jsonl:
+            self._csv = csv.DictWriter(self._file, fieldnames=fields)
+            if header:
+                self._csv.writeheader()
+
+    def write(self, record):
+        self._buffer.append(record)
+        self.count += 1
+        if len(self._buffer) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self._jsonl:
+            self._file.writelines(json.dumps(record, ensure_ascii=False) + "\n" for record in self._buffer)
+        else:
+            self._csv.writerows(self._buffer)
+        self._file.flush()
+        self._buffer.clear()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class BacktestStats:
+    """Thống kê cộng dồn - bộ nhớ không phụ thuộc độ dài lịch sử (chỉ giữ vài ví dụ đầu)"""
+
+    def __init__(self, max_valid_examples=MAX_TABLE_ROWS, max_failed_examples=5):
+        self.max_valid_examples = max_valid_examples
+        self.max_failed_examples = max_failed_examples
+        self.candles = 0
+        self.valid = 0
+        self.failed = 0
+        self.by_timeframe = Counter()
+        self.by_signal_type = Counter()
+        self.failure_reasons = Counter()
+        self.valid_examples = []
+        self.failed_examples = []
+
+    def add_valid(self, signal):
+        self.candles += 1
+        self.valid += 1
+        self.by_timeframe[signal["timeframe"]] += 1
+        self.by_signal_type[signal["signal_type"]] += 1
+        if len(self.valid_examples) < self.max_valid_examples:
+            self.valid_examples.append(signal)
+
+    def add_failed(self, failed):
+        self.candles += 1
+        self.failed += 1
+        self.failure_reasons[reason_category(failed["reason"])] += 1
+        if len(self.failed_examples) < self.max_failed_examples:
+            self.failed_examples.append(failed)
+
+    def merge(self, other):
+        """Gộp thống kê của 1 lượt khác (vd. 1 cặp symbol × timeframe)"""
+        self.candles += other.candles
+        self.valid += other.valid
+        self.failed += other.failed
+        self.by_timeframe.update(other.by_timeframe)
+        self.by_signal_type.update(other.by_signal_type)
+        self.failure_reasons.update(other.failure_reasons)
+        self.valid_examples.extend(other.valid_examples[:self.max_valid_examples - len(self.valid_examples)])
+        self.failed_examples.extend(other.failed_examples[:self.max_failed_examples - len(self.failed_examples)])
+        return self
+
+
 # ========== BACKTEST ==========
-def backtest_symbol(symbol, timeframe, num_candles=100, show_failures=False):
+def iter_candle_signals(symbol, timeframe, candles):
     """
-    Backtest một symbol với một timeframe
+    Duyệt từng nến của một symbol với một timeframe
     
-    Args:
-        show_failures: Nếu True, hiển thị cả những nến KHÔNG đạt điều kiện
+    Yields:
+        (True, signal) cho tín hiệu hợp lệ, (False, failed) cho nến không đạt
     """
-    candles = get_historical_klines(symbol, timeframe, limit=num_candles + 1)
-    
-    if not candles or len(candles) < 2:
-        return [], []
-    
-    valid_signals = []
-    failed_signals = []
-    
-    for i in range(1, len(candles)):
+    for i in range(1, len(candles or [])):
         previous = candles[i-1]
         current = candles[i]
         
         is_valid, result = check_doji_signal(current, previous, timeframe)
         
         if is_valid:
-            signal = {
+            yield True, {
                 "symbol": symbol,
                 "timeframe": timeframe_to_text(timeframe),
                 "time": timestamp_to_datetime(current["close_time"]),
@@ -326,26 +404,86 @@ def backtest_symbol(symbol, timeframe, num_candles=100, show_failures=False):
                 "prev_high": result["prev_high"],
                 "prev_low": result["prev_low"]
             }
-            valid_signals.append(signal)
-        elif show_failures:
-            # Lưu lại tín hiệu thất bại để debug
-            failed_signals.append({
+        else:
+            yield False, {
                 "symbol": symbol,
                 "timeframe": timeframe_to_text(timeframe),
                 "time": timestamp_to_datetime(current["close_time"]),
                 "price": current["close"],
                 "reason": result  # Lý do thất bại
-            })
+            }
+
+def iter_backtest_symbol(symbol, timeframe, num_candles=100):
+    """Tải nến rồi duyệt như iter_candle_signals"""
+    candles = get_historical_klines(symbol, timeframe, limit=num_candles + 1)
+    return iter_candle_signals(symbol, timeframe, candles)
+
+def backtest_symbol(symbol, timeframe, num_candles=100, show_failures=False):
+    """
+    Backtest một symbol với một timeframe (trả về list - chỉ dùng cho lịch sử ngắn)
+    
+    Args:
+        show_failures: Nếu True, trả về cả những nến KHÔNG đạt điều kiện
+    """
+    valid_signals = []
+    failed_signals = []
+    
+    for is_valid, record in iter_backtest_symbol(symbol, timeframe, num_candles):
+        if is_valid:
+            valid_signals.append(record)
+        elif show_failures:
+            failed_signals.append(record)
     
     return valid_signals, failed_signals
 
+def stream_backtest_symbol(symbol, timeframe, candles, signal_writer, failure_writer=None):
+    """Đánh giá nến của một cặp, ghi thẳng ra file và chỉ trả về thống kê cộng dồn"""
+    stats = BacktestStats()
+    for is_valid, record in iter_candle_signals(symbol, timeframe, candles):
+        if is_valid:
+            stats.add_valid(record)
+            signal_writer.write(record)
+        else:
+            stats.add_failed(record)
+            if failure_writer is not None:
+                failure_writer.write(record)
+    return stats
+
+def part_paths(part_dir, symbol, timeframe, output_format):
+    """File tạm (tín hiệu, nến thất bại) của một cặp khi chạy song song"""
+    prefix = os.path.join(part_dir, f"{symbol}_{timeframe}")
+    return f"{prefix}.signals.{output_format}", f"{prefix}.failures.{output_format}"
+
+def evaluate_pair(symbol, timeframe, candles, part_dir, output_format, show_failures):
+    """Chạy trong process pool: đánh giá 1 cặp, ghi ra file tạm riêng, trả về thống kê"""
+    signal_path, failure_path = part_paths(part_dir, symbol, timeframe, output_format)
+    failure_writer = ChunkedWriter(failure_path, FAILURE_FIELDS, header=False) if show_failures else None
+    try:
+        with ChunkedWriter(signal_path, SIGNAL_FIELDS, header=False) as signal_writer:
+            return stream_backtest_symbol(symbol, timeframe, candles, signal_writer, failure_writer)
+    finally:
+        if failure_writer is not None:
+            failure_writer.close()
+
+def fetch_pair(symbol, timeframe):
+    """Chạy trong thread pool: tải nến cho 1 cặp"""
+    return get_historical_klines(symbol, timeframe, limit=BACKTEST_CANDLES + 1)
+
+def append_file(target, source):
+    """Nối nội dung file source vào cuối file target đang mở, rồi xóa source"""
+    with open(source, newline="") as f:
+        shutil.copyfileobj(f, target)
+    os.remove(source)
+
 # ========== MAIN ==========
-def run_backtest(show_failures=False):
+def run_backtest(show_failures=False, output_dir=OUTPUT_DIR, output_format=OUTPUT_FORMAT):
     """
-    Chạy backtest cho tất cả symbols và timeframes
+    Chạy backtest cho tất cả symbols và timeframes (song song, xem parallel_backtest.run_pairs)
+    Tín hiệu (và nến thất bại nếu bật) được ghi dần ra output_dir, trong bộ nhớ chỉ giữ thống kê
     
     Args:
         show_failures: Hiển thị những nến KHÔNG đạt điều kiện (để debug)
+        output_format: "csv" hoặc "jsonl"
     """
     print("\n" + "="*100)
     print("🔍 BACKTEST TÍN HIỆU DOJI - CHÍNH XÁC 100% NHƯ BOT LIVE")
@@ -366,29 +504,47 @@ def run_backtest(show_failures=False):
     print(f"     - LONG: Nến Đỏ với High - Close > {PREV_SHADOW_THRESHOLD}%")
     print(f"     - SHORT: Nến Xanh với High - Open > {PREV_SHADOW_THRESHOLD}%")
     
-    all_valid = []
-    all_failed = []
+    os.makedirs(output_dir, exist_ok=True)
+    # Thư mục part riêng cho mỗi lần chạy → không đụng file sót lại từ lần chạy bị ngắt
+    part_dir = tempfile.mkdtemp(prefix=".parts-", dir=output_dir)
+    signal_path = os.path.join(output_dir, f"signals.{output_format}")
+    failure_path = os.path.join(output_dir, f"failures.{output_format}")
+    
+    # Tải song song (threads), đánh giá song song (processes), gộp theo đúng thứ tự symbol × timeframe
+    pairs = [(symbol, timeframe) for symbol in SYMBOLS for timeframe in TIMEFRAMES]
+    evaluate = partial(evaluate_pair, part_dir=part_dir, output_format=output_format, show_failures=show_failures)
     
-    for symbol in SYMBOLS:
-        for timeframe in TIMEFRAMES:
-            valid, failed = backtest_symbol(symbol, timeframe, BACKTEST_CANDLES, show_failures)
-            all_valid.extend(valid)
-            all_failed.extend(failed)
+    stats = BacktestStats()
+    ChunkedWriter(signal_path, SIGNAL_FIELDS).close()
+    if show_failures:
+        ChunkedWriter(failure_path, FAILURE_FIELDS).close()
+    
+    try:
+        with open(signal_path, "a", newline="") as signal_file, \
+             open(failure_path if show_failures else os.devnull, "a", newline="") as failure_file:
+            for (symbol, timeframe), pair_stats in zip(pairs, run_pairs(pairs, fetch_pair, evaluate)):
+                stats.merge(pair_stats)
+                signal_part, failure_part = part_paths(part_dir, symbol, timeframe, output_format)
+                append_file(signal_file, signal_part)
+                if show_failures:
+                    append_file(failure_file, failure_part)
+    finally:
+        shutil.rmtree(part_dir, ignore_errors=True)
     
     # ========== HIỂN THỊ TÍN HIỆU HỢP LỆ ==========
     print("\n" + "="*100)
     print("📈 TÍN HIỆU HỢP LỆ (sẽ được gửi lên channel)")
     print("="*100)
     
-    if not all_valid:
+    if not stats.valid:
         print("\n❌ Không tìm thấy tín hiệu hợp lệ nào!")
         print("💡 Logic mới rất nghiêm ngặt - chỉ lấy tín hiệu chất lượng cao")
     else:
-        print(f"\n✅ Tổng số: {len(all_valid)} tín hiệu\n")
+        print(f"\n✅ Tổng số: {stats.valid} tín hiệu (đầy đủ trong {signal_path})\n")
         
-        # Bảng tín hiệu
+        # Bảng tín hiệu (tối đa MAX_TABLE_ROWS dòng đầu)
         table_data = []
-        for idx, sig in enumerate(all_valid, 1):
+        for idx, sig in enumerate(stats.valid_examples, 1):
             table_data.append([
                 idx,
                 sig["symbol"],
@@ -406,10 +562,12 @@ def run_backtest(show_failures=False):
         headers = ["#", "Symbol", "TF", "Thời gian", "Giá", "Signal", 
                    "Doji%", "Vị trí", "Nến trước", "Shadow%", "Vol%"]
         print(tabulate(table_data, headers=headers, tablefmt="grid"))
+        if stats.valid > len(stats.valid_examples):
+            print(f"... và {stats.valid - len(stats.valid_examples)} tín hiệu khác")
         
         # Chi tiết 3 tín hiệu đầu
         print(f"\n📋 Chi tiết 3 tín hiệu đầu tiên:\n")
-        for idx, sig in enumerate(all_valid[:3], 1):
+        for idx, sig in enumerate(stats.valid_examples[:3], 1):
             print(f"Tín hiệu #{idx} - {sig['signal_type']}")
             print(f"  ⏰ {sig['symbol']} {sig['timeframe']} - {sig['time']}")
             print(f"  💰 Giá Doji: ${sig['price']:.4f}")
@@ -427,40 +585,32 @@ def run_backtest(show_failures=False):
         print(f"\n  Theo Timeframe:")
         for tf in TIMEFRAMES:
             tf_text = timeframe_to_text(tf)
-            count = len([s for s in all_valid if s["timeframe"] == tf_text])
+            count = stats.by_timeframe[tf_text]
             if count > 0:
                 print(f"    • {tf_text}: {count}")
         
         # Theo signal type
-        long_count = len([s for s in all_valid if s["signal_type"] == "LONG"])
-        short_count = len([s for s in all_valid if s["signal_type"] == "SHORT"])
+        long_count = stats.by_signal_type["LONG"]
+        short_count = stats.by_signal_type["SHORT"]
         
         print(f"\n  Theo Hướng:")
-        print(f"    • LONG: {long_count} ({long_count/len(all_valid)*100:.1f}%)")
-        print(f"    • SHORT: {short_count} ({short_count/len(all_valid)*100:.1f}%)")
+        print(f"    • LONG: {long_count} ({long_count/stats.valid*100:.1f}%)")
+        print(f"    • SHORT: {short_count} ({short_count/stats.valid*100:.1f}%)")
     
     # ========== HIỂN THỊ TÍN HIỆU THẤT BẠI (NẾU BẬT) ==========
-    if show_failures and all_failed:
+    if show_failures and stats.failed:
         print("\n" + "="*100)
         print("❌ TÍN HIỆU KHÔNG ĐẠT (Debug)")
         print("="*100)
-        print(f"\nTổng số: {len(all_failed)} nến không đạt điều kiện\n")
-        
-        # Nhóm theo lý do thất bại
-        reasons = {}
-        for failed in all_failed:
-            reason = failed["reason"]
-            if reason not in reasons:
-                reasons[reason] = []
-            reasons[reason].append(failed)
+        print(f"\nTổng số: {stats.failed} nến không đạt điều kiện (đầy đủ trong {failure_path})\n")
         
         print("📊 Phân bố lý do thất bại:\n")
-        for reason, items in sorted(reasons.items(), key=lambda x: len(x[1]), reverse=True):
-            print(f"  • {reason}: {len(items)} nến")
+        for reason, count in stats.failure_reasons.most_common():
+            print(f"  • {reason}: {count} nến")
         
         # Hiển thị 5 ví dụ đầu
         print(f"\n💡 5 ví dụ đầu tiên:\n")
-        for idx, failed in enumerate(all_failed[:5], 1):
+        for idx, failed in enumerate(stats.failed_examples, 1):
             print(f"{idx}. {failed['symbol']} {failed['timeframe']} - {failed['time']}")
             print(f"   Giá: ${failed['price']:.4f}")
             print(f"   Lý do: {failed['reason']}\n")
@@ -469,8 +619,8 @@ def run_backtest(show_failures=False):
     print("✅ HOÀN THÀNH BACKTEST")
     print("="*100)
     
-    if all_valid:
-        print(f"\n🎯 Kết luận: Tìm thấy {len(all_valid)} tín hiệu ĐẠT ĐỦ điều kiện")
+    if stats.valid:
+        print(f"\n🎯 Kết luận: Tìm thấy {stats.valid} tín hiệu ĐẠT ĐỦ điều kiện")
         print("📢 Những tín hiệu này sẽ được bot gửi lên channel khi chạy live")
     else:
         print("\n⚠️  Không có tín hiệu nào đạt đủ điều kiện trong khoảng thời gian test")
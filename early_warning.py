@@ -0,0 +1,254 @@
+"""
+Early Warning - Cảnh báo sớm "Doji đang hình thành" từ kline stream (WebSocket), tùy chọn
+- Nến đang chạy được kiểm tra ở MỖI tick, nhưng rẻ và tăng dần:
+  • Điều kiện nến trước (LONG/SHORT) cố định suốt nến → tính 1 lần khi nến mở, không có hướng thì bỏ qua mọi tick
+  • Ngưỡng volume = volume_ratio × volume nến trước; volume chỉ tăng → vượt ngưỡng là loại luôn tới hết nến
+  • Còn lại chỉ vài phép nhân/so sánh (không chia, không tạo dict)
+- Trễ (hysteresis): chỉ báo trước khi điều kiện đúng LIÊN TỤC trong EARLY_WARNING_HOLD × độ dài nến
+- Khi nến đóng: kiểm tra lại bằng is_doji_with_low_volume → xác nhận hoặc hủy cảnh báo đã gửi
+  (bot không gửi tin xác nhận riêng: tín hiệu của scanner cho cùng nến là xác nhận, kèm dấu đã báo sớm)
+- Cần gói `websockets` (không bắt buộc cho bot): bật bằng EARLY_WARNING=1
+"""
+import os
+import json
+import asyncio
+import logging
+import metrics
+from kline_client import INTERVAL_MS
+from structured_log import log_event
+
+try:
+    import websockets
+except ImportError:  # Tùy chọn - chỉ cần khi bật cảnh báo sớm
+    websockets = None
+
+STREAM_AVAILABLE = websockets is not None
+BINANCE_STREAM_URL = os.getenv("BINANCE_STREAM_URL", "wss://stream.binance.com:9443").rstrip("/")
+EARLY_WARNING = os.getenv("EARLY_WARNING", "0") == "1"
+EARLY_WARNING_HOLD = float(os.getenv("EARLY_WARNING_HOLD", "0.2"))  # Phần độ dài nến điều kiện phải giữ liên tục
+EARLY_WARNING_TIMEFRAMES = ["1h", "2h", "4h", "1d"]
+PRE_ALERTED_LIMIT = 1000        # Số nến đã báo sớm nhớ lại (để scanner đánh dấu tín hiệu cùng nến)
+STREAMS_PER_CONNECTION = 200    # Binance cho tối đa 1024 stream / kết nối
+RECONNECT_DELAY = 5             # Giây chờ trước khi kết nối lại
+SYMBOLS_REFRESH = 60            # Giây giữa 2 lần kiểm tra danh sách symbols (đổi → kết nối lại)
+
+# Loại sự kiện gửi ra
+PRE_ALERT = "pre_alert"
+CONFIRMED = "confirmed"
+CANCELLED = "cancelled"
+
+
+def event_candle(kline):
+    """Phần "k" của event kline Binance → dict nến như detector dùng"""
+    return {
+        "open_time": kline["t"],
+        "open": float(kline["o"]),
+        "high": float(kline["h"]),
+        "low": float(kline["l"]),
+        "close": float(kline["c"]),
+        "volume": float(kline["v"]),
+        "close_time": kline["T"]
+    }
+
+
+class FormingCandle:
+    """Trạng thái nến đang chạy của 1 cặp - các ngưỡng phụ thuộc nến trước tính sẵn khi nến mở"""
+
+    __slots__ = ("open_time", "close_time", "previous", "signal_type", "volume_limit",
+                 "dead", "holding_since", "alerted")
+
+    def __init__(self, open_time, close_time, previous, signal_type, volume_limit):
+        self.open_time = open_time
+        self.close_time = close_time
+        self.previous = previous          # Nến trước (dict), None nếu chưa biết
+        self.signal_type = signal_type    # Hướng do nến trước quyết định (None = không thể có tín hiệu)
+        self.volume_limit = volume_limit  # None = không xét volume (khung 1d)
+        self.dead = signal_type is None   # True → bỏ qua mọi tick còn lại của nến
+        self.holding_since = None         # Thời điểm điều kiện bắt đầu đúng liên tục
+        self.alerted = False
+
+
+class EarlyWarningMonitor:
+
+    def __init__(self, detector, hold=EARLY_WARNING_HOLD):
+        self.detector = detector
+        self.hold = hold
+        self.candles = {}      # (symbol, timeframe) -> FormingCandle
+        self.previous = {}     # (symbol, timeframe) -> nến đã đóng gần nhất
+        self.pre_alerted = {}  # (symbol, timeframe, close_time) -> thời điểm báo sớm (ms)
+        self.stats = {"ticks": 0, "evaluated": 0, PRE_ALERT: 0, CONFIRMED: 0, CANCELLED: 0}
+
+    def previous_direction(self, previous, timeframe):
+        """(hướng, ngưỡng volume) từ nến trước - cùng điều kiện 3 của is_doji_with_low_volume"""
+        d = self.detector
+        prev_range = previous["high"] - previous["low"]
+        if prev_range == 0 or previous["volume"] == 0:
+            return None, None
+
+        prev_body = abs(previous["close"] - previous["open"])
+        if previous["close"] < previous["open"]:
+            upper_shadow, signal_type = previous["high"] - previous["close"], "LONG"
+        elif previous["close"] > previous["open"]:
+            upper_shadow, signal_type = previous["high"] - previous["open"], "SHORT"
+        else:
+            return None, None
+
+        if not (upper_shadow > d.prev_shadow_threshold / 100 * prev_range and
+                prev_body >= d.prev_body_threshold / 100 * prev_range):
+            return None, None
+        volume_limit = None if timeframe == "1d" else d.volume_ratio * previous["volume"]
+        return signal_type, volume_limit
+
+    def _open_candle(self, key, candle):
+        previous = self.previous.get(key)
+        if previous is not None and previous["close_time"] + 1 != candle["open_time"]:
+            previous = None  # Hụt nến (mất kết nối) → không biết nến trước
+        signal_type, volume_limit = self.previous_direction(previous, key[1]) if previous else (None, None)
+        state = FormingCandle(candle["open_time"], candle["close_time"], previous, signal_type, volume_limit)
+        self.candles[key] = state
+        return state
+
+    def is_forming_doji(self, state, o, h, l, c, v):
+        """Điều kiện Doji trên giá trị hiện tại (dạng nhân, không chia) - volume vượt ngưỡng thì loại cả nến"""
+        if state.volume_limit is not None and v > state.volume_limit:
+            state.dead = True
+            return False
+        d = self.detector
+        price_range = h - l
+        if price_range <= 0:
+            return False
+        body_top, body_bottom = (o, c) if o >= c else (c, o)
+        return (body_top - body_bottom) * 100 <= d.doji_threshold * price_range and \
+            d.min_body_position * price_range <= (body_bottom - l) * 100 <= d.max_body_position * price_range and \
+            (h - body_top) * 100 >= d.min_shadow_percent * price_range and \
+            (body_bottom - l) * 100 >= d.min_shadow_percent * price_range
+
+    def process(self, symbol, timeframe, kline, event_time):
+        """
+        Xử lý 1 event kline (phần "k"), trả về list sự kiện cần gửi:
+        (loại, symbol, timeframe, signal_type, nến)
+        """
+        self.stats["ticks"] += 1
+        key = (symbol, timeframe)
+        state = self.candles.get(key)
+        if state is None or state.open_time != kline["t"]:
+            state = self._open_candle(key, event_candle(kline))
+
+        if kline["x"]:
+            return self._close_candle(key, state, event_candle(kline))
+        if state.dead:
+            return []
+
+        self.stats["evaluated"] += 1
+        if not self.is_forming_doji(state, float(kline["o"]), float(kline["h"]), float(kline["l"]),
+                                    float(kline["c"]), float(kline["v"])):
+            state.holding_since = None
+            return []
+
+        if state.holding_since is None:
+            state.holding_since = event_time
+        hold_ms = self.hold * (state.close_time + 1 - state.open_time)
+        if state.alerted or event_time - state.holding_since < hold_ms:
+            return []
+
+        state.alerted = True
+        self.stats[PRE_ALERT] += 1
+        self.pre_alerted[(symbol, timeframe, state.close_time)] = event_time
+        if len(self.pre_alerted) > PRE_ALERTED_LIMIT:
+            del self.pre_alerted[next(iter(self.pre_alerted))]
+        return [(PRE_ALERT, symbol, timeframe, state.signal_type, event_candle(kline))]
+
+    def _close_candle(self, key, state, candle):
+        """Nến đóng: nhớ làm nến trước cho nến sau; xác nhận / hủy nếu đã cảnh báo"""
+        self.previous[key] = candle
+        del self.candles[key]
+        if not state.alerted:
+            return []
+
+        symbol, timeframe = key
+        is_signal, _ = self.detector.is_doji_with_low_volume(candle, state.previous, symbol, timeframe)
+        kind = CONFIRMED if is_signal else CANCELLED
+        self.stats[kind] += 1
+        return [(kind, symbol, timeframe, state.signal_type, candle)]
+
+    def was_pre_alerted(self, symbol, timeframe, close_time):
+        """Nến (symbol, timeframe, close_time) đã được báo sớm chưa"""
+        return (symbol, timeframe, close_time) in self.pre_alerted
+
+    def seed_previous(self, symbol, timeframe, candle):
+        """Nến đã đóng gần nhất (lấy qua REST khi khởi động) để nến đang chạy có nến trước"""
+        self.previous[(symbol, timeframe)] = candle
+
+    def register_metrics(self, prefix="bot_early_warning"):
+        metrics.register(f"{prefix}_ticks_total", lambda: self.stats["ticks"], "Kline stream updates received",
+                         metric_type=metrics.COUNTER)
+        metrics.register(f"{prefix}_evaluated_total", lambda: self.stats["evaluated"],
+                         "Stream updates that needed a Doji check", metric_type=metrics.COUNTER)
+        for kind in [PRE_ALERT, CONFIRMED, CANCELLED]:
+            metrics.register(f"{prefix}_{kind}_total", lambda kind=kind: self.stats[kind], f"Early warnings {kind}",
+                             metric_type=metrics.COUNTER)
+        metrics.register(f"{prefix}_forming", lambda: len(self.candles), "Forming candles tracked")
+        return self
+
+
+# ========== STREAM ==========
+def stream_names(symbols, timeframes):
+    return [f"{symbol.lower()}@kline_{timeframe}" for symbol in symbols for timeframe in timeframes
+            if timeframe in INTERVAL_MS]
+
+
+async def seed_monitor(monitor, symbols, timeframes):
+    """Lấy nến đã đóng gần nhất cho mỗi cặp (qua kline client - có cache/gộp request)"""
+    for symbol in symbols:
+        for timeframe in timeframes:
+            candles = await monitor.detector.fetch_klines(symbol, timeframe, limit=2)
+            if candles and len(candles) == 2:
+                monitor.seed_previous(symbol, timeframe, candles[0])
+
+
+async def _consume(url, names, monitor, notify, stop):
+    """1 kết nối combined stream; trả về khi stop được set hoặc mất kết nối"""
+    async with websockets.connect(f"{url}/stream?streams={'/'.join(names)}", ping_interval=20) as ws:
+        while not stop.is_set():
+            try:
+                message = await asyncio.wait_for(ws.recv(), timeout=1.0)
+            except asyncio.TimeoutError:
+                continue
+            data = json.loads(message).get("data", {})
+            kline = data.get("k")
+            if not kline:
+                continue
+            for event in monitor.process(kline["s"], kline["i"], kline, data.get("E", kline["T"])):
+                await notify(*event)
+
+
+async def run_early_warning(monitor, get_symbols, notify, timeframes=EARLY_WARNING_TIMEFRAMES, url=BINANCE_STREAM_URL):
+    """
+    Chạy mãi: mở các kết nối stream cho watchlist hiện tại, gọi notify(loại, symbol, tf, hướng, nến)
+    Danh sách symbols đổi → đóng và mở lại kết nối
+    """
+    if websockets is None:
+        raise RuntimeError("Cảnh báo sớm cần gói websockets (pip install websockets)")
+
+    while True:
+        symbols = list(get_symbols())
+        names = stream_names(symbols, timeframes)
+        await seed_monitor(monitor, symbols, timeframes)
+        stop = asyncio.Event()
+        chunks = [names[i:i + STREAMS_PER_CONNECTION] for i in range(0, len(names), STREAMS_PER_CONNECTION)]
+        tasks = [asyncio.create_task(_consume(url, chunk, monitor, notify, stop)) for chunk in chunks]
+        log_event("stream_connected", streams=len(names), connections=len(tasks))
+
+        try:
+            while True:
+                done, _ = await asyncio.wait(tasks, timeout=SYMBOLS_REFRESH, return_when=asyncio.FIRST_COMPLETED)
+                if done or list(get_symbols()) != symbols:
+                    break
+        finally:
+            stop.set()
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+
+        errors = [r for r in results if isinstance(r, Exception)]
+        if errors:
+            log_event("stream_error", logging.WARNING, error=str(errors[0]))
+            await asyncio.sleep(RECONNECT_DELAY)
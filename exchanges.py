@@ -0,0 +1,241 @@
+"""
+Exchanges - Adapter lấy nến cho từng sàn, cùng 1 giao diện
+- Mỗi adapter có connection pool (requests.Session) + bộ giới hạn weight/phút riêng
+  → quét nhiều sàn song song không tranh pool / hạn mức của nhau
+- Output chuẩn hóa: rows dạng Binance (open_time, open, high, low, close, volume, close_time, ...)
+  hoặc dạng cột NumPy (klines_arrays) cho backtest
+- binance (spot), binance_futures (USDT-M), stub (dữ liệu trong bộ nhớ, không mạng - cho test)
+- Chọn sàn mặc định bằng EXCHANGE (mặc định binance)
+"""
+import os
+import threading
+import requests
+import numpy as np
+from typing import Dict, List, Optional
+from requests.adapters import HTTPAdapter
+from clock import RealClock
+
+# Đổi sang mock server khi load test: BINANCE_BASE_URL=http://127.0.0.1:8080
+BINANCE_BASE_URL = os.getenv("BINANCE_BASE_URL", "https://api.binance.com").rstrip("/")
+BINANCE_FUTURES_BASE_URL = os.getenv("BINANCE_FUTURES_BASE_URL", "https://fapi.binance.com").rstrip("/")
+EXCHANGE = os.getenv("EXCHANGE", "binance")
+
+MAX_RETRIES = 3         # Số lần thử lại khi bị rate limit (429/418)
+POOL_SIZE = 16          # Kết nối giữ sẵn mỗi sàn (= số thread tải song song tối đa)
+WEIGHT_HEADROOM = 0.9   # Chỉ dùng 90% hạn mức weight/phút, phần còn lại dành cho lệnh bot / sai lệch đồng hồ
+
+COLUMNS = ["open_time", "open", "high", "low", "close", "volume", "close_time"]
+
+
+def rows_to_arrays(rows):
+    """Rows chuẩn hóa → dict các cột NumPy"""
+    if not rows:
+        return {col: np.empty(0, dtype=np.int64 if col.endswith("_time") else float) for col in COLUMNS}
+
+    data = np.array([row[:7] for row in rows], dtype=float)
+    arrays = {col: data[:, i] for i, col in enumerate(COLUMNS)}
+    arrays["open_time"] = arrays["open_time"].astype(np.int64)
+    arrays["close_time"] = arrays["close_time"].astype(np.int64)
+    return arrays
+
+
+class WeightLimiter:
+    """
+    Giới hạn weight theo phút (cửa sổ theo phút của đồng hồ như Binance)
+    Hết hạn mức → chặn thread gọi đến phút sau thay vì để sàn trả 429
+    """
+
+    def __init__(self, weight_per_minute, clock=None, headroom=WEIGHT_HEADROOM):
+        self.limit = weight_per_minute * headroom
+        self.clock = clock or RealClock()
+        self._lock = threading.Lock()
+        self._minute = None
+        self._used = 0
+        self.throttled = 0
+
+    def acquire(self, weight):
+        while True:
+            with self._lock:
+                now = self.clock.time()
+                minute = int(now // 60)
+                if minute != self._minute:
+                    self._minute = minute
+                    self._used = 0
+                if self._used + weight <= self.limit or self._used == 0:
+                    self._used += weight
+                    return
+                self.throttled += 1
+                wait = 60 - now % 60
+            self.clock.sleep_blocking(wait)
+
+    def observe(self, used_weight):
+        """Weight sàn báo đã dùng (header) - tính cả request của process khác cùng IP"""
+        with self._lock:
+            if self._minute == int(self.clock.time() // 60):
+                self._used = max(self._used, used_weight)
+
+
+class ExchangeAdapter:
+    """Giao diện chung: klines() do từng sàn cài đặt, phân trang và dạng cột dùng chung"""
+
+    name = None
+    label = None
+    max_limit = 1000
+
+    def __init__(self, clock=None):
+        self.clock = clock or RealClock()
+        self.url = None
+        self.stats = {"requests": 0, "rate_limited": 0, "used_weight": 0, "throttled": 0}
+
+    @classmethod
+    def klines_weight(cls, limit):
+        """Weight của 1 request klines (mỗi sàn / endpoint 1 bảng)"""
+        return 1
+
+    def klines(self, symbol: str, interval: str, limit: int, **extra) -> List[list]:
+        """Rows chuẩn hóa, extra: startTime / endTime (ms). Raise exception nếu lỗi"""
+        raise NotImplementedError
+
+    def klines_range(self, symbol: str, interval: str, start_time: int, end_time: Optional[int] = None,
+                     page_size: Optional[int] = None) -> List[list]:
+        """Nến từ start_time đến end_time (phân trang theo max_limit của sàn)"""
+        page_size = min(page_size or self.max_limit, self.max_limit)
+        rows = []
+        while True:
+            extra = {"startTime": start_time}
+            if end_time is not None:
+                extra["endTime"] = end_time
+
+            batch = self.klines(symbol, interval, page_size, **extra)
+            if not batch:
+                break
+
+            rows.extend(batch)
+            if len(batch) < page_size:
+                break
+            start_time = batch[-1][0] + 1
+
+        return rows
+
+    def klines_arrays(self, symbol: str, interval: str, start_time: int, end_time: Optional[int] = None):
+        return rows_to_arrays(self.klines_range(symbol, interval, start_time, end_time))
+
+
+class BinanceSpotExchange(ExchangeAdapter):
+
+    name = "binance"
+    label = "Binance Spot"
+    base_url = BINANCE_BASE_URL
+    klines_path = "/api/v3/klines"
+    weight_limit = 6000
+
+    def __init__(self, base_url=None, url=None, clock=None, timeout=10, pool_size=POOL_SIZE, weight_limit=None):
+        """url: URL klines đầy đủ (vd. MockBinanceServer.klines_url) - ưu tiên hơn base_url"""
+        super().__init__(clock)
+        self.url = url or f"{(base_url or self.base_url).rstrip('/')}{self.klines_path}"
+        self.timeout = timeout
+        self.limiter = WeightLimiter(weight_limit or self.weight_limit, self.clock)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    @classmethod
+    def klines_weight(cls, limit):
+        """Spot /api/v3/klines: weight cố định, không phụ thuộc limit"""
+        return 2
+
+    def normalize_rows(self, data):
+        """Dữ liệu sàn trả về → rows chuẩn hóa (Binance: giữ nguyên)"""
+        return data
+
+    def klines(self, symbol, interval, limit, **extra):
+        params = {
+            "symbol": symbol,
+            "interval": interval,
+            "limit": limit,
+            **extra
+        }
+        for attempt in range(MAX_RETRIES + 1):
+            self.limiter.acquire(self.klines_weight(limit))
+            self.stats["throttled"] = self.limiter.throttled
+            self.stats["requests"] += 1
+            response = self.session.get(self.url, params=params, timeout=self.timeout)
+
+            used_weight = response.headers.get("X-MBX-USED-WEIGHT-1M")
+            if used_weight is not None:
+                self.stats["used_weight"] = int(used_weight)
+                self.limiter.observe(int(used_weight))
+
+            # Bị rate limit → chờ theo Retry-After rồi thử lại
+            if response.status_code in (429, 418) and attempt < MAX_RETRIES:
+                self.stats["rate_limited"] += 1
+                self.clock.sleep_blocking(float(response.headers.get("Retry-After", 1)))
+                continue
+
+            response.raise_for_status()
+            return self.normalize_rows(response.json())
+
+
+class BinanceFuturesExchange(BinanceSpotExchange):
+    """USDT-M futures: cùng dạng rows với spot, khác endpoint / hạn mức"""
+
+    name = "binance_futures"
+    label = "Binance Futures"
+    base_url = BINANCE_FUTURES_BASE_URL
+    klines_path = "/fapi/v1/klines"
+    weight_limit = 2400
+    max_limit = 1500
+
+    @classmethod
+    def klines_weight(cls, limit):
+        """Futures /fapi/v1/klines: weight theo limit"""
+        if limit < 100:
+            return 1
+        if limit < 500:
+            return 2
+        if limit <= 1000:
+            return 5
+        return 10
+
+
+class StubExchange(ExchangeAdapter):
+    """
+    Sàn giả trong bộ nhớ: {(symbol, interval): rows} - trả như Binance tại thời điểm của clock
+    (chỉ nến đã mở, gồm nến đang hình thành), không I/O
+    """
+
+    name = "stub"
+    label = "Stub"
+
+    def __init__(self, klines=None, clock=None):
+        super().__init__(clock)
+        self.url = "stub://klines"
+        self.klines_data: Dict[tuple, List[list]] = dict(klines or {})
+
+    def klines(self, symbol, interval, limit, **extra):
+        self.stats["requests"] += 1
+        rows = self.klines_data.get((symbol, interval))
+        if rows is None:
+            raise ValueError(f"Invalid symbol: {symbol} {interval}")
+
+        now_ms = int(self.clock.time() * 1000)
+        start_time, end_time = extra.get("startTime"), extra.get("endTime")
+        rows = [row for row in rows if row[0] <= now_ms and (start_time is None or row[0] >= start_time)
+                and (end_time is None or row[0] <= end_time)]
+        return rows[:limit] if start_time is not None else rows[-limit:]
+
+
+EXCHANGES = {
+    "binance": BinanceSpotExchange,
+    "binance_futures": BinanceFuturesExchange,
+    "stub": StubExchange
+}
+
+
+def create_exchange(name=EXCHANGE, **kwargs) -> ExchangeAdapter:
+    """Tạo adapter theo tên trong EXCHANGES"""
+    if name not in EXCHANGES:
+        raise ValueError(f"Sàn không hỗ trợ: {name} (có: {', '.join(EXCHANGES)})")
+    return EXCHANGES[name](**kwargs)
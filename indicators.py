@@ -0,0 +1,138 @@
+"""
+Indicators - Chỉ báo cập nhật dần theo từng nến đóng, mỗi (symbol, timeframe) 1 trạng thái
+- ATR (Wilder), volume trung bình + độ lệch chuẩn trượt (tổng + tổng bình phương), EMA giá đóng cửa
+- Mỗi nến đóng cập nhật O(1), không tải lại lịch sử: nến lấy từ chính lượt quét (kline client)
+- Lần đầu gặp 1 cặp: lấy thêm INDICATOR_WARMUP nến (1 lần) để chỉ báo dùng được ngay
+- Dùng cho bộ lọc volume tương đối của detector và nội dung alert
+"""
+import math
+from collections import deque
+from typing import Dict, Optional
+
+ATR_PERIOD = 14
+VOLUME_WINDOW = 20
+EMA_PERIOD = 20
+INDICATOR_WARMUP = 50   # Số nến lấy lần đầu cho 1 cặp (≥ các chu kỳ trên)
+
+
+class IndicatorState:
+    """Trạng thái chỉ báo của 1 (symbol, timeframe)"""
+
+    __slots__ = ("close_time", "prev_close", "close", "count", "atr", "tr_sum", "ema",
+                 "volumes", "volume_sum", "volume_sq_sum", "volume", "relative_volume", "volume_z")
+
+    def __init__(self):
+        self.close_time = None
+        self.prev_close = None
+        self.close = None
+        self.count = 0
+        self.atr = None
+        self.tr_sum = 0.0
+        self.ema = None
+        self.volumes = deque()
+        self.volume_sum = 0.0
+        self.volume_sq_sum = 0.0
+        self.volume = None
+        self.relative_volume = None   # Volume nến cuối / trung bình N nến TRƯỚC đó
+        self.volume_z = None          # Z-score volume nến cuối so với N nến trước đó
+
+
+class RollingIndicators:
+
+    def __init__(self, atr_period=ATR_PERIOD, volume_window=VOLUME_WINDOW, ema_period=EMA_PERIOD):
+        self.atr_period = atr_period
+        self.volume_window = volume_window
+        self.ema_period = ema_period
+        self.states: Dict[tuple, IndicatorState] = {}
+
+    def is_warm(self, symbol, timeframe, since=None):
+        """Đủ nến cho mọi chỉ báo (và nến cuối đã thêm không cũ hơn close_time `since`)"""
+        state = self.states.get((symbol, timeframe))
+        return state is not None and state.count >= max(self.atr_period + 1, self.volume_window + 1, self.ema_period) \
+            and (since is None or state.close_time >= since)
+
+    def reset(self, symbol, timeframe):
+        """Bỏ trạng thái (vd. bị hụt nến khi bot dừng lâu) - sẽ làm nóng lại từ đầu"""
+        self.states.pop((symbol, timeframe), None)
+
+    def update(self, symbol, timeframe, candle):
+        """Thêm 1 nến đã đóng - bỏ qua nếu không mới hơn nến cuối đã thêm (an toàn khi gọi lại)"""
+        state = self.states.get((symbol, timeframe))
+        if state is None:
+            state = self.states[(symbol, timeframe)] = IndicatorState()
+        if state.close_time is not None and candle["close_time"] <= state.close_time:
+            return state
+
+        high, low, close, volume = candle["high"], candle["low"], candle["close"], candle["volume"]
+
+        # ATR (Wilder): trung bình TR của atr_period nến đầu, sau đó làm mượt
+        if state.close is not None:
+            tr = max(high - low, abs(high - state.close), abs(low - state.close))
+            if state.atr is None:
+                state.tr_sum += tr
+                if state.count >= self.atr_period:
+                    state.atr = state.tr_sum / self.atr_period
+            else:
+                state.atr += (tr - state.atr) / self.atr_period
+
+        # EMA giá đóng cửa
+        alpha = 2 / (self.ema_period + 1)
+        state.ema = close if state.ema is None else state.ema + alpha * (close - state.ema)
+
+        # Volume so với cửa sổ TRƯỚC nến này, rồi mới đưa nến vào cửa sổ
+        n = len(state.volumes)
+        if n >= self.volume_window:
+            mean = state.volume_sum / n
+            variance = max(state.volume_sq_sum / n - mean * mean, 0.0)
+            std = math.sqrt(variance)
+            state.relative_volume = volume / mean if mean > 0 else None
+            state.volume_z = (volume - mean) / std if std > 0 else 0.0
+        state.volumes.append(volume)
+        state.volume_sum += volume
+        state.volume_sq_sum += volume * volume
+        if len(state.volumes) > self.volume_window:
+            old = state.volumes.popleft()
+            state.volume_sum -= old
+            state.volume_sq_sum -= old * old
+
+        state.prev_close = state.close
+        state.close = close
+        state.volume = volume
+        state.close_time = candle["close_time"]
+        state.count += 1
+        return state
+
+    def update_many(self, symbol, timeframe, candles):
+        for candle in candles:
+            self.update(symbol, timeframe, candle)
+        return self.states.get((symbol, timeframe))
+
+    def export_states(self):
+        """{(symbol, timeframe): dict JSON được} - cho state_snapshot"""
+        return {key: {slot: list(getattr(state, slot)) if slot == "volumes" else getattr(state, slot)
+                      for slot in IndicatorState.__slots__}
+                for key, state in self.states.items()}
+
+    def import_states(self, states):
+        for key, values in states.items():
+            state = IndicatorState()
+            for slot in IndicatorState.__slots__:
+                if slot in values:
+                    setattr(state, slot, deque(values[slot]) if slot == "volumes" else values[slot])
+            self.states[key] = state
+
+    def snapshot(self, symbol, timeframe) -> Optional[Dict]:
+        """Giá trị hiện tại (sau nến đóng cuối) - None nếu chưa đủ nến"""
+        if not self.is_warm(symbol, timeframe):
+            return None
+        state = self.states[(symbol, timeframe)]
+        return {
+            "close_time": state.close_time,
+            "atr": state.atr,
+            "atr_percent": state.atr / state.close * 100 if state.close else None,
+            "volume_mean": state.volume_sum / len(state.volumes),
+            "relative_volume": state.relative_volume,
+            "volume_z": state.volume_z,
+            "ema": state.ema,
+            "ema_distance_percent": (state.close - state.ema) / state.ema * 100 if state.ema else None
+        }
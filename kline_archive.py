@@ -0,0 +1,298 @@
+"""
+Kline Archive - Định dạng lưu lịch sử nến gọn cho backtest (thay cache .npz float64)
+- Chia khối CHUNK_ROWS nến, mỗi khối nén zlib riêng + chỉ mục khối (open_time đầu/cuối, offset) ở cuối file
+  → đọc 1 khoảng thời gian chỉ seek + giải nén các khối giao với khoảng đó
+- open_time: delta giữa các nến trừ bước đều của khung (gần như toàn 0) | close_time: lưu độ dài nến - bước
+- Giá: số nguyên theo bước giá (10^-decimals, suy ra từ dữ liệu - bước giá Binance là lũy thừa của 10),
+  lưu delta giữa các nến; volume: số nguyên theo bước volume
+- Mỗi cột dùng kiểu nguyên nhỏ nhất chứa được (int8 → int64); cột không lượng tử hóa được chính xác → float64
+- Giải mã ra đúng từng giá trị float ban đầu (kiểm tra khi ghi), thẳng vào mảng NumPy
+- Thêm nến mới: chỉ ghi lại khối cuối (nếu chưa đầy) + chỉ mục, trên bản sao rồi os.replace
+  → file không bao giờ ở trạng thái ghi dở
+    python kline_archive.py convert [thư mục]   # Chuyển cache .npz cũ sang .dka
+    python kline_archive.py info <file.dka>
+"""
+import os
+import sys
+import json
+import shutil
+import zlib
+import struct
+import numpy as np
+from tabulate import tabulate
+from exchanges import COLUMNS
+
+ARCHIVE_EXT = ".dka"
+MAGIC = b"DKA1"
+CHUNK_ROWS = 4096         # Số nến mỗi khối (~170 ngày 1h)
+COMPRESS_LEVEL = 6
+MAX_DECIMALS = 12         # Số chữ số thập phân tối đa khi suy ra bước giá / volume
+PRICE_COLUMNS = ["open", "high", "low", "close"]
+INT_TYPES = [np.int8, np.int16, np.int32, np.int64]
+_FOOTER = struct.Struct("<Q4s")   # Độ dài chỉ mục + MAGIC
+# Lỗi có thể gặp khi đọc archive hỏng (footer / chỉ mục JSON / khối zlib)
+ARCHIVE_ERRORS = (OSError, ValueError, KeyError, zlib.error, struct.error)
+
+
+def infer_decimals(values):
+    """Số chữ số thập phân nhỏ nhất để values = số nguyên / 10^d chính xác tuyệt đối (None nếu không có)"""
+    if len(values) == 0:
+        return 0
+    for decimals in range(MAX_DECIMALS + 1):
+        scale = 10.0 ** decimals
+        scaled = np.round(values * scale)
+        if np.abs(scaled).max() >= 2 ** 53:
+            return None
+        if np.array_equal(scaled / scale, values):
+            return decimals
+    return None
+
+
+def _narrow(ints):
+    """Kiểu nguyên nhỏ nhất chứa được mảng"""
+    if len(ints) == 0:
+        return ints.astype(np.int8)
+    lo, hi = ints.min(), ints.max()
+    for dtype in INT_TYPES:
+        info = np.iinfo(dtype)
+        if info.min <= lo and hi <= info.max:
+            return ints.astype(dtype)
+    return ints
+
+
+def _delta(ints):
+    """(giá trị đầu, delta giữa các phần tử - phần tử đầu = 0)"""
+    base = int(ints[0]) if len(ints) else 0
+    return base, np.diff(ints, prepend=ints[:1])
+
+
+def encode_chunk(arrays):
+    """dict cột NumPy (1 khối) → (bytes đã nén, metadata khối)"""
+    open_time = arrays["open_time"].astype(np.int64)
+    columns, meta = [], {"rows": len(open_time), "first": int(open_time[0]), "last": int(open_time[-1]),
+                         "bases": {}, "decimals": {}, "dtypes": []}
+
+    # Thời gian: phần lệch so với bước đều (hụt nến / nến tháng) → hầu hết là 0
+    step = int(np.median(np.diff(open_time))) if len(open_time) > 1 else 0
+    meta["step"] = step
+    base, deltas = _delta(open_time)
+    meta["bases"]["open_time"] = base
+    deltas[1:] -= step
+    columns.append(_narrow(deltas))
+    columns.append(_narrow(arrays["close_time"].astype(np.int64) - open_time - step))
+
+    # Giá dùng chung 1 bước giá; volume bước riêng
+    prices = np.concatenate([arrays[col] for col in PRICE_COLUMNS])
+    groups = [(PRICE_COLUMNS, infer_decimals(prices), True), (["volume"], infer_decimals(arrays["volume"]), False)]
+    for names, decimals, delta in groups:
+        meta["decimals"][names[0]] = decimals
+        for col in names:
+            values = arrays[col].astype(float)
+            if decimals is None:
+                columns.append(values)
+                continue
+            ints = np.round(values * 10.0 ** decimals).astype(np.int64)
+            if delta:
+                meta["bases"][col], ints = _delta(ints)
+            columns.append(_narrow(ints))
+
+    meta["dtypes"] = [column.dtype.str for column in columns]
+    raw = b"".join(np.ascontiguousarray(column).tobytes() for column in columns)
+    return zlib.compress(raw, COMPRESS_LEVEL), meta
+
+
+def decode_chunk(data, meta):
+    """bytes của khối + metadata → dict cột NumPy"""
+    raw = zlib.decompress(data)
+    rows, offset, columns = meta["rows"], 0, []
+    for dtype in meta["dtypes"]:
+        column = np.frombuffer(raw, dtype=dtype, count=rows, offset=offset)
+        offset += column.nbytes
+        columns.append(column)
+
+    arrays = {}
+    step = meta["step"]
+    arrays["open_time"] = meta["bases"]["open_time"] + np.cumsum(columns[0], dtype=np.int64) \
+        + step * np.arange(rows, dtype=np.int64)
+    arrays["close_time"] = arrays["open_time"] + step + columns[1].astype(np.int64)
+
+    i = 2
+    for names in [PRICE_COLUMNS, ["volume"]]:
+        decimals = meta["decimals"][names[0]]
+        for col in names:
+            column = columns[i]
+            i += 1
+            if decimals is None:
+                arrays[col] = column.astype(float)
+                continue
+            ints = column.astype(np.int64)
+            if col in meta["bases"]:
+                ints = meta["bases"][col] + np.cumsum(ints, dtype=np.int64)
+            arrays[col] = ints / 10.0 ** decimals
+    return arrays
+
+
+def _empty():
+    return {col: np.empty(0, dtype=np.int64 if col.endswith("_time") else float) for col in COLUMNS}
+
+
+def _concat(parts):
+    if not parts:
+        return _empty()
+    return {col: np.concatenate([part[col] for part in parts]) for col in COLUMNS}
+
+
+# ========== FILE ==========
+def read_index(path):
+    """Chỉ mục của archive (không giải nén khối nào)"""
+    with open(path, "rb") as f:
+        return _read_index(f)
+
+
+def _read_index(f):
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    if size < len(MAGIC) + _FOOTER.size:
+        raise ValueError("Archive hỏng: file quá ngắn")
+    f.seek(size - _FOOTER.size)
+    length, magic = _FOOTER.unpack(f.read(_FOOTER.size))
+    if magic != MAGIC or length > size:
+        raise ValueError("Archive hỏng: sai footer")
+    f.seek(size - _FOOTER.size - length)
+    index = json.loads(f.read(length))
+    index["index_offset"] = size - _FOOTER.size - length
+    return index
+
+
+def _write_tail(f, offset, chunks, index, arrays, chunk_rows):
+    """Ghi các khối của arrays từ offset, rồi chỉ mục + footer"""
+    f.seek(offset)
+    for start in range(0, len(arrays["open_time"]), chunk_rows):
+        data, meta = encode_chunk({col: arrays[col][start:start + chunk_rows] for col in COLUMNS})
+        meta["offset"], meta["length"] = f.tell(), len(data)
+        f.write(data)
+        chunks.append(meta)
+
+    index = {key: value for key, value in index.items() if key != "index_offset"}
+    index["chunks"] = chunks
+    index["rows"] = sum(chunk["rows"] for chunk in chunks)
+    payload = json.dumps(index, separators=(",", ":")).encode()
+    f.write(payload)
+    f.write(_FOOTER.pack(len(payload), MAGIC))
+    f.truncate()
+
+
+def write_archive(path, arrays, symbol=None, interval=None, chunk_rows=CHUNK_ROWS):
+    """Ghi mới toàn bộ (nến sắp theo open_time tăng dần)"""
+    index = {"version": 1, "symbol": symbol, "interval": interval, "chunk_rows": chunk_rows}
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        _write_tail(f, len(MAGIC), [], index, arrays, chunk_rows)
+    os.replace(tmp, path)
+
+
+def append_archive(path, arrays, symbol=None, interval=None):
+    """Thêm nến mới hơn nến cuối trong archive (tạo file nếu chưa có) - trả về số nến đã thêm"""
+    if not os.path.exists(path):
+        write_archive(path, arrays, symbol, interval)
+        return len(arrays["open_time"])
+
+    last_open_time = (read_index(path)["chunks"] or [{"last": None}])[-1]["last"]
+    if last_open_time is not None:
+        newer = arrays["open_time"] > last_open_time
+        arrays = {col: arrays[col][newer] for col in COLUMNS}
+    added = len(arrays["open_time"])
+    if added == 0:
+        return 0
+
+    tmp = path + ".tmp"
+    shutil.copyfile(path, tmp)
+    try:
+        with open(tmp, "r+b") as f:
+            index = _read_index(f)
+            chunks = index["chunks"]
+
+            # Khối cuối chưa đầy → giải mã, ghép nến mới, ghi lại từ vị trí khối đó
+            offset = index["index_offset"]
+            if chunks and chunks[-1]["rows"] < index["chunk_rows"]:
+                last = chunks.pop()
+                f.seek(last["offset"])
+                arrays = _concat([decode_chunk(f.read(last["length"]), last), arrays])
+                offset = last["offset"]
+            _write_tail(f, offset, chunks, index, arrays, index["chunk_rows"])
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return added
+
+
+def read_archive(path, start_ms=None, end_ms=None):
+    """Nến có open_time trong [start_ms, end_ms] → dict cột NumPy (chỉ đọc các khối cần)"""
+    with open(path, "rb") as f:
+        index = _read_index(f)
+        parts = []
+        for chunk in index["chunks"]:
+            if (start_ms is not None and chunk["last"] < start_ms) or (end_ms is not None and chunk["first"] > end_ms):
+                continue
+            f.seek(chunk["offset"])
+            parts.append(decode_chunk(f.read(chunk["length"]), chunk))
+
+    arrays = _concat(parts)
+    keep = np.ones(len(arrays["open_time"]), dtype=bool)
+    if start_ms is not None:
+        keep &= arrays["open_time"] >= start_ms
+    if end_ms is not None:
+        keep &= arrays["open_time"] <= end_ms
+    return {col: arrays[col][keep] for col in COLUMNS}
+
+
+# ========== CLI ==========
+def convert_npz(history_dir):
+    """Chuyển mọi cache .npz (định dạng cũ của backtest_engine) trong thư mục sang archive"""
+    rows = []
+    for name in sorted(os.listdir(history_dir)):
+        if not name.endswith(".npz"):
+            continue
+        npz_path = os.path.join(history_dir, name)
+        with np.load(npz_path) as f:
+            arrays = {col: f[col] for col in COLUMNS}
+        symbol, _, interval = name[:-len(".npz")].rpartition("_")
+        path = npz_path[:-len(".npz")] + ARCHIVE_EXT
+        write_archive(path, arrays, symbol, interval)
+
+        decoded = read_archive(path)
+        exact = all(np.array_equal(decoded[col], arrays[col]) for col in COLUMNS)
+        rows.append([name, len(arrays["open_time"]), os.path.getsize(npz_path), os.path.getsize(path),
+                     f"{os.path.getsize(npz_path) / max(os.path.getsize(path), 1):.1f}×", "✅" if exact else "❌"])
+    return rows
+
+
+def main():
+    if len(sys.argv) >= 2 and sys.argv[1] == "convert":
+        history_dir = sys.argv[2] if len(sys.argv) > 2 else "history"
+        rows = convert_npz(history_dir)
+        if not rows:
+            print(f"❌ Không có file .npz trong {history_dir}")
+            return
+        print(tabulate(rows, headers=["File", "Nến", ".npz (bytes)", ".dka (bytes)", "Nhỏ hơn", "Khớp"],
+                       tablefmt="grid"))
+        print("\n💡 File .npz cũ giữ nguyên - xóa khi đã kiểm tra xong")
+        return
+
+    if len(sys.argv) >= 3 and sys.argv[1] == "info":
+        index = read_index(sys.argv[2])
+        print(f"📦 {index['symbol']} {index['interval']}: {index['rows']} nến, {len(index['chunks'])} khối")
+        table = [[i, chunk["rows"], chunk["first"], chunk["last"], chunk["length"],
+                  chunk["decimals"]["open"], chunk["decimals"]["volume"], " ".join(chunk["dtypes"])]
+                 for i, chunk in enumerate(index["chunks"])]
+        print(tabulate(table, headers=["#", "Nến", "Open đầu", "Open cuối", "Bytes", "Giá 10^-d", "Vol 10^-d",
+                                       "Kiểu cột"], tablefmt="grid"))
+        return
+
+    print("📝 Cú pháp: python kline_archive.py convert [thư mục] | info <file.dka>")
+
+
+if __name__ == "__main__":
+    main()
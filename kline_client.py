@@ -0,0 +1,230 @@
+"""
+Kline Client - Lớp lấy dữ liệu nến dùng chung cho detector, SR calculator và lệnh bot
+- Single-flight: nhiều request giống nhau (symbol, interval, limit) cùng lúc chỉ gọi API 1 lần
+- Cache ngắn hạn: key theo close_time của nến đã đóng gần nhất, tự hết hạn khi sang nến mới
+- Gọi sàn qua adapter (exchanges.py): 1 client mỗi sàn, xem get_client
+"""
+import asyncio
+import threading
+from typing import Dict, List, Optional, Tuple
+from clock import RealClock
+from exchanges import EXCHANGE, ExchangeAdapter, BinanceSpotExchange, create_exchange
+
+# Độ dài nến (ms) - chỉ các khung căn theo epoch UTC
+INTERVAL_MS = {
+    "1m": 60 * 1000,
+    "3m": 3 * 60 * 1000,
+    "5m": 5 * 60 * 1000,
+    "15m": 15 * 60 * 1000,
+    "30m": 30 * 60 * 1000,
+    "1h": 60 * 60 * 1000,
+    "2h": 2 * 60 * 60 * 1000,
+    "4h": 4 * 60 * 60 * 1000,
+    "6h": 6 * 60 * 60 * 1000,
+    "8h": 8 * 60 * 60 * 1000,
+    "12h": 12 * 60 * 60 * 1000,
+    "1d": 24 * 60 * 60 * 1000
+}
+
+
+def last_closed_close_time(interval: str, now_ms: int) -> Optional[int]:
+    """close_time của nến đã đóng gần nhất tại thời điểm now_ms (None nếu không rõ interval)"""
+    step = INTERVAL_MS.get(interval)
+    if step is None:
+        return None
+    return (now_ms // step) * step - 1
+
+
+def rows_to_candles(rows: List[list]) -> List[Dict]:
+    """Chuyển raw rows của Binance sang list dict như detector đang dùng"""
+    candles = []
+    for candle in rows:
+        candles.append({
+            "open_time": candle[0],
+            "open": float(candle[1]),
+            "high": float(candle[2]),
+            "low": float(candle[3]),
+            "close": float(candle[4]),
+            "volume": float(candle[5]),
+            "close_time": candle[6]
+        })
+    return candles
+
+
+class _Flight:
+    """Một request đang chạy - các caller trùng key chờ chung kết quả"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class KlineClient:
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        cache_ttl: float = 5.0,
+        timeout: int = 10,
+        max_cache_size: int = 2000,
+        clock=None,
+        exchange: Optional[ExchangeAdapter] = None
+    ):
+        """url: URL klines Binance spot (vd. mock server) - bỏ qua nếu truyền exchange"""
+        self.clock = clock or RealClock()
+        self.exchange = exchange or BinanceSpotExchange(url=url, clock=self.clock, timeout=timeout)
+        self.url = self.exchange.url
+        self.cache_ttl = cache_ttl
+        self.max_cache_size = max_cache_size
+
+        self._lock = threading.Lock()
+        self._inflight: Dict[Tuple, _Flight] = {}
+        self._tasks: Dict[Tuple, asyncio.Future] = {}
+        # (symbol, interval) -> (boundary, fetched_at, rows)
+        self._cache: Dict[Tuple[str, str], Tuple[Optional[int], float, List[list]]] = {}
+
+        self._stats = {"cache_hits": 0, "coalesced": 0}
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Số liệu cache của client + request / rate limit của adapter"""
+        return {**self.exchange.stats, **self._stats}
+
+    def _request(self, symbol: str, interval: str, limit: int, **extra) -> List[list]:
+        """Gọi sàn qua adapter (không cache)"""
+        return self.exchange.klines(symbol, interval, limit, **extra)
+
+    def _get_cached(self, symbol: str, interval: str, limit: int) -> Optional[List[list]]:
+        """Lấy từ cache nếu còn hạn và cùng nến đã đóng (gọi khi đang giữ lock)"""
+        entry = self._cache.get((symbol, interval))
+        if entry is None:
+            return None
+
+        boundary, fetched_at, rows = entry
+        now = self.clock.time()
+        if now - fetched_at > self.cache_ttl:
+            return None
+        if boundary != last_closed_close_time(interval, int(now * 1000)):
+            return None
+        if len(rows) < limit:
+            return None
+        return rows[-limit:]
+
+    def _store(self, symbol: str, interval: str, rows: List[list], fetched_at: float):
+        boundary = last_closed_close_time(interval, int(fetched_at * 1000))
+        with self._lock:
+            self._cache.pop((symbol, interval), None)
+            self._cache[(symbol, interval)] = (boundary, fetched_at, rows)
+
+            # Giới hạn cache - bỏ entry cũ nhất
+            while len(self._cache) > self.max_cache_size:
+                del self._cache[next(iter(self._cache))]
+
+    def export_cache(self, max_rows: Optional[int] = None) -> List[list]:
+        """Cache hiện tại dạng list JSON được: [symbol, interval, boundary, fetched_at, rows] (cho snapshot)"""
+        with self._lock:
+            entries = list(self._cache.items())
+        return [[symbol, interval, boundary, fetched_at, rows[-max_rows:] if max_rows else rows]
+                for (symbol, interval), (boundary, fetched_at, rows) in entries]
+
+    def import_cache(self, entries: List[list]):
+        """Nạp lại cache từ export_cache - entry hết hạn tự bị bỏ qua khi tra cứu"""
+        with self._lock:
+            for symbol, interval, boundary, fetched_at, rows in entries:
+                self._cache[(symbol, interval)] = (boundary, fetched_at, rows)
+            while len(self._cache) > self.max_cache_size:
+                del self._cache[next(iter(self._cache))]
+
+    def get_klines(self, symbol: str, interval: str, limit: int = 500) -> List[list]:
+        """
+        Lấy raw klines (list of list như Binance trả về)
+        Raise exception nếu lỗi - caller tự xử lý như trước
+        """
+        key = (symbol, interval, limit)
+
+        with self._lock:
+            rows = self._get_cached(symbol, interval, limit)
+            if rows is not None:
+                self._stats["cache_hits"] += 1
+                return rows
+
+            flight = self._inflight.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = _Flight()
+                self._inflight[key] = flight
+            else:
+                self._stats["coalesced"] += 1
+
+        # Request trùng đang chạy - chờ kết quả chung
+        if not is_leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            fetched_at = self.clock.time()
+            rows = self._request(symbol, interval, limit)
+            self._store(symbol, interval, rows, fetched_at)
+            flight.result = rows
+            return rows
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.event.set()
+
+    def get_klines_range(
+        self,
+        symbol: str,
+        interval: str,
+        start_time: int,
+        end_time: Optional[int] = None,
+        page_size: Optional[int] = None
+    ) -> List[list]:
+        """Lấy klines từ start_time đến end_time (phân trang theo giới hạn của sàn, không cache)"""
+        return self.exchange.klines_range(symbol, interval, start_time, end_time, page_size)
+
+    async def fetch_klines(self, symbol: str, interval: str, limit: int = 500) -> List[list]:
+        """
+        Bản async của get_klines: chạy HTTP trong thread để không chặn event loop,
+        các coroutine trùng key await chung 1 future
+        """
+        key = (symbol, interval, limit)
+
+        with self._lock:
+            rows = self._get_cached(symbol, interval, limit)
+            if rows is not None:
+                self._stats["cache_hits"] += 1
+                return rows
+
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(asyncio.to_thread(self.get_klines, symbol, interval, limit))
+            self._tasks[key] = task
+            task.add_done_callback(lambda _, key=key: self._tasks.pop(key, None))
+        else:
+            self._stats["coalesced"] += 1
+
+        # shield: 1 caller bị cancel không làm hủy request của các caller khác
+        return await asyncio.shield(task)
+
+
+_clients: Dict[str, KlineClient] = {}
+
+
+def get_client(exchange: str = EXCHANGE) -> KlineClient:
+    """Client dùng chung trong process cho 1 sàn (mọi thành phần quét sàn đó chia sẻ cache + pool)"""
+    client = _clients.get(exchange)
+    if client is None:
+        client = _clients[exchange] = KlineClient(exchange=create_exchange(exchange))
+    return client
+
+
+def get_default_client() -> KlineClient:
+    """Client của sàn mặc định (EXCHANGE) - detector + SR calculator chia sẻ cache"""
+    return get_client()
@@ -0,0 +1,122 @@
+"""
+Load Test - Đo khả năng mở rộng của scanner, SR calculator và backtest lên 1000+ symbols
+Chạy hoàn toàn trên MockBinanceServer (dữ liệu tổng hợp) - không gọi sàn thật
+"""
+import time
+import asyncio
+import tempfile
+import numpy as np
+from tabulate import tabulate
+from clock import SimulatedClock
+from kline_client import KlineClient, INTERVAL_MS
+from detector import DojiDetector
+from sr_calculator import SupportResistanceCalculator
+from mock_binance import MockBinanceServer, SyntheticKlines, synthetic_symbols
+from backtest_engine import load_history, backtest_arrays
+
+# ========== CẤU HÌNH ==========
+SCAN_SYMBOLS = [100, 500, 1000]   # Số symbols cho mỗi lượt đo scanner
+SR_SYMBOLS = 20
+BACKTEST_SYMBOLS = 50
+BACKTEST_DAYS = 365
+SPEED = 100.0                     # Tăng tốc đồng hồ (rút ngắn khoảng nghỉ 0.3s giữa các request)
+LATENCY_MS = 20.0
+JITTER_MS = 30.0
+ERROR_RATE = 0.01
+
+
+async def measure_scan(symbol_count):
+    """1 lượt scan_symbols ngay sau khi nến 1d đóng (mọi khung đều phải đánh giá)"""
+    symbols = synthetic_symbols(symbol_count)
+    day_ms = INTERVAL_MS["1d"]
+    start_ms = (int(time.time() * 1000) // day_ms) * day_ms + 15 * 1000
+    clock = SimulatedClock(start_ms / 1000, SPEED)
+
+    with MockBinanceServer(SyntheticKlines(symbols), clock, latency_ms=LATENCY_MS,
+                           jitter_ms=JITTER_MS, error_rate=ERROR_RATE) as server:
+        client = KlineClient(url=server.klines_url, clock=clock)
+        detector = DojiDetector(kline_client=client, clock=clock)
+
+        real_started = time.perf_counter()
+        signals = await detector.scan_symbols(symbols)
+        real_elapsed = time.perf_counter() - real_started
+        sim_elapsed = clock.time() - start_ms / 1000
+
+        return {
+            "symbols": symbol_count,
+            "pairs": symbol_count * len(detector.timeframes),
+            "sim_seconds": sim_elapsed,
+            "real_seconds": real_elapsed,
+            "signals": len(signals),
+            "requests": server.request_count,
+            "rate_limited": server.rate_limited_count,
+            "used_weight": client.stats["used_weight"]
+        }
+
+
+def measure_sr():
+    """Thời gian tính S/R cho mỗi symbol (limit 500 nến)"""
+    symbols = synthetic_symbols(SR_SYMBOLS)
+    with MockBinanceServer(SyntheticKlines(symbols)) as server:
+        calculator = SupportResistanceCalculator(kline_client=KlineClient(url=server.klines_url))
+        durations = []
+        for symbol in symbols:
+            started = time.perf_counter()
+            calculator.calculate_sr_levels(symbol, "1h")
+            durations.append(time.perf_counter() - started)
+    return np.array(durations)
+
+
+def measure_backtest():
+    """Tải lịch sử + backtest vectorized cho BACKTEST_SYMBOLS symbols × 4 khung"""
+    symbols = synthetic_symbols(BACKTEST_SYMBOLS)
+    timeframes = ["1h", "2h", "4h", "1d"]
+    with MockBinanceServer(SyntheticKlines(symbols)) as server, tempfile.TemporaryDirectory() as history_dir:
+        client = KlineClient(url=server.klines_url)
+
+        started = time.perf_counter()
+        histories = {
+            (symbol, tf): load_history(symbol, tf, BACKTEST_DAYS, history_dir, client)
+            for symbol in symbols for tf in timeframes
+        }
+        load_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        trades = sum(backtest_arrays(arrays, tf)[1]["trades"] for (_, tf), arrays in histories.items())
+        eval_seconds = time.perf_counter() - started
+
+    bars = sum(len(arrays["close"]) for arrays in histories.values())
+    return {"pairs": len(histories), "bars": bars, "trades": trades,
+            "load_seconds": load_seconds, "eval_seconds": eval_seconds, "requests": server.request_count}
+
+
+def main():
+    print("\n" + "="*80)
+    print("🏋️ LOAD TEST - MOCK BINANCE")
+    print("="*80)
+    print(f"\n⚙️ Độ trễ {LATENCY_MS}+{JITTER_MS}ms, lỗi 429 {ERROR_RATE * 100:.0f}%, đồng hồ ×{SPEED:.0f}")
+
+    print("\n🔍 Scanner (1 lượt ngay sau khi nến đóng):\n")
+    table = []
+    for count in SCAN_SYMBOLS:
+        r = asyncio.run(measure_scan(count))
+        table.append([r["symbols"], r["pairs"], f"{r['sim_seconds']:.0f}s", f"{r['real_seconds']:.1f}s",
+                      r["signals"], r["requests"], r["rate_limited"], r["used_weight"]])
+    print(tabulate(table, headers=["Symbols", "Cặp", "Thời gian (mô phỏng)", "Thời gian thật",
+                                   "Tín hiệu", "Request", "429", "Weight/phút"], tablefmt="grid"))
+
+    durations = measure_sr()
+    print(f"\n🧱 SR calculator: {len(durations)} symbols, trung bình {durations.mean() * 1000:.0f}ms/symbol, "
+          f"max {durations.max() * 1000:.0f}ms → ước tính {durations.mean() * 1000 * 4:.0f}s cho 1000 symbols × 4 khung")
+
+    r = measure_backtest()
+    print(f"\n📊 Backtest: {r['pairs']} cặp, {r['bars']} nến, {r['trades']} lệnh")
+    print(f"   • Tải lịch sử: {r['load_seconds']:.1f}s ({r['requests']} request)")
+    print(f"   • Đánh giá: {r['eval_seconds']:.2f}s")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n\n⛔ Đã dừng!")
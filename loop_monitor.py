@@ -0,0 +1,120 @@
+"""
+Loop Monitor - Đo độ trễ lập lịch của event loop và bắt các callback chặn loop
+- Probe (coroutine trên loop): ngủ `interval` giây, độ trễ = thời gian thức dậy thực tế - dự kiến
+- Watchdog (thread riêng): nếu loop không "đập nhịp" quá interval + slow_threshold
+  → chụp stack của thread đang chạy loop (sys._current_frames) để biết code nào đang chặn
+- Percentile độ trễ hiển thị ở /status và metrics.py
+"""
+import sys
+import time
+import asyncio
+import threading
+import traceback
+from collections import deque
+import metrics
+
+LAG_INTERVAL = 0.25        # Chu kỳ probe (giây)
+SLOW_THRESHOLD = 0.1       # Chặn loop lâu hơn mức này → ghi nhận slow callback (giây)
+LAG_WINDOW = 2400          # Số mẫu giữ lại để tính percentile (~10 phút với interval 0.25s)
+MAX_SLOW_SAMPLES = 20      # Số slow callback gần nhất giữ lại (kèm stack)
+
+
+def percentile(sorted_values, q):
+    """Percentile q (0-100) của list đã sắp xếp (nội suy tuyến tính như numpy)"""
+    if not sorted_values:
+        return 0.0
+    pos = (len(sorted_values) - 1) * q / 100
+    lower = int(pos)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (pos - lower)
+
+
+class LoopLagMonitor:
+
+    def __init__(self, interval=LAG_INTERVAL, slow_threshold=SLOW_THRESHOLD, window=LAG_WINDOW):
+        self.interval = interval
+        self.slow_threshold = slow_threshold
+        self.lags = deque(maxlen=window)
+        self.slow_callbacks = deque(maxlen=MAX_SLOW_SAMPLES)
+        self.slow_count = 0
+
+        self._beat = time.monotonic()
+        self._loop_thread_id = None
+        self._task = None
+        self._watchdog = None
+        self._stopping = threading.Event()
+        self._current_stall = None
+
+    def start(self):
+        """Gọi từ trong event loop đang chạy"""
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._probe())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+        return self
+
+    def stop(self):
+        self._stopping.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _probe(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.lags.append(max(0.0, now - expected))
+            self._beat = now
+
+    def _watch(self):
+        """Thread watchdog: chụp stack của loop khi loop bị chặn"""
+        while not self._stopping.wait(self.slow_threshold / 2):
+            stalled = time.monotonic() - self._beat - self.interval
+            beat = self._beat
+
+            if stalled < self.slow_threshold:
+                self._current_stall = None
+                continue
+
+            # Cùng 1 lần chặn: chỉ cập nhật thời lượng, không chụp stack lại
+            if self._current_stall is not None and self._current_stall["beat"] == beat:
+                self._current_stall["duration"] = stalled
+                continue
+
+            frame = sys._current_frames().get(self._loop_thread_id)
+            self._current_stall = {
+                "beat": beat,
+                "time": time.time(),
+                "duration": stalled,
+                "stack": traceback.format_stack(frame) if frame is not None else []
+            }
+            self.slow_callbacks.append(self._current_stall)
+            self.slow_count += 1
+
+    def stats(self):
+        """Percentile độ trễ (giây) trên cửa sổ gần nhất + số slow callback"""
+        lags = sorted(self.lags)
+        return {
+            "samples": len(lags),
+            "p50": percentile(lags, 50),
+            "p95": percentile(lags, 95),
+            "p99": percentile(lags, 99),
+            "max": lags[-1] if lags else 0.0,
+            "slow_callbacks": self.slow_count
+        }
+
+    def last_slow_location(self):
+        """'file:line (hàm)' của frame trong cùng của slow callback gần nhất"""
+        if not self.slow_callbacks or not self.slow_callbacks[-1]["stack"]:
+            return None
+        # Dòng đầu của mỗi entry: '  File "...", line N, in func'
+        return self.slow_callbacks[-1]["stack"][-1].strip().splitlines()[0]
+
+    def register_metrics(self, prefix="bot_loop"):
+        for name in ["p50", "p95", "p99", "max"]:
+            metrics.register(f"{prefix}_lag_{name}_seconds", lambda name=name: self.stats()[name],
+                             f"Event loop scheduling lag {name}")
+        metrics.register(f"{prefix}_slow_callbacks_total", lambda: self.slow_count,
+                         f"Callbacks blocking the loop longer than {self.slow_threshold}s", metric_type=metrics.COUNTER)
+        return self
@@ -0,0 +1,91 @@
+"""
+Metrics - Số liệu vận hành của bot (định dạng text của Prometheus)
+- register(name, collect, help_text, labels, metric_type): collect() trả về giá trị hiện tại,
+  chỉ được gọi khi đọc metrics
+  labels (vd. {"venue": "binance"}): cùng tên khác nhãn là các series riêng
+  metric_type: GAUGE (mặc định) hoặc COUNTER (giá trị chỉ tăng, vd. *_total)
+- start_metrics_server(port): phục vụ GET /metrics bằng http.server trong thread riêng (bật bằng METRICS_PORT)
+"""
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_PORT = os.getenv("METRICS_PORT")
+GAUGE = "gauge"
+COUNTER = "counter"
+
+_collectors = {}
+_lock = threading.Lock()
+
+
+def series_name(name, labels=None):
+    """Tên series kèm nhãn: bot_kline_requests{venue="binance"}"""
+    if not labels:
+        return name
+    return name + "{" + ",".join(f'{key}="{value}"' for key, value in sorted(labels.items())) + "}"
+
+
+def register(name, collect, help_text="", labels=None, metric_type=GAUGE):
+    """Đăng ký 1 metric (đăng ký lại cùng tên và nhãn sẽ thay thế)"""
+    with _lock:
+        _collectors[series_name(name, labels)] = (name, collect, help_text, metric_type)
+
+
+def collect():
+    """{series: giá trị} của mọi metric - metric lỗi khi đọc bị bỏ qua"""
+    with _lock:
+        collectors = list(_collectors.items())
+    values = {}
+    for series, (_, fn, _, _) in collectors:
+        try:
+            values[series] = float(fn())
+        except Exception:
+            continue
+    return values
+
+
+def render():
+    """Text exposition format của Prometheus (các series cùng tên liền nhau, HELP/TYPE 1 lần)"""
+    with _lock:
+        info = {series: (name, help_text, metric_type)
+                for series, (name, _, help_text, metric_type) in _collectors.items()}
+    grouped = {}
+    for series, value in collect().items():
+        if series not in info:  # Vừa đăng ký trong lúc đọc → lần sau
+            continue
+        grouped.setdefault(info[series][0], []).append((series, value))
+
+    lines = []
+    for name, samples in grouped.items():
+        _, help_text, metric_type = info[samples[0][0]]
+        if help_text:
+            lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for series, value in samples:
+            lines.append(f"{series} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_metrics_server(port, host="0.0.0.0"):
+    """Chạy HTTP server /metrics trong daemon thread, trả về server (gọi .shutdown() để dừng)"""
+    server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,496 @@
+"""
+Mock Binance - Server giả lập Binance chạy local cho replay và load test
+- REST: /api/v3/klines (spot) và /fapi/v1/klines (futures) (symbol, interval, limit, startTime, endTime)
+  + header X-MBX-USED-WEIGHT-1M
+- WebSocket: /ws/<symbol>@kline_<interval> và /stream?streams=a/b/... (định dạng event như Binance)
+- Nguồn dữ liệu: nến đã ghi (RecordedKlines) hoặc sinh tổng hợp cho hàng nghìn symbols (SyntheticKlines)
+- Giả lập sự cố: độ trễ, lỗi 429 ngẫu nhiên, vượt giới hạn weight/phút
+Mọi thời gian theo 1 clock → dùng được với SimulatedClock
+"""
+import json
+import time
+import zlib
+import base64
+import random
+import hashlib
+import argparse
+import threading
+import numpy as np
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from clock import RealClock
+from kline_client import INTERVAL_MS
+from exchanges import BinanceSpotExchange, BinanceFuturesExchange
+
+MAX_LIMIT = 1000
+KLINES_PATHS = {"/api/v3/klines": BinanceSpotExchange, "/fapi/v1/klines": BinanceFuturesExchange}  # Endpoint → sàn (limit tối đa, weight)
+WEIGHT_LIMIT = 6000          # Weight tối đa mỗi phút (như Binance spot)
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+COLUMNS = ["open_time", "open", "high", "low", "close", "volume", "close_time"]
+
+
+# ========== NGUỒN DỮ LIỆU ==========
+class RecordedKlines:
+    """Nến đã ghi: {(symbol, interval): dict cột NumPy} (như backtest_engine.load_history)"""
+
+    def __init__(self, klines):
+        self.klines = klines
+
+    def symbols(self):
+        return sorted({symbol for symbol, _ in self.klines})
+
+    def get(self, symbol, interval, limit, start_time, end_time, now_ms):
+        arrays = self.klines.get((symbol, interval))
+        if arrays is None:
+            return None
+
+        open_time = arrays["open_time"]
+        end = np.searchsorted(open_time, now_ms, side="right")
+        if end_time is not None:
+            end = min(end, np.searchsorted(open_time, end_time, side="right"))
+
+        if start_time is not None:
+            start = np.searchsorted(open_time, start_time, side="left")
+            end = min(end, start + limit)
+        else:
+            start = max(0, end - limit)
+
+        return {col: arrays[col][start:end] for col in COLUMNS}
+
+
+def _hash_uniform(seed, idx):
+    """Số ngẫu nhiên [0, 1) xác định theo (seed, idx) - không cần lưu trạng thái (splitmix64)"""
+    x = (idx.astype(np.uint64) + np.uint64(seed)) * np.uint64(0x9E3779B97F4A7C15)
+    x ^= x >> np.uint64(30)
+    x *= np.uint64(0xBF58476D1CE4E5B9)
+    x ^= x >> np.uint64(27)
+    x *= np.uint64(0x94D049BB133111EB)
+    x ^= x >> np.uint64(31)
+    return (x >> np.uint64(11)).astype(float) / float(1 << 53)
+
+
+class SyntheticKlines:
+    """
+    Nến tổng hợp xác định (cùng symbol/interval/thời điểm luôn ra cùng giá trị)
+    Mỗi nến tính độc lập theo chỉ số → phục vụ bất kỳ khoảng thời gian nào mà không cần bộ nhớ
+    """
+
+    def __init__(self, symbols=None, doji_rate=0.03):
+        self._symbols = list(symbols) if symbols is not None else None
+        self._symbol_set = set(self._symbols) if self._symbols is not None else None
+        self.doji_rate = doji_rate
+
+    def symbols(self):
+        return list(self._symbols or [])
+
+    def _level(self, seed, idx):
+        """Giá tại đầu nến idx: sóng chậm + sóng nhanh + nhiễu"""
+        base = 1 + seed % 1000
+        slow = 2 * np.pi * idx / (200 + seed % 300) + seed % 7
+        fast = 2 * np.pi * idx / (37 + seed % 50) + seed % 11
+        noise = _hash_uniform(seed, idx) - 0.5
+        return base * np.exp(0.15 * np.sin(slow) + 0.03 * np.sin(fast) + 0.01 * noise)
+
+    def arrays(self, symbol, interval, first_idx, last_idx):
+        """Nến có chỉ số (open_time // step) trong [first_idx, last_idx)"""
+        step = INTERVAL_MS[interval]
+        seed = zlib.crc32(f"{symbol}_{interval}".encode())
+        idx = np.arange(first_idx, last_idx, dtype=np.int64)
+
+        o = self._level(seed, idx)
+        c = self._level(seed, idx + 1)
+
+        # Một phần nến là Doji (close ≈ open) để có tín hiệu khi load test
+        is_doji = _hash_uniform(seed + 1, idx) < self.doji_rate
+        c = np.where(is_doji, o * (1 + 0.0002 * (_hash_uniform(seed + 2, idx) - 0.5)), c)
+
+        spread = np.abs(c - o) + o * 0.004
+        h = np.maximum(o, c) + spread * _hash_uniform(seed + 3, idx)
+        l = np.minimum(o, c) - spread * _hash_uniform(seed + 4, idx)
+        v = (1000 + seed % 5000) * (0.3 + 1.4 * _hash_uniform(seed + 5, idx))
+
+        open_time = idx * step
+        return {
+            "open_time": open_time, "open": o, "high": h, "low": l, "close": c,
+            "volume": v, "close_time": open_time + step - 1
+        }
+
+    def get(self, symbol, interval, limit, start_time, end_time, now_ms):
+        if interval not in INTERVAL_MS:
+            return None
+        if self._symbol_set is not None and symbol not in self._symbol_set:
+            return None
+        if self._symbol_set is None and not symbol.endswith("USDT"):
+            return None
+
+        step = INTERVAL_MS[interval]
+        last = now_ms // step + 1  # Bao gồm nến đang hình thành
+        if end_time is not None:
+            last = min(last, end_time // step + 1)
+
+        if start_time is not None:
+            first = -(-start_time // step)
+            last = min(last, first + limit)
+        else:
+            first = last - limit
+
+        return self.arrays(symbol, interval, first, max(first, last))
+
+
+def _partial_candle(arrays, i, now_ms):
+    """Giá trị nến i tại thời điểm now_ms khi nến chưa đóng (nội suy từ giá trị cuối)"""
+    o, h, l, c, v = (float(arrays[col][i]) for col in ["open", "high", "low", "close", "volume"])
+    open_time, close_time = int(arrays["open_time"][i]), int(arrays["close_time"][i])
+    if now_ms >= close_time:
+        return o, h, l, c, v, True
+
+    progress = max(0.0, min(1.0, (now_ms - open_time) / (close_time + 1 - open_time)))
+    close = o + (c - o) * progress
+    high = max(o, close) + (h - max(o, c)) * progress
+    low = min(o, close) - (min(o, c) - l) * progress
+    return o, high, low, close, v * progress, False
+
+
+# ========== WEBSOCKET ==========
+def _ws_frame(payload: bytes, opcode: int = 0x1) -> bytes:
+    """Frame server → client (không mask)"""
+    header = bytearray([0x80 | opcode])
+    size = len(payload)
+    if size < 126:
+        header.append(size)
+    elif size < 65536:
+        header.append(126)
+        header += size.to_bytes(2, "big")
+    else:
+        header.append(127)
+        header += size.to_bytes(8, "big")
+    return bytes(header) + payload
+
+
+def _read_ws_frame(rfile):
+    """Đọc 1 frame client → server, trả về (opcode, payload) hoặc None khi mất kết nối"""
+    head = rfile.read(2)
+    if len(head) < 2:
+        return None
+
+    opcode = head[0] & 0x0F
+    masked = head[1] & 0x80
+    size = head[1] & 0x7F
+    if size == 126:
+        size = int.from_bytes(rfile.read(2), "big")
+    elif size == 127:
+        size = int.from_bytes(rfile.read(8), "big")
+
+    mask = rfile.read(4) if masked else b""
+    data = rfile.read(size)
+    if masked:
+        data = bytes(b ^ mask[i % 4] for i, b in enumerate(data))
+    return opcode, data
+
+
+def _parse_stream(name):
+    """'btcusdt@kline_1h' → ('BTCUSDT', '1h')"""
+    symbol, _, kind = name.partition("@")
+    if not kind.startswith("kline_"):
+        return None
+    return symbol.upper(), kind[len("kline_"):]
+
+
+# ========== SERVER ==========
+class MockBinanceServer:
+
+    def __init__(
+        self,
+        klines=None,
+        clock=None,
+        host="127.0.0.1",
+        port=0,
+        latency_ms=0.0,
+        jitter_ms=0.0,
+        error_rate=0.0,
+        weight_limit=WEIGHT_LIMIT,
+        stream_interval=1.0,
+        seed=0
+    ):
+        """
+        klines: dict {(symbol, interval): dict cột NumPy}, hoặc RecordedKlines/SyntheticKlines
+        latency_ms/jitter_ms: độ trễ thêm vào mỗi request REST (ms thật)
+        error_rate: tỉ lệ request bị trả 429 ngẫu nhiên
+        stream_interval: chu kỳ gửi event kline qua WebSocket (giây thật)
+        """
+        if klines is None:
+            klines = SyntheticKlines()
+        self.source = RecordedKlines(klines) if isinstance(klines, dict) else klines
+        self.clock = clock or RealClock()
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.weight_limit = weight_limit
+        self.stream_interval = stream_interval
+        self._random = random.Random(seed)
+
+        self.request_count = 0
+        self.requests_by_key = {}
+        self.rate_limited_count = 0
+        self.ws_connections = 0
+        self.events_sent = 0
+        self._weight_minute = None
+        self._used_weight = 0
+
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def klines_url(self):
+        return f"{self.base_url}/api/v3/klines"
+
+    @property
+    def ws_url(self):
+        return self.base_url.replace("http://", "ws://")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopping.set()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def get_rows(self, symbol, interval, limit=500, start_time=None, end_time=None, max_limit=MAX_LIMIT):
+        """Rows định dạng Binance cho các nến đã mở tại thời điểm clock hiện tại"""
+        now_ms = int(self.clock.time() * 1000)
+        arrays = self.source.get(symbol, interval, min(limit, max_limit), start_time, end_time, now_ms)
+        if arrays is None:
+            return None
+
+        rows = []
+        for i in range(len(arrays["open_time"])):
+            o, h, l, c, v, _ = _partial_candle(arrays, i, now_ms)
+            rows.append([int(arrays["open_time"][i]), repr(o), repr(h), repr(l), repr(c), repr(v),
+                         int(arrays["close_time"][i]), "0", 0, "0", "0", "0"])
+        return rows
+
+    def kline_event(self, symbol, interval, now_ms):
+        """Event kline (định dạng Binance) của nến đang hình thành tại now_ms"""
+        arrays = self.source.get(symbol, interval, 1, None, None, now_ms)
+        if arrays is None or len(arrays["open_time"]) == 0:
+            return None
+
+        o, h, l, c, v, closed = _partial_candle(arrays, 0, now_ms)
+        return {
+            "e": "kline", "E": now_ms, "s": symbol,
+            "k": {
+                "t": int(arrays["open_time"][0]), "T": int(arrays["close_time"][0]),
+                "s": symbol, "i": interval,
+                "o": repr(o), "h": repr(h), "l": repr(l), "c": repr(c), "v": repr(v),
+                "x": closed
+            }
+        }
+
+    def _use_weight(self, weight):
+        """Cộng weight vào phút hiện tại, trả về (weight đã dùng, giây đến phút sau nếu vượt giới hạn)"""
+        now = self.clock.time()
+        minute = int(now // 60)
+        with self._lock:
+            if minute != self._weight_minute:
+                self._weight_minute = minute
+                self._used_weight = 0
+            self._used_weight += weight
+            used = self._used_weight
+
+        if used > self.weight_limit:
+            return used, max(1, int(60 - now % 60))
+        return used, None
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+
+                if self.headers.get("Upgrade", "").lower() == "websocket":
+                    if url.path.startswith("/ws/"):
+                        return self._stream([url.path[len("/ws/"):]])
+                    if url.path == "/stream":
+                        return self._stream(query.get("streams", "").split("/"))
+                    return self._send(404, {"code": -1, "msg": "Not found"})
+
+                if url.path not in KLINES_PATHS:
+                    return self._send(404, {"code": -1, "msg": "Not found"})
+                self._klines(query, KLINES_PATHS[url.path])
+
+            # ---------- REST ----------
+            def _klines(self, query, exchange=BinanceSpotExchange):
+                symbol, interval = query.get("symbol"), query.get("interval")
+                limit = int(query.get("limit", 500))
+                with server._lock:
+                    server.request_count += 1
+                    key = (symbol, interval)
+                    server.requests_by_key[key] = server.requests_by_key.get(key, 0) + 1
+
+                if server.latency_ms or server.jitter_ms:
+                    delay = server.latency_ms + server._random.uniform(0, server.jitter_ms)
+                    time.sleep(delay / 1000)
+
+                used, retry_after = server._use_weight(exchange.klines_weight(limit))
+                headers = {"X-MBX-USED-WEIGHT-1M": str(used)}
+
+                if retry_after is None and server._random.random() < server.error_rate:
+                    retry_after = 1
+                if retry_after is not None:
+                    with server._lock:
+                        server.rate_limited_count += 1
+                    headers["Retry-After"] = str(retry_after)
+                    return self._send(429, {"code": -1003, "msg": "Too many requests."}, headers)
+
+                rows = server.get_rows(
+                    symbol, interval,
+                    limit=limit,
+                    start_time=int(query["startTime"]) if "startTime" in query else None,
+                    end_time=int(query["endTime"]) if "endTime" in query else None,
+                    max_limit=exchange.max_limit
+                )
+                if rows is None:
+                    return self._send(400, {"code": -1121, "msg": "Invalid symbol."}, headers)
+                self._send(200, rows, headers)
+
+            def _send(self, status, payload, headers=None):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            # ---------- WEBSOCKET ----------
+            def _stream(self, names):
+                streams = [(name, _parse_stream(name)) for name in names if name]
+                streams = [(name, parsed) for name, parsed in streams if parsed]
+                combined = self.path.startswith("/stream")
+
+                key = self.headers.get("Sec-WebSocket-Key", "")
+                accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+                self.send_response(101)
+                self.send_header("Upgrade", "websocket")
+                self.send_header("Connection", "Upgrade")
+                self.send_header("Sec-WebSocket-Accept", accept)
+                self.end_headers()
+                self.close_connection = True
+
+                with server._lock:
+                    server.ws_connections += 1
+
+                write_lock = threading.Lock()
+                closed = threading.Event()
+
+                def send(payload, opcode=0x1):
+                    with write_lock:
+                        self.wfile.write(_ws_frame(payload, opcode))
+                        self.wfile.flush()
+
+                def reader():
+                    # Trả lời ping, dừng khi client đóng kết nối
+                    try:
+                        while not closed.is_set():
+                            frame = _read_ws_frame(self.rfile)
+                            if frame is None or frame[0] == 0x8:
+                                break
+                            if frame[0] == 0x9:
+                                send(frame[1], 0xA)
+                    except (OSError, ValueError):
+                        pass
+                    closed.set()
+
+                threading.Thread(target=reader, daemon=True).start()
+
+                last_open = {}
+                try:
+                    while not closed.is_set() and not server._stopping.is_set():
+                        now_ms = int(server.clock.time() * 1000)
+                        for name, (symbol, interval) in streams:
+                            # Sang nến mới → gửi event đóng nến trước (x=true)
+                            previous = last_open.get(name)
+                            if previous is not None and now_ms > previous + INTERVAL_MS.get(interval, 0) - 1:
+                                event = server.kline_event(symbol, interval, previous + INTERVAL_MS[interval] - 1)
+                                if event is not None:
+                                    self._send_event(send, name, event, combined)
+
+                            event = server.kline_event(symbol, interval, now_ms)
+                            if event is None:
+                                continue
+                            last_open[name] = event["k"]["t"]
+                            self._send_event(send, name, event, combined)
+
+                        closed.wait(server.stream_interval)
+                except OSError:
+                    pass
+                finally:
+                    closed.set()
+
+            def _send_event(self, send, name, event, combined):
+                payload = {"stream": name, "data": event} if combined else event
+                send(json.dumps(payload).encode())
+                with server._lock:
+                    server.events_sent += 1
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def synthetic_symbols(count):
+    """Danh sách symbols tổng hợp: SYN0000USDT, SYN0001USDT, ..."""
+    return [f"SYN{i:04d}USDT" for i in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Binance REST/WebSocket server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--symbols", type=int, default=0, help="Số symbols tổng hợp (0 = nhận mọi symbol *USDT)")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--weight-limit", type=int, default=WEIGHT_LIMIT)
+    args = parser.parse_args()
+
+    source = SyntheticKlines(synthetic_symbols(args.symbols) if args.symbols else None)
+    server = MockBinanceServer(source, host=args.host, port=args.port, latency_ms=args.latency_ms,
+                               jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                               weight_limit=args.weight_limit)
+
+    print(f"🧪 Mock Binance đang chạy tại {server.base_url}")
+    print(f"💡 Dùng: BINANCE_BASE_URL={server.base_url} python bot.py")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n\n⛔ Đã dừng!")
+    finally:
+        server._server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Parallel Backtest - Chạy backtest song song cho mọi cặp symbol × timeframe
+- Tải dữ liệu: thread pool (I/O, chờ HTTP)
+- Đánh giá: process pool (CPU, vòng lặp Python theo từng nến) - cặp nào tải xong được đánh giá ngay
+- Kết quả trả về đúng thứ tự các cặp đầu vào (xác định, không phụ thuộc cặp nào xong trước)
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
+FETCH_WORKERS = 16
+EVAL_WORKERS = os.cpu_count() or 1
+
+
+def run_pairs(pairs, fetch, evaluate, fetch_workers=FETCH_WORKERS, eval_workers=EVAL_WORKERS):
+    """
+    pairs: list (symbol, timeframe)
+    fetch(symbol, timeframe) → dữ liệu (chạy trong thread)
+    evaluate(symbol, timeframe, data) → kết quả (chạy trong process khác → phải pickle được:
+        hàm top-level hoặc functools.partial của hàm top-level)
+    Yields kết quả theo thứ tự pairs
+    """
+    if not pairs:
+        return
+
+    with ThreadPoolExecutor(max_workers=min(fetch_workers, len(pairs))) as io_pool:
+        fetches = {io_pool.submit(fetch, symbol, timeframe): i for i, (symbol, timeframe) in enumerate(pairs)}
+
+        if eval_workers <= 1:
+            # Không cần process pool: đánh giá trong process hiện tại (theo thứ tự)
+            for future in sorted(fetches, key=fetches.get):
+                symbol, timeframe = pairs[fetches[future]]
+                yield evaluate(symbol, timeframe, future.result())
+            return
+
+        with ProcessPoolExecutor(max_workers=min(eval_workers, len(pairs))) as cpu_pool:
+            evaluations = [None] * len(pairs)
+            for future in as_completed(fetches):
+                i = fetches[future]
+                symbol, timeframe = pairs[i]
+                evaluations[i] = cpu_pool.submit(evaluate, symbol, timeframe, future.result())
+
+            for evaluation in evaluations:
+                yield evaluation.result()
@@ -0,0 +1,279 @@
+"""
+Parameter Sweep - Tìm ngưỡng Doji tốt nhất từ dữ liệu thay vì đoán
+- Đặc trưng nến + kết quả lệnh (LONG/SHORT) tính 1 lần cho mỗi (symbol, timeframe)
+- Chia sẻ cho các worker qua shared memory (không copy/pickle mảng lớn)
+- Hàng nghìn tổ hợp tham số chạy song song trên process pool, xuất bảng xếp hạng
+"""
+import os
+import csv
+import time
+import random
+import itertools
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from tabulate import tabulate
+from backtest_engine import (
+    SYMBOLS, TIMEFRAMES, HISTORY_DAYS, TP_PERCENT, SL_PERCENT, MAX_HOLD,
+    load_history, compute_features, signal_masks, label_outcomes, summarize
+)
+
+# ========== CẤU HÌNH ==========
+PARAM_GRID = {
+    "doji_threshold": [5, 8, 10, 12, 15],
+    "volume_ratio": [0.7, 0.8, 0.9, 1.0],
+    "min_body_position": [25, 30, 35, 40],
+    "max_body_position": [60, 65, 70, 75],
+    "min_shadow_percent": [0, 3, 5, 8],
+    "prev_shadow_threshold": [50, 55, 60, 65, 70],
+    "prev_body_threshold": [50, 55, 60, 65, 70]
+}
+SEARCH_MODE = "grid"      # "grid" hoặc "random"
+RANDOM_SAMPLES = 2000
+RANDOM_SEED = 42
+MIN_TRADES = 30           # Bỏ qua tổ hợp quá ít lệnh (không đủ ý nghĩa thống kê)
+RANK_BY = "expectancy"
+TOP_N = 20
+RESULTS_FILE = "sweep_results.csv"
+WORKERS = os.cpu_count() or 1
+CHUNK_SIZE = 200
+
+# Các dòng trong block shared memory của mỗi dataset
+FEATURE_ROWS = [
+    "index", "close_time", "valid", "body_percent", "body_position", "upper_shadow_pct", "lower_shadow_pct",
+    "volume", "prev_volume", "prev_range", "prev_body", "prev_direction", "prev_upper_shadow",
+    "ret_long", "ret_short", "exit_long", "exit_short"
+]
+
+
+# ========== TỔ HỢP THAM SỐ ==========
+def grid_combinations(grid=PARAM_GRID):
+    """Toàn bộ tổ hợp của grid (bỏ tổ hợp vô lý min_body_position ≥ max_body_position)"""
+    names = list(grid)
+    for values in itertools.product(*(grid[name] for name in names)):
+        params = dict(zip(names, values))
+        if params["min_body_position"] < params["max_body_position"]:
+            yield params
+
+
+def random_combinations(grid=PARAM_GRID, samples=RANDOM_SAMPLES, seed=RANDOM_SEED):
+    """Lấy ngẫu nhiên `samples` tổ hợp (không trùng) từ grid"""
+    rng = random.Random(seed)
+    seen = set()
+    total = int(np.prod([len(values) for values in grid.values()]))
+    produced = 0
+    while produced < samples and len(seen) < total:
+        params = {name: rng.choice(values) for name, values in grid.items()}
+        key = tuple(params.values())
+        if key in seen:
+            continue
+        seen.add(key)
+        if params["min_body_position"] < params["max_body_position"]:
+            produced += 1
+            yield params
+
+
+def loosest_params(grid=PARAM_GRID):
+    """Ngưỡng lỏng nhất của grid - nến không đạt ngưỡng này thì không tổ hợp nào đạt"""
+    return {
+        "doji_threshold": max(grid["doji_threshold"]),
+        "volume_ratio": max(grid["volume_ratio"]),
+        "min_body_position": min(grid["min_body_position"]),
+        "max_body_position": max(grid["max_body_position"]),
+        "min_shadow_percent": min(grid["min_shadow_percent"]),
+        "prev_shadow_threshold": min(grid["prev_shadow_threshold"]),
+        "prev_body_threshold": min(grid["prev_body_threshold"])
+    }
+
+
+# ========== CHUẨN BỊ DỮ LIỆU ==========
+def prepare_dataset(arrays, timeframe, grid=PARAM_GRID,
+                    tp_percent=TP_PERCENT, sl_percent=SL_PERCENT, max_hold=MAX_HOLD):
+    """
+    Tính đặc trưng + kết quả lệnh 1 lần, chỉ giữ nến ứng viên (đạt ngưỡng lỏng nhất của grid)
+    Lệnh chưa có kết quả ở cuối lịch sử (OUTCOME_OPEN): ret_* = NaN, bị trade_masks loại khỏi mọi thống kê
+    Trả về block 2D float64: mỗi dòng là 1 FEATURE_ROWS
+    """
+    features = compute_features(arrays)
+    long_mask, short_mask = signal_masks(features, loosest_params(grid), timeframe)
+    index = np.flatnonzero(long_mask | short_mask)
+
+    ones = np.ones(len(index))
+    rows = {"index": index, "close_time": arrays["close_time"][index]}
+    for side, direction in [("long", ones), ("short", -ones)]:
+        outcome = label_outcomes(arrays, index, direction, [], tp_percent, sl_percent, max_hold)
+        rows[f"ret_{side}"] = outcome["trade_return"]
+        # close_time nến thoát lệnh - walk-forward dùng để loại lệnh train có kết quả nằm trong khoảng test
+        rows[f"exit_{side}"] = arrays["close_time"][index + outcome["bars_held"]]
+
+    block = np.empty((len(FEATURE_ROWS), len(index)))
+    for i, name in enumerate(FEATURE_ROWS):
+        block[i] = rows[name] if name in rows else features[name][index]
+    # Nến mà cả 2 hướng đều chưa có kết quả → không dùng được cho tổ hợp nào
+    return block[:, ~(np.isnan(rows["ret_long"]) & np.isnan(rows["ret_short"]))]
+
+
+def block_to_features(block):
+    """Block 2D → dict đặc trưng dùng được với signal_masks (view, không copy)"""
+    features = {name: block[i] for i, name in enumerate(FEATURE_ROWS)}
+    features["valid"] = features["valid"] != 0
+    return features
+
+
+def trade_masks(features, params, timeframe):
+    """signal_masks trên block + bỏ lệnh chưa có kết quả (ret NaN) - dùng cho mọi thống kê sweep / walk-forward"""
+    long_mask, short_mask = signal_masks(features, params, timeframe)
+    return long_mask & ~np.isnan(features["ret_long"]), short_mask & ~np.isnan(features["ret_short"])
+
+
+class SharedDatasets:
+    """Giữ các block đặc trưng trong shared memory để worker attach mà không copy"""
+
+    def __init__(self, datasets):
+        # datasets: {(symbol, timeframe): block}
+        self.segments = []
+        self.manifest = []
+        for (symbol, timeframe), block in datasets.items():
+            shm = shared_memory.SharedMemory(create=True, size=max(block.nbytes, 1))
+            view = np.ndarray(block.shape, dtype=block.dtype, buffer=shm.buf)
+            view[:] = block
+            self.segments.append(shm)
+            self.manifest.append((symbol, timeframe, shm.name, block.shape))
+
+    def close(self):
+        for shm in self.segments:
+            shm.close()
+            shm.unlink()
+        self.segments = []
+
+
+# ========== WORKER ==========
+_WORKER_DATASETS = []
+_WORKER_SEGMENTS = []
+
+
+def _attach_worker(manifest):
+    """Initializer của worker: attach vào shared memory 1 lần"""
+    for symbol, timeframe, name, shape in manifest:
+        shm = shared_memory.SharedMemory(name=name)
+        block = np.ndarray(shape, dtype=float, buffer=shm.buf)
+        _WORKER_SEGMENTS.append(shm)
+        _WORKER_DATASETS.append((symbol, timeframe, block_to_features(block)))
+
+
+def evaluate_params(datasets, params, min_trades=MIN_TRADES):
+    """
+    Đánh giá 1 tổ hợp trên tất cả datasets
+    datasets: list (symbol, timeframe, features) với features từ block_to_features
+    """
+    returns = []
+    max_drawdown = 0.0
+    for _, timeframe, features in datasets:
+        long_mask, short_mask = trade_masks(features, params, timeframe)
+        trade_return = np.concatenate([features["ret_long"][long_mask], features["ret_short"][short_mask]])
+        order = np.argsort(np.concatenate([features["index"][long_mask], features["index"][short_mask]]),
+                           kind="stable")
+        trade_return = trade_return[order]
+        returns.append(trade_return)
+        max_drawdown = max(max_drawdown, summarize(trade_return)["max_drawdown"])
+
+    stats = summarize(np.concatenate(returns) if returns else [])
+    stats["max_drawdown"] = max_drawdown
+    stats["eligible"] = stats["trades"] >= min_trades
+    return {**params, **stats}
+
+
+def _evaluate_chunk(chunk, min_trades):
+    return [evaluate_params(_WORKER_DATASETS, params, min_trades) for params in chunk]
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def map_shared(datasets, chunk_fn, items, args=(), workers=WORKERS, chunk_size=CHUNK_SIZE):
+    """
+    Chạy chunk_fn(chunk, *args) trên process pool với datasets trong shared memory
+    chunk_fn đọc datasets qua _WORKER_DATASETS, trả về list - kết quả ghép theo đúng thứ tự items
+    """
+    shared = SharedDatasets(datasets)
+    results = []
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach_worker,
+                                 initargs=(shared.manifest,)) as pool:
+            futures = [pool.submit(chunk_fn, chunk, *args) for chunk in _chunks(items, chunk_size)]
+            for future in futures:
+                results.extend(future.result())
+    finally:
+        shared.close()
+    return results
+
+
+# ========== SWEEP ==========
+def run_sweep(datasets, combinations, workers=WORKERS, min_trades=MIN_TRADES, chunk_size=CHUNK_SIZE):
+    """
+    Chạy sweep trên datasets đã chuẩn bị ({(symbol, timeframe): block})
+    Trả về list kết quả đã xếp hạng theo RANK_BY (tổ hợp đủ lệnh xếp trước)
+    """
+    results = map_shared(datasets, _evaluate_chunk, combinations, (min_trades,), workers, chunk_size)
+
+    results.sort(key=lambda r: (r["eligible"], r[RANK_BY]), reverse=True)
+    return results
+
+
+def save_results(results, path=RESULTS_FILE):
+    """Lưu toàn bộ bảng kết quả ra CSV"""
+    if not results:
+        return
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(results[0]))
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def main():
+    print("\n" + "="*100)
+    print("🔧 PARAMETER SWEEP - NGƯỠNG DOJI")
+    print("="*100)
+
+    started = time.perf_counter()
+    datasets = {}
+    for symbol in SYMBOLS:
+        for timeframe in TIMEFRAMES:
+            try:
+                arrays = load_history(symbol, timeframe, HISTORY_DAYS)
+            except Exception as e:
+                print(f"❌ Lỗi khi lấy dữ liệu {symbol} {timeframe}: {e}")
+                continue
+            datasets[(symbol, timeframe)] = prepare_dataset(arrays, timeframe)
+
+    combinations = list(grid_combinations() if SEARCH_MODE == "grid" else random_combinations())
+    print(f"\n📊 {len(datasets)} datasets, {len(combinations)} tổ hợp, {WORKERS} workers")
+
+    results = run_sweep(datasets, combinations)
+    save_results(results)
+
+    names = list(PARAM_GRID)
+    table = [
+        [rank, *[r[name] for name in names], r["trades"], f"{r['win_rate']:.1f}%",
+         f"{r['expectancy']:.3f}%", f"{r['total_return']:.1f}%", f"{r['max_drawdown']:.1f}%"]
+        for rank, r in enumerate(results[:TOP_N], 1)
+    ]
+    headers = ["#", "Doji%", "Vol", "MinPos", "MaxPos", "Shadow", "PrevShadow", "PrevBody",
+               "Lệnh", "Win", "Expectancy", "Tổng", "Max DD"]
+    print(f"\n🏆 Top {TOP_N} theo {RANK_BY} (tối thiểu {MIN_TRADES} lệnh):\n")
+    print(tabulate(table, headers=headers, tablefmt="grid"))
+    print(f"\n💾 Đã lưu {len(results)} kết quả vào {RESULTS_FILE}")
+    print(f"⏱️ Hoàn thành trong {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n\n⛔ Đã dừng!")
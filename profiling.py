@@ -0,0 +1,127 @@
+"""
+Profiling - Đo hot path của scanner khi cần (tắt mặc định, không tốn gì khi tắt)
+- arm(n): profile n lượt scan_symbols liên tiếp + các lần tính S/R trong thời gian đó
+- cProfile: thống kê sắp xếp theo cumulative time; tracemalloc: chênh lệch bộ nhớ trước/sau mỗi lượt
+- Lượt scan chỉ profile các đoạn đồng bộ được bọc bằng section() → không lẫn task khác chạy xen giữa các await
+  (polling Telegram, sàn khác); ghi file trong thread, không chặn event loop
+- Bật bằng biến môi trường PROFILE_SCANS=n hoặc lệnh /profile n (admin)
+- Kết quả ghi vào PROFILE_DIR: <thời gian>_<nhãn>.prof (mở bằng pstats/snakeviz), .txt, .alloc.txt
+Lưu ý: cProfile chỉ đo thread nơi nó được bật → request HTTP (chạy trong thread) chỉ thấy thời gian chờ
+"""
+import os
+import io
+import time
+import asyncio
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from contextlib import asynccontextmanager, nullcontext
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_SCANS = int(os.getenv("PROFILE_SCANS", "0"))
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+
+
+class ScanProfiler:
+
+    def __init__(self, output_dir=PROFILE_DIR):
+        self.output_dir = output_dir
+        self.remaining = 0
+        self.files = []
+        self._lock = threading.Lock()
+        self._started_tracemalloc = False
+        self._counter = 0
+        self._pass_profile = None   # cProfile của lượt scan đang profile (bật trong từng section)
+
+    @property
+    def active(self):
+        return self.remaining > 0
+
+    def arm(self, passes):
+        """Profile `passes` lượt scan tiếp theo"""
+        with self._lock:
+            self.remaining = max(0, int(passes))
+            if self.remaining and not tracemalloc.is_tracing():
+                tracemalloc.start(10)
+                self._started_tracemalloc = True
+        return self.remaining
+
+    def _disarm_if_done(self):
+        with self._lock:
+            if self.remaining == 0 and self._started_tracemalloc:
+                tracemalloc.stop()
+                self._started_tracemalloc = False
+
+    def _path(self, label):
+        with self._lock:
+            self._counter += 1
+            counter = self._counter
+        os.makedirs(self.output_dir, exist_ok=True)
+        return os.path.join(self.output_dir, f"{time.strftime('%Y%m%d-%H%M%S')}_{counter:03d}_{label}")
+
+    def _dump(self, label, profile, elapsed, before=None, after=None):
+        prefix = self._path(label)
+        profile.dump_stats(f"{prefix}.prof")
+
+        text = io.StringIO()
+        text.write(f"{label}: {elapsed * 1000:.1f}ms\n\n")
+        pstats.Stats(profile, stream=text).sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+        with open(f"{prefix}.txt", "w") as f:
+            f.write(text.getvalue())
+        self.files.append(f"{prefix}.txt")
+
+        if before is not None and after is not None:
+            with open(f"{prefix}.alloc.txt", "w") as f:
+                f.write(f"{label}: chênh lệch bộ nhớ (top {TOP_ALLOCATIONS})\n\n")
+                for stat in after.compare_to(before, "lineno")[:TOP_ALLOCATIONS]:
+                    f.write(f"{stat}\n")
+
+    @asynccontextmanager
+    async def _profile_pass(self, label):
+        before = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+        self._pass_profile = profile = cProfile.Profile()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._pass_profile = None
+            elapsed = time.perf_counter() - started
+            after = tracemalloc.take_snapshot() if before is not None else None
+            with self._lock:
+                self.remaining = max(0, self.remaining - 1)
+            try:
+                await asyncio.to_thread(self._dump, label, profile, elapsed, before, after)
+            except Exception as e:
+                print(f"⚠️ Không ghi được profile: {e}")
+            self._disarm_if_done()
+
+    def scan_pass(self, label="scan"):
+        """
+        Async context manager quanh 1 lượt scan: chỉ profile khi đang bật (tính vào số lượt còn lại)
+        Thời gian trong file = cả lượt; thống kê hàm = tổng các section() trong lượt
+        """
+        if not self.active:
+            return nullcontext()
+        return self._profile_pass(label)
+
+    def section(self):
+        """Đoạn đồng bộ (không await) trong lượt scan - chỉ đo khi lượt đang được profile"""
+        profile = self._pass_profile
+        return profile if profile is not None else nullcontext()
+
+    def run(self, label, fn, *args, **kwargs):
+        """Gọi fn (vd. tính S/R trong worker thread), profile riêng nếu đang bật - không tính vào số lượt"""
+        if not self.active:
+            return fn(*args, **kwargs)
+
+        profile = cProfile.Profile()
+        started = time.perf_counter()
+        try:
+            return profile.runcall(fn, *args, **kwargs)
+        finally:
+            try:
+                self._dump(label, profile, time.perf_counter() - started)
+            except Exception as e:
+                print(f"⚠️ Không ghi được profile: {e}")
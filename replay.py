@@ -0,0 +1,158 @@
+"""
+Replay - Chạy scanner THẬT trên dữ liệu đã ghi với đồng hồ tăng tốc
+- Dữ liệu nến phục vụ qua MockBinanceServer (local), thời gian theo VirtualClock
+  (chỉ tiến ở các lần sleep của scanner → chạy lại cho cùng kết quả, không phụ thuộc tốc độ máy)
+- Đi đúng đường live: DojiDetector.scan_symbols → bot.scan_once → dispatch_signals → calculate_wait_time
+- Báo cáo: độ trễ alert, tín hiệu bị lỡ (so với backtest trên cùng dữ liệu), số request đã gọi
+"""
+import time
+import asyncio
+import numpy as np
+from clock import VirtualClock
+from kline_client import KlineClient
+from detector import DojiDetector
+from mock_binance import MockBinanceServer
+from backtest_engine import load_history, backtest_arrays, params_from_detector
+from bot import scan_once
+
+# ========== CẤU HÌNH ==========
+SYMBOLS = ["BTCUSDT", "ETHUSDT", "BNBUSDT", "SOLUSDT"]
+TIMEFRAMES = ["1h", "2h", "4h", "1d"]
+REPLAY_DAYS = 7
+WARMUP_DAYS = 30   # Lịch sử trước thời điểm bắt đầu (cho SR calculator)
+
+
+class FakeBot:
+    """
+    Thay Telegram bot: ghi lại thời điểm (mô phỏng) gửi message đầu tiên của mỗi tín hiệu
+    sent: {(symbol, interval, close_time_ms): thời điểm gửi}
+    """
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.sent = {}
+        self.messages = 0
+        self.current = None   # Khóa tín hiệu đang được gửi (replay đặt trước mỗi lần gửi)
+
+    async def send_message(self, chat_id, text, parse_mode=None):
+        self.messages += 1
+        self.sent.setdefault(self.current, self.clock.time())
+
+
+def expected_signals(klines, detector, start_ms, end_ms):
+    """Tín hiệu lẽ ra phải gửi: backtest trên cùng dữ liệu, nến đóng trong khoảng replay"""
+    params = params_from_detector(detector)
+    expected = set()
+    for (symbol, interval), arrays in klines.items():
+        trades, _ = backtest_arrays(arrays, interval, params)
+        max_delay = detector.MAX_DELAY_MS.get(interval, 10 * 60 * 1000)
+        for close_time in trades["close_time"]:
+            if start_ms - max_delay < close_time <= end_ms - max_delay:
+                expected.add((symbol, interval, int(close_time)))
+    return expected
+
+
+def signal_key(signal):
+    return signal["symbol"], signal["interval"], signal["close_time_ms"]
+
+
+async def run_replay(klines, symbols, timeframes, start_ms, end_ms):
+    """
+    Replay từ start_ms đến end_ms (thời gian mô phỏng)
+    klines: {(symbol, interval): dict cột NumPy}
+    """
+    clock = VirtualClock(start_ms / 1000)
+    bot = FakeBot(clock)
+    emitted = []
+    passes = 0
+
+    with MockBinanceServer(klines, clock) as server:
+        client = KlineClient(url=server.klines_url, clock=clock)
+        detector = DojiDetector(kline_client=client, clock=clock)
+        detector.timeframes = timeframes
+
+        # Bọc scan_symbols để giữ lại tín hiệu thô (close_time dạng ms) + gắn khóa cho message gửi đi
+        scan_symbols = detector.scan_symbols
+
+        async def recording_scan(symbols, on_signal=None):
+            async def send(signal):
+                emitted.append(signal)
+                bot.current = signal_key(signal)
+                if on_signal is not None:
+                    await on_signal(signal)
+
+            return await scan_symbols(symbols, on_signal=send)
+
+        detector.scan_symbols = recording_scan
+
+        real_started = time.perf_counter()
+        while clock.time() * 1000 < end_ms:
+            wait_time = await scan_once(detector, symbols, bot, "replay")
+            passes += 1
+            await clock.sleep(wait_time)
+        real_elapsed = time.perf_counter() - real_started
+
+        request_count = server.request_count
+
+    emitted_keys = {signal_key(s) for s in emitted}
+    latencies = np.array([bot.sent[key] - key[2] / 1000 for key in sorted(emitted_keys) if key in bot.sent])
+    expected = expected_signals(klines, detector, start_ms, end_ms)
+
+    return {
+        "sim_seconds": (end_ms - start_ms) / 1000,
+        "real_seconds": real_elapsed,
+        "passes": passes,
+        "requests": request_count,
+        "client_stats": dict(client.stats),
+        "alerts": len(bot.sent),
+        "messages": bot.messages,
+        "latencies": latencies,
+        "expected": len(expected),
+        "missed": sorted(expected - emitted_keys),
+        "unexpected": sorted(emitted_keys - expected)
+    }
+
+
+def print_report(report):
+    print("\n" + "="*80)
+    print("📼 KẾT QUẢ REPLAY")
+    print("="*80)
+    print(f"\n⏱️ Mô phỏng {report['sim_seconds'] / 3600:.1f} giờ trong {report['real_seconds']:.1f}s thật "
+          f"(~{report['sim_seconds'] / max(report['real_seconds'], 1e-9):.0f}×)")
+    print(f"🔄 Số lượt quét: {report['passes']}")
+    print(f"🌐 Request tới API: {report['requests']} | client: {report['client_stats']}")
+    print(f"🔔 Alert đã gửi: {report['alerts']} / {report['expected']} tín hiệu kỳ vọng")
+
+    latencies = report["latencies"]
+    if len(latencies):
+        p50, p95 = np.percentile(latencies, [50, 95])
+        print(f"📈 Độ trễ alert (sau khi nến đóng): p50 {p50:.1f}s | p95 {p95:.1f}s | max {latencies.max():.1f}s")
+
+    if report["missed"]:
+        print(f"\n❌ Tín hiệu bị lỡ (quá max_delay hoặc bỏ qua): {len(report['missed'])}")
+        for symbol, interval, close_time in report["missed"][:10]:
+            print(f"   • {symbol} {interval} close_time={close_time}")
+    if report["unexpected"]:
+        print(f"\n⚠️ Tín hiệu ngoài kỳ vọng: {len(report['unexpected'])}")
+
+
+def main():
+    now_ms = int(time.time() * 1000)
+    klines = {}
+    for symbol in SYMBOLS:
+        for timeframe in TIMEFRAMES:
+            try:
+                klines[(symbol, timeframe)] = load_history(symbol, timeframe, REPLAY_DAYS + WARMUP_DAYS)
+            except Exception as e:
+                print(f"❌ Lỗi khi lấy dữ liệu {symbol} {timeframe}: {e}")
+
+    start_ms = now_ms - REPLAY_DAYS * 24 * 60 * 60 * 1000
+    report = asyncio.run(run_replay(klines, SYMBOLS, TIMEFRAMES, start_ms, now_ms))
+    print_report(report)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n\n⛔ Đã dừng!")
@@ -0,0 +1,187 @@
+"""
+Rule Diagnostics - Điều kiện nào lọc bỏ nhiều nến nhất? (vectorized trên toàn bộ lịch sử)
+- Mỗi điều kiện của is_doji_with_low_volume → 1 mask "không đạt" cho mọi nến cùng lúc
+- Điều kiện đầu tiên không đạt (argmax theo thứ tự kiểm tra như bot live)
+- Bảng chéo mọi tổ hợp điều kiện: mask nén thành bit → np.bincount (2^số điều kiện ô)
+Cộng dồn được qua hàng nghìn symbols/timeframes mà không có vòng lặp Python theo nến
+"""
+import time
+import numpy as np
+from functools import partial
+from tabulate import tabulate
+from backtest_engine import (SYMBOLS, TIMEFRAMES, HISTORY_DAYS, DEFAULT_PARAMS,
+                             load_history, compute_features)
+from parallel_backtest import run_pairs
+
+DIAGNOSTIC_DAYS = HISTORY_DAYS
+TOP_COMBINATIONS = 15
+
+# Thứ tự kiểm tra giống bot live: (tên, mô tả)
+RULES = [
+    ("data", "Range = 0 hoặc Volume = 0"),
+    ("body", "Body > doji_threshold"),
+    ("position", "Thân ngoài min-max_body_position"),
+    ("shadow", "Bóng trên/dưới < min_shadow_percent"),
+    ("volume", "Volume > volume_ratio × nến trước"),
+    ("prev_direction", "Nến trước là Doji (không có hướng)"),
+    ("prev_shadow", "Bóng trên nến trước ≤ prev_shadow_threshold"),
+    ("prev_body", "Body nến trước < prev_body_threshold")
+]
+RULE_NAMES = [name for name, _ in RULES]
+NUM_RULES = len(RULES)
+PASSED = NUM_RULES   # Chỉ số "điều kiện đầu tiên không đạt" khi đạt tất cả (= tín hiệu)
+
+
+def rule_failures(features, params=None, timeframe="1h"):
+    """
+    Ma trận bool (NUM_RULES, n): True = nến không đạt điều kiện đó
+    Viết dưới dạng phủ định điều kiện ĐẠT của signal_masks → NaN (range = 0) tính là không đạt
+    """
+    params = params or DEFAULT_PARAMS
+    n = len(features["valid"])
+    failures = np.zeros((NUM_RULES, n), dtype=bool)
+
+    with np.errstate(invalid="ignore"):
+        failures[0] = ~features["valid"]
+        failures[1] = ~(features["body_percent"] <= params["doji_threshold"])
+        failures[2] = ~((features["body_position"] >= params["min_body_position"]) &
+                        (features["body_position"] <= params["max_body_position"]))
+        failures[3] = ~((features["upper_shadow_pct"] >= params["min_shadow_percent"]) &
+                        (features["lower_shadow_pct"] >= params["min_shadow_percent"]))
+        # Volume thấp - bỏ qua khung 1d
+        if timeframe != "1d":
+            failures[4] = ~(features["volume"] <= params["volume_ratio"] * features["prev_volume"])
+        failures[5] = features["prev_direction"] == 0
+        failures[6] = ~(features["prev_upper_shadow"] > (params["prev_shadow_threshold"] / 100) * features["prev_range"])
+        failures[7] = ~(features["prev_body"] >= (params["prev_body_threshold"] / 100) * features["prev_range"])
+
+    # Nến đầu tiên không có nến trước → không tính
+    failures[:, :1] = False
+    return failures
+
+
+def first_failing_rule(failures):
+    """Chỉ số điều kiện đầu tiên không đạt cho từng nến (PASSED nếu đạt tất cả)"""
+    first = np.argmax(failures, axis=0)
+    first[~failures.any(axis=0)] = PASSED
+    return first
+
+
+def combination_codes(failures):
+    """Nén mask thành mã bit: bit r = điều kiện r không đạt (0 = tín hiệu hợp lệ)"""
+    weights = (1 << np.arange(NUM_RULES, dtype=np.int64))[:, None]
+    return (failures * weights).sum(axis=0)
+
+
+def combination_counts(arrays, timeframe, params=None):
+    """Số nến theo từng tổ hợp điều kiện không đạt (mảng 2^NUM_RULES phần tử)"""
+    failures = rule_failures(compute_features(arrays), params, timeframe)
+    return np.bincount(combination_codes(failures)[1:], minlength=1 << NUM_RULES)
+
+
+# Bảng bit của mọi tổ hợp: BITS[code, r] = điều kiện r không đạt trong tổ hợp code
+BITS = ((np.arange(1 << NUM_RULES)[:, None] >> np.arange(NUM_RULES)) & 1).astype(bool)
+FIRST_RULE = np.where(BITS.any(axis=1), np.argmax(BITS, axis=1), PASSED)
+
+
+class RuleDiagnostics:
+    """Cộng dồn bảng tổ hợp theo timeframe; mọi thống kê khác suy ra từ bảng này"""
+
+    def __init__(self):
+        self.counts = {}
+
+    def add(self, timeframe, counts):
+        if timeframe not in self.counts:
+            self.counts[timeframe] = np.zeros(1 << NUM_RULES, dtype=np.int64)
+        self.counts[timeframe] += counts
+        return self
+
+    def total(self, timeframe=None):
+        if timeframe is not None:
+            return self.counts.get(timeframe, np.zeros(1 << NUM_RULES, dtype=np.int64))
+        return sum(self.counts.values(), np.zeros(1 << NUM_RULES, dtype=np.int64))
+
+    def rule_summary(self, timeframe=None):
+        """Mỗi điều kiện: số nến không đạt, không đạt ĐẦU TIÊN, và chỉ vướng DUY NHẤT điều kiện này"""
+        counts = self.total(timeframe)
+        failing = BITS.T.astype(np.int64) @ counts
+        first = np.bincount(FIRST_RULE, weights=counts, minlength=NUM_RULES + 1).astype(np.int64)
+        only = counts[1 << np.arange(NUM_RULES)]
+        return failing, first, only
+
+    def cross_tab(self, timeframe=None):
+        """Ma trận (NUM_RULES, NUM_RULES): số nến không đạt đồng thời điều kiện i và j"""
+        counts = self.total(timeframe)
+        weighted = BITS.astype(np.int64) * counts[:, None]
+        return BITS.T.astype(np.int64) @ weighted
+
+    def top_combinations(self, timeframe=None, limit=TOP_COMBINATIONS):
+        """Các tổ hợp điều kiện không đạt phổ biến nhất: [(tên các điều kiện, số nến)]"""
+        counts = self.total(timeframe)
+        order = np.argsort(-counts, kind="stable")
+        return [(" + ".join(np.array(RULE_NAMES)[BITS[code]]) or "✅ tín hiệu", int(counts[code]))
+                for code in order[:limit] if counts[code] > 0]
+
+
+def diagnose_pair(symbol, timeframe, arrays, params=None):
+    """Chạy trong process pool: bảng tổ hợp cho 1 cặp"""
+    return combination_counts(arrays, timeframe, params)
+
+
+def print_report(diagnostics, timeframes):
+    counts = diagnostics.total()
+    total = int(counts.sum())
+    if total == 0:
+        print("\n❌ Không có dữ liệu")
+        return
+    failing, first, only = diagnostics.rule_summary()
+
+    print(f"\n📊 Tổng {total} nến, {int(counts[0])} tín hiệu ({counts[0] / total * 100:.3f}%)\n")
+    table = []
+    for r, (name, label) in enumerate(RULES):
+        table.append([name, label, f"{failing[r]} ({failing[r] / total * 100:.1f}%)",
+                      f"{first[r]} ({first[r] / total * 100:.1f}%)", only[r]])
+    print(tabulate(table, headers=["Điều kiện", "Mô tả", "Không đạt", "Không đạt đầu tiên", "Chỉ vướng điều kiện này"],
+                   tablefmt="grid"))
+
+    print("\n🔀 Không đạt đồng thời (hàng × cột):\n")
+    cross = diagnostics.cross_tab()
+    print(tabulate([[name] + list(row) for name, row in zip(RULE_NAMES, cross)], headers=[""] + RULE_NAMES,
+                   tablefmt="grid"))
+
+    print(f"\n🧩 {TOP_COMBINATIONS} tổ hợp phổ biến nhất:\n")
+    print(tabulate([[combo, count, f"{count / total * 100:.2f}%"] for combo, count in diagnostics.top_combinations()],
+                   headers=["Tổ hợp không đạt", "Số nến", "%"], tablefmt="grid"))
+
+    print("\n⏰ Không đạt đầu tiên theo timeframe:\n")
+    table = []
+    for timeframe in timeframes:
+        tf_counts = diagnostics.total(timeframe)
+        tf_total = max(int(tf_counts.sum()), 1)
+        _, tf_first, _ = diagnostics.rule_summary(timeframe)
+        table.append([timeframe, int(tf_counts.sum())] + [f"{x / tf_total * 100:.1f}%" for x in tf_first])
+    print(tabulate(table, headers=["TF", "Nến"] + RULE_NAMES + ["✅"], tablefmt="grid"))
+
+
+def main(symbols=SYMBOLS, timeframes=TIMEFRAMES, days=DIAGNOSTIC_DAYS, params=None):
+    print("\n" + "="*100)
+    print("🩺 CHẨN ĐOÁN ĐIỀU KIỆN DOJI (VECTORIZED)")
+    print("="*100)
+
+    pairs = [(symbol, timeframe) for symbol in symbols for timeframe in timeframes]
+    diagnostics = RuleDiagnostics()
+    started = time.perf_counter()
+    fetch = lambda symbol, timeframe: load_history(symbol, timeframe, days)
+    for (_, timeframe), counts in zip(pairs, run_pairs(pairs, fetch, partial(diagnose_pair, params=params))):
+        diagnostics.add(timeframe, counts)
+
+    print(f"\n⏱️ {len(pairs)} cặp trong {time.perf_counter() - started:.1f}s")
+    print_report(diagnostics, timeframes)
+    return diagnostics
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n\n⛔ Đã dừng!")
@@ -0,0 +1,90 @@
+"""
+Scan Scheduler - Thứ tự quét theo hạn chót (Earliest Deadline First)
+- Mỗi cặp (symbol, timeframe) có nến vừa đóng chưa xử lý là 1 task,
+  hạn chót = close_time + MAX_DELAY_MS của khung (quá hạn thì tín hiệu không còn được gửi)
+- heapq theo hạn chót: 1h (5 phút) đi trước 1d (30 phút) dù đứng cuối watchlist
+- Quá tải: ước lượng thời gian xử lý 1 cặp (EWMA); task chắc chắn trễ hạn bị bỏ (shed)
+  để dành thời gian cho task còn kịp; task xong (tín hiệu đã gửi) sau hạn chót → tính là miss
+- Số liệu: /status và metrics.py (register_metrics)
+"""
+import heapq
+from dataclasses import dataclass, field
+import metrics
+
+DEFAULT_MAX_DELAY_MS = 10 * 60 * 1000
+COST_SMOOTHING = 0.2          # Hệ số EWMA cho thời gian xử lý 1 cặp
+INITIAL_TASK_COST_MS = 500    # Ước lượng ban đầu (request + 0.3s giãn cách)
+
+
+@dataclass(order=True)
+class ScanTask:
+    deadline: int
+    boundary: int = field(compare=False)
+    symbol: str = field(compare=False)
+    timeframe: str = field(compare=False)
+
+
+class DeadlineScheduler:
+
+    def __init__(self, max_delay_ms, shed=True):
+        self.max_delay_ms = max_delay_ms
+        self.shed = shed
+        self.task_cost_ms = INITIAL_TASK_COST_MS
+        self.stats = {"scheduled": 0, "completed": 0, "deferred": 0, "missed": 0, "shed": 0,
+                      "max_lateness_ms": 0, "backlog": 0}
+
+    def plan(self, symbols, timeframes, boundaries, processed):
+        """
+        Heap các task cần quét: boundaries[tf] = close_time nến đã đóng gần nhất,
+        processed[(symbol, tf)] = close_time đã xử lý xong (bỏ qua nếu trùng)
+        """
+        heap = []
+        for symbol in symbols:
+            for timeframe in timeframes:
+                boundary = boundaries.get(timeframe)
+                if boundary is not None and processed.get((symbol, timeframe)) == boundary:
+                    continue
+                # Khung không rõ độ dài → không có hạn chót, xếp cuối
+                deadline = boundary + self.max_delay_ms.get(timeframe, DEFAULT_MAX_DELAY_MS) \
+                    if boundary is not None else float("inf")
+                heap.append(ScanTask(deadline, boundary, symbol, timeframe))
+        heapq.heapify(heap)
+        self.stats["scheduled"] += len(heap)
+        self.stats["backlog"] = len(heap)
+        return heap
+
+    def pop(self, heap):
+        task = heapq.heappop(heap)
+        self.stats["backlog"] = len(heap)
+        return task
+
+    def admit(self, task, now_ms):
+        """False nếu task không thể xong trước hạn chót (đã quá hạn, hoặc dự kiến trễ khi bật shed)"""
+        if now_ms > task.deadline or (self.shed and now_ms + self.task_cost_ms > task.deadline):
+            self.stats["shed"] += 1
+            return False
+        return True
+
+    def complete(self, task, started_ms, finished_ms):
+        """Ghi nhận task xong (finished_ms: sau khi gửi tín hiệu nếu có): cập nhật ước lượng, đếm miss nếu trễ hạn"""
+        self.task_cost_ms += COST_SMOOTHING * ((finished_ms - started_ms) - self.task_cost_ms)
+        self.stats["completed"] += 1
+        lateness = finished_ms - task.deadline
+        if lateness > 0:
+            self.stats["missed"] += 1
+            self.stats["max_lateness_ms"] = max(self.stats["max_lateness_ms"], lateness)
+
+    def defer(self, task):
+        """Task chưa xử lý được (nến chưa đóng hẳn, lỗi API) → sẽ được lập lịch lại ở lượt sau"""
+        self.stats["deferred"] += 1
+
+    def register_metrics(self, prefix="bot_scheduler", labels=None):
+        for name in ["scheduled", "completed", "deferred", "missed", "shed"]:
+            metrics.register(f"{prefix}_{name}_total", lambda name=name: self.stats[name], f"Scan tasks {name}", labels,
+                             metrics.COUNTER)
+        metrics.register(f"{prefix}_backlog", lambda: self.stats["backlog"], "Scan tasks waiting in the current pass",
+                         labels)
+        metrics.register(f"{prefix}_max_lateness_ms", lambda: self.stats["max_lateness_ms"],
+                         "Worst completion time past a task deadline", labels)
+        metrics.register(f"{prefix}_task_cost_ms", lambda: self.task_cost_ms, "Smoothed time to scan one pair", labels)
+        return self
@@ -0,0 +1,264 @@
+"""
+Signal History - Lưu mọi tín hiệu đã gửi vào SQLite để tra cứu và đối chiếu với backtest
+- Bảng WITHOUT ROWID, khóa chính (symbol, timeframe, close_time, venue) → tra theo symbol/khung/khoảng thời gian
+  là 1 lần quét đoạn liên tục trên B-tree, vẫn vài ms sau nhiều năm tín hiệu
+- venue = tên sàn (exchanges.EXCHANGES): quét nhiều sàn thì cùng 1 nến có 1 dòng mỗi sàn
+- Ghi theo lô trong 1 thread riêng: vòng quét chỉ đưa tín hiệu vào queue
+- Đối chiếu: tín hiệu live vs tín hiệu backtest_engine trên cùng lịch sử nến
+    python signal_history.py reconcile [số ngày]
+"""
+import os
+import sys
+import time
+import queue
+import sqlite3
+import threading
+import numpy as np
+from tabulate import tabulate
+from exchanges import EXCHANGE
+
+HISTORY_DB = os.getenv("HISTORY_DB", "signals.db")
+WRITE_BATCH_SIZE = 500      # Số tín hiệu tối đa mỗi transaction
+WRITE_FLUSH_INTERVAL = 1.0  # Giây chờ gom lô trước khi ghi
+HISTORY_QUERY_LIMIT = 20    # Số dòng /history hiển thị
+DIRECTIONS = {"LONG": 1, "SHORT": -1}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS signals (
+    symbol TEXT NOT NULL,
+    timeframe TEXT NOT NULL,
+    close_time INTEGER NOT NULL,
+    signal_type TEXT NOT NULL,
+    price REAL NOT NULL,
+    sr_low REAL,
+    sr_high REAL,
+    recorded_at INTEGER NOT NULL,
+    venue TEXT NOT NULL,
+    PRIMARY KEY (symbol, timeframe, close_time, venue)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS signals_close_time ON signals (close_time);
+"""
+
+_STOP = object()
+
+
+def signal_row(signal, recorded_at=None):
+    """Tín hiệu của detector → 1 dòng của bảng signals"""
+    sr_zone = signal.get("sr_zone") or (None, None)
+    return (signal["symbol"], signal["interval"], int(signal["close_time_ms"]), signal["signal_type"],
+            float(signal["price"]), sr_zone[0], sr_zone[1], int((recorded_at or time.time()) * 1000),
+            signal.get("exchange") or EXCHANGE)
+
+
+class SignalHistory:
+
+    def __init__(self, path=HISTORY_DB, batch_size=WRITE_BATCH_SIZE, flush_interval=WRITE_FLUSH_INTERVAL):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+
+        # 1 connection đọc (lệnh bot / query API), 1 connection ghi thuộc thread ghi; WAL → đọc không chờ ghi
+        self._conn = self._connect()
+        self._migrate()
+        self._conn.executescript(SCHEMA)
+        self._read_lock = threading.Lock()
+
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="signal-history", daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _migrate(self):
+        """DB tạo trước khi quét nhiều sàn (khóa chính không có venue) → chép sang bảng mới, tín hiệu cũ thuộc sàn mặc định"""
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(signals)")]
+        if not columns or "venue" in columns:
+            return
+        with self._conn:
+            self._conn.execute("ALTER TABLE signals RENAME TO signals_old")
+            self._conn.execute("DROP INDEX IF EXISTS signals_close_time")
+        self._conn.executescript(SCHEMA)
+        with self._conn:
+            self._conn.execute("INSERT INTO signals SELECT symbol, timeframe, close_time, signal_type, price, "
+                               "sr_low, sr_high, recorded_at, ? FROM signals_old", (EXCHANGE,))
+            self._conn.execute("DROP TABLE signals_old")
+        print(f"🗃️ Đã nâng cấp lịch sử tín hiệu: thêm cột sàn (tín hiệu cũ → {EXCHANGE})")
+
+    # ========== GHI ==========
+    def record(self, signal):
+        """Đưa 1 tín hiệu vào hàng đợi ghi (không chặn)"""
+        self._queue.put(signal_row(signal))
+
+    def record_many(self, signals):
+        recorded_at = time.time()
+        for signal in signals:
+            self._queue.put(signal_row(signal, recorded_at))
+
+    def _write_loop(self):
+        conn = self._connect()
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            rows = [row for row in batch if row is not _STOP]
+            stopping = len(rows) < len(batch)
+            try:
+                if rows:
+                    with conn:
+                        conn.executemany("INSERT OR IGNORE INTO signals VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                    self.written += len(rows)
+            except Exception as e:
+                print(f"❌ Lỗi khi ghi lịch sử tín hiệu: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+        conn.close()
+
+    def flush(self):
+        """Chờ mọi tín hiệu trong hàng đợi được ghi xong"""
+        self._queue.join()
+
+    def close(self):
+        if self._writer.is_alive():
+            self._queue.put(_STOP)
+            self._writer.join()
+        self._conn.close()
+
+    # ========== ĐỌC ==========
+    def query(self, symbol=None, timeframe=None, since_ms=None, until_ms=None, limit=None, newest_first=True,
+              venue=None):
+        """Tín hiệu theo bộ lọc (trường None = không lọc) → list dict"""
+        clauses, params = [], []
+        for column, op, value in [("symbol", "=", symbol), ("timeframe", "=", timeframe),
+                                  ("close_time", ">=", since_ms), ("close_time", "<=", until_ms),
+                                  ("venue", "=", venue)]:
+            if value is not None:
+                clauses.append(f"{column} {op} ?")
+                params.append(value)
+
+        sql = "SELECT symbol, timeframe, close_time, signal_type, price, sr_low, sr_high, venue FROM signals"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += f" ORDER BY close_time {'DESC' if newest_first else 'ASC'}"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+
+        with self._read_lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [{"symbol": s, "interval": tf, "close_time_ms": ct, "signal_type": st, "price": p,
+                 "sr_zone": (lo, hi) if lo is not None else None, "venue": v}
+                for s, tf, ct, st, p, lo, hi, v in rows]
+
+    def count(self, symbol=None, timeframe=None, since_ms=None, venue=None):
+        clauses, params = [], []
+        for column, op, value in [("symbol", "=", symbol), ("timeframe", "=", timeframe), ("close_time", ">=", since_ms),
+                                  ("venue", "=", venue)]:
+            if value is not None:
+                clauses.append(f"{column} {op} ?")
+                params.append(value)
+        sql = "SELECT COUNT(*) FROM signals" + (" WHERE " + " AND ".join(clauses) if clauses else "")
+        with self._read_lock:
+            return self._conn.execute(sql, params).fetchone()[0]
+
+    def pairs(self):
+        """Các cặp (symbol, timeframe, sàn) có tín hiệu + khoảng thời gian: [(symbol, tf, venue, first_ms, last_ms)]"""
+        with self._read_lock:
+            return self._conn.execute(
+                "SELECT symbol, timeframe, venue, MIN(close_time), MAX(close_time) FROM signals "
+                "GROUP BY symbol, timeframe, venue ORDER BY symbol, timeframe, venue").fetchall()
+
+
+# ========== ĐỐI CHIẾU VỚI BACKTEST ==========
+def reconcile_pair(live_signals, trades, since_ms, until_ms):
+    """
+    So tín hiệu live (query) với trades của backtest_engine.backtest_arrays trong [since_ms, until_ms]
+    Trả về dict: matched, mismatched (khác hướng), backtest_only, live_only (list close_time)
+    """
+    live = {s["close_time_ms"]: DIRECTIONS[s["signal_type"]] for s in live_signals
+            if since_ms <= s["close_time_ms"] <= until_ms}
+    window = (trades["close_time"] >= since_ms) & (trades["close_time"] <= until_ms)
+    backtest = dict(zip(trades["close_time"][window].astype(np.int64).tolist(),
+                        trades["direction"][window].astype(int).tolist()))
+
+    common = live.keys() & backtest.keys()
+    return {
+        "matched": sorted(t for t in common if live[t] == backtest[t]),
+        "mismatched": sorted(t for t in common if live[t] != backtest[t]),
+        "backtest_only": sorted(backtest.keys() - live.keys()),
+        "live_only": sorted(live.keys() - backtest.keys())
+    }
+
+
+def reconcile(history, days=30, params=None):
+    """
+    Đối chiếu mọi cặp có trong lịch sử (chỉ trong khoảng bot đã ghi nhận tín hiệu của cặp đó)
+    Mỗi sàn so với nến của chính sàn đó (archive riêng: history/<sàn>/ cho sàn khác sàn mặc định)
+    """
+    from backtest_engine import HISTORY_DIR, load_history, backtest_arrays
+    from kline_client import get_client
+
+    since_ms = int((time.time() - days * 24 * 3600) * 1000)
+    results = []
+    for symbol, timeframe, venue, first_ms, last_ms in history.pairs():
+        if last_ms < since_ms:
+            continue
+        history_dir = HISTORY_DIR if venue == EXCHANGE else os.path.join(HISTORY_DIR, venue)
+        try:
+            arrays = load_history(symbol, timeframe, days, history_dir, get_client(venue))
+        except Exception as e:
+            print(f"❌ Lỗi khi lấy dữ liệu {symbol} {timeframe} ({venue}): {e}")
+            continue
+
+        trades, _ = backtest_arrays(arrays, timeframe, params)
+        live = history.query(symbol, timeframe, since_ms=max(first_ms, since_ms), venue=venue)
+        results.append((symbol, timeframe, venue, reconcile_pair(live, trades, max(first_ms, since_ms), last_ms)))
+    return results
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] != "reconcile":
+        print("📝 Cú pháp: python signal_history.py reconcile [số ngày]")
+        return
+
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    history = SignalHistory()
+    try:
+        results = reconcile(history, days)
+    finally:
+        history.close()
+
+    print("\n" + "="*100)
+    print(f"🧾 ĐỐI CHIẾU TÍN HIỆU LIVE vs BACKTEST ({days} ngày)")
+    print("="*100 + "\n")
+    if not results:
+        print("❌ Chưa có tín hiệu nào trong lịch sử")
+        return
+
+    table = [[symbol, timeframe, venue, len(r["matched"]), len(r["mismatched"]), len(r["backtest_only"]),
+              len(r["live_only"])]
+             for symbol, timeframe, venue, r in results]
+    print(tabulate(table, headers=["Symbol", "TF", "Sàn", "Khớp", "Khác hướng", "Chỉ backtest", "Chỉ live"],
+                   tablefmt="grid"))
+    print("\n💡 'Chỉ backtest': bot không chạy / quá MAX_DELAY / bị lọc S/R | 'Chỉ live': lệch dữ liệu nến")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n\n⛔ Đã dừng!")
@@ -3,9 +3,10 @@ Backtest đơn giản: Chỉ Doji cơ bản
 KHÔNG có điều kiện True Doji, KHÔNG có điều kiện nến trước
 Chỉ để so sánh xem có bao nhiêu nến bị lọc bởi logic mới
 """
-import requests
 from datetime import datetime, timezone, timedelta
 from tabulate import tabulate
+from kline_client import get_default_client, rows_to_candles
+from parallel_backtest import run_pairs
 
 # ========== CẤU HÌNH ==========
 SYMBOLS = ["WUSDT"]
@@ -16,25 +17,8 @@ BACKTEST_CANDLES = 100
 
 # ========== LẤY DỮ LIỆU ==========
 def get_historical_klines(symbol, interval, limit=100):
-    url = "https://api.binance.com/api/v3/klines"
-    params = {"symbol": symbol, "interval": interval, "limit": limit}
-    
     try:
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        
-        candles = []
-        for candle in data:
-            candles.append({
-                "open": float(candle[1]),
-                "high": float(candle[2]),
-                "low": float(candle[3]),
-                "close": float(candle[4]),
-                "volume": float(candle[5]),
-                "close_time": candle[6]
-            })
-        return candles
+        return rows_to_candles(get_default_client().get_klines(symbol, interval, limit))
     except Exception as e:
         print(f"Lỗi: {e}")
         return None
@@ -84,8 +68,7 @@ def tf_text(tf):
     return {"1h": "H1", "2h": "H2", "4h": "H4", "1d": "D1"}.get(tf, tf)
 
 # ========== BACKTEST ==========
-def backtest(symbol, timeframe, num_candles=100):
-    candles = get_historical_klines(symbol, timeframe, limit=num_candles + 1)
+def find_signals(symbol, timeframe, candles):
     if not candles or len(candles) < 2:
         return []
     
@@ -105,6 +88,13 @@ def backtest(symbol, timeframe, num_candles=100):
             })
     return signals
 
+def backtest(symbol, timeframe, num_candles=100):
+    candles = get_historical_klines(symbol, timeframe, limit=num_candles + 1)
+    return find_signals(symbol, timeframe, candles)
+
+def fetch_pair(symbol, timeframe):
+    return get_historical_klines(symbol, timeframe, limit=BACKTEST_CANDLES + 1)
+
 # ========== MAIN ==========
 def run():
     print("\n" + "="*80)
@@ -113,10 +103,11 @@ def run():
     print(f"\n📊 Config: {', '.join(SYMBOLS)}")
     print(f"   Điều kiện: Body ≤ {DOJI_THRESHOLD_PERCENT}%, Volume ≤ {VOLUME_RATIO_THRESHOLD*100}%\n")
     
+    # Tải song song, đánh giá song song, giữ thứ tự symbol × timeframe
+    pairs = [(symbol, tf) for symbol in SYMBOLS for tf in TIMEFRAMES]
     all_signals = []
-    for symbol in SYMBOLS:
-        for tf in TIMEFRAMES:
-            all_signals.extend(backtest(symbol, tf, BACKTEST_CANDLES))
+    for signals in run_pairs(pairs, fetch_pair, find_signals):
+        all_signals.extend(signals)
     
     if not all_signals:
         print("❌ Không tìm thấy nến Doji nào!")
@@ -2,11 +2,11 @@
 Support/Resistance Calculator - Chính xác từ Pine Script
 Sử dụng scipy.signal.argrelextrema để tìm pivot points
 """
-import requests
 import pandas as pd
 import numpy as np
 from scipy.signal import argrelextrema
 from typing import List, Dict, Tuple, Optional
+from kline_client import KlineClient, get_default_client
 
 
 class SupportResistanceCalculator:
@@ -17,27 +17,20 @@ class SupportResistanceCalculator:
         channel_width_pct: int = 5,
         min_strength: int = 1,
         max_num_sr: int = 6,
-        loopback: int = 290
+        loopback: int = 290,
+        kline_client: Optional[KlineClient] = None
     ):
         self.prd = pivot_period
         self.channel_width_pct = channel_width_pct
         self.min_strength = min_strength
         self.max_num_sr = max_num_sr
         self.loopback = loopback
+        self.kline_client = kline_client or get_default_client()
     
     def get_klines(self, symbol: str, interval: str, limit: int = 500) -> Optional[pd.DataFrame]:
-        """Lấy dữ liệu từ Binance API"""
-        url = "https://api.binance.com/api/v3/klines"
-        params = {
-            "symbol": symbol,
-            "interval": interval,
-            "limit": limit
-        }
-        
+        """Lấy dữ liệu từ Binance API (qua kline client dùng chung)"""
         try:
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
+            data = self.kline_client.get_klines(symbol, interval, limit)
             
             df = pd.DataFrame(data, columns=[
                 'timestamp', 'open', 'high', 'low', 'close', 'volume',
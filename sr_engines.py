@@ -0,0 +1,266 @@
+"""
+SR Engines - Các cài đặt thay thế cho SupportResistanceCalculator (cùng input/output)
+- reference: SupportResistanceCalculator gốc (chuyển từ Pine Script) - chuẩn để so sánh
+- vectorized: cùng thuật toán, tính bằng NumPy (pivot bằng cửa sổ trượt, channel cho mọi pivot cùng lúc)
+- volume_profile: phương pháp khác - histogram volume theo giá (np.bincount), zone = vùng volume lớn
+Engine trong EQUIVALENT_ENGINES phải cho ra cùng zones với reference (test_sr.py trên golden fixtures)
+Registry chỉ import module của engine khi được tạo → chọn "vectorized" thì không cần pandas/scipy
+"""
+import importlib
+from typing import Dict, Optional
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from kline_client import KlineClient, get_default_client
+
+
+class VectorizedSRCalculator:
+    """Bản NumPy của SupportResistanceCalculator.calculate_sr_levels - không dùng pandas/scipy"""
+
+    def __init__(
+        self,
+        pivot_period: int = 10,
+        channel_width_pct: int = 5,
+        min_strength: int = 1,
+        max_num_sr: int = 6,
+        loopback: int = 290,
+        kline_client: Optional[KlineClient] = None
+    ):
+        self.prd = pivot_period
+        self.channel_width_pct = channel_width_pct
+        self.min_strength = min_strength
+        self.max_num_sr = max_num_sr
+        self.loopback = loopback
+        self.kline_client = kline_client or get_default_client()
+
+    def get_arrays(self, symbol: str, interval: str, limit: int = 500) -> Optional[Dict[str, np.ndarray]]:
+        """Lấy high/low/close/volume dạng mảng NumPy"""
+        try:
+            rows = self.kline_client.get_klines(symbol, interval, limit)
+            data = np.array([row[2:6] for row in rows], dtype=float).reshape(-1, 4)
+            return {"high": data[:, 0], "low": data[:, 1], "close": data[:, 2], "volume": data[:, 3]}
+        except Exception as e:
+            print(f"Lỗi khi lấy dữ liệu {symbol}: {e}")
+            return None
+
+    def find_pivots(self, high: np.ndarray, low: np.ndarray):
+        """
+        Pivot giống argrelextrema(order=prd, mode='clip'): giá trị >= (<=) mọi nến trong ±prd
+        Trả về (index, value) sắp xếp theo index giảm dần, cùng index thì H trước L
+        """
+        width = 2 * self.prd + 1
+        ph = np.flatnonzero(high >= sliding_window_view(np.pad(high, self.prd, mode="edge"), width).max(axis=1))
+        pl = np.flatnonzero(low <= sliding_window_view(np.pad(low, self.prd, mode="edge"), width).min(axis=1))
+
+        index = np.concatenate([ph, pl])
+        value = np.concatenate([high[ph], low[pl]])
+        order = np.argsort(-index, kind="stable")
+        return index[order], value[order]
+
+    def get_sr_vals(self, values: np.ndarray, cwidth: float):
+        """get_sr_vals cho mọi pivot cùng lúc: mỗi phần tử là 1 channel bắt đầu từ pivot đó"""
+        lo = values.copy()
+        hi = values.copy()
+        numpp = np.zeros(len(values), dtype=np.int64)
+
+        for cpp in values:
+            below = cpp <= hi
+            inside = np.where(below, hi - cpp, cpp - lo) <= cwidth
+            lo = np.where(inside & below, np.minimum(lo, cpp), lo)
+            hi = np.where(inside & ~below, np.maximum(hi, cpp), hi)
+            numpp += inside * 20
+
+        return hi, lo, numpp
+
+    def calculate_sr_levels(self, symbol: str, interval: str) -> Dict:
+        """Tính toán Support/Resistance levels (cùng schema với SupportResistanceCalculator)"""
+        arrays = self.get_arrays(symbol, interval, limit=500)
+
+        if arrays is None or len(arrays["close"]) < self.loopback:
+            return {
+                'support_zones': [],
+                'resistance_zones': [],
+                'current_price': 0,
+                'all_zones': []
+            }
+
+        high, low = arrays["high"], arrays["low"]
+        current_idx = len(high) - 1
+        current_price = arrays["close"][-1]
+
+        index, values = self.find_pivots(high, low)
+        values = values[current_idx - index <= self.loopback]
+
+        if len(values) < 2:
+            return {
+                'support_zones': [],
+                'resistance_zones': [],
+                'current_price': current_price,
+                'all_zones': []
+            }
+
+        cwidth = (high[-300:].max() - low[-300:].min()) * self.channel_width_pct / 100
+        hi, lo, strength = self.get_sr_vals(values, cwidth)
+
+        # Số nến (trong loopback) có high hoặc low nằm trong channel
+        recent_high = high[-self.loopback:]
+        recent_low = low[-self.loopback:]
+        touches = ((recent_high <= hi[:, None]) & (recent_high >= lo[:, None])) | \
+                  ((recent_low <= hi[:, None]) & (recent_low >= lo[:, None]))
+        strength = strength + touches.sum(axis=1)
+
+        # Sắp xếp theo strength (ổn định như list.sort) và lọc overlap
+        channels = []
+        for i in np.argsort(-strength, kind="stable"):
+            if strength[i] >= self.min_strength * 20:
+                sr = {'strength': int(strength[i]), 'high': hi[i], 'low': lo[i]}
+                is_overlap = any(
+                    (ch['low'] <= sr['high'] <= ch['high']) or (ch['low'] <= sr['low'] <= ch['high'])
+                    for ch in channels
+                )
+                if not is_overlap:
+                    channels.append(sr)
+
+                if len(channels) >= self.max_num_sr:
+                    break
+
+        support_zones = [(ch['low'], ch['high']) for ch in channels if ch['high'] < current_price]
+        resistance_zones = [(ch['low'], ch['high']) for ch in channels if ch['low'] > current_price]
+
+        return {
+            'support_zones': support_zones,
+            'resistance_zones': resistance_zones,
+            'current_price': current_price,
+            'all_zones': [{'low': ch['low'], 'high': ch['high'],
+                          'mid': (ch['low'] + ch['high'])/2,
+                          'strength': ch['strength']} for ch in channels]
+        }
+
+
+class VolumeProfileSRCalculator(VectorizedSRCalculator):
+    """
+    S/R theo volume profile: volume của `loopback` nến gần nhất chia đều theo giá trong [low, high] của nến
+    → histogram `bins` mức giá (mảng hiệu + np.bincount, O(số nến + bins), không vòng lặp theo nến)
+    Zone = đỉnh histogram (high-volume node) mở rộng sang 2 bên khi volume ≥ node_ratio × đỉnh,
+    rộng tối đa channel_width_pct% biên độ giá như channel của pivot
+    strength = phần nghìn tổng volume nằm trong zone (lọc: ≥ min_strength × 20, cùng ngưỡng với pivot)
+    """
+
+    def __init__(self, *args, bins: int = 100, node_ratio: float = 0.6, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.bins = bins
+        self.node_ratio = node_ratio
+
+    def volume_profile(self, high: np.ndarray, low: np.ndarray, volume: np.ndarray):
+        """(histogram volume theo bin, cạnh các bin)"""
+        edges = np.linspace(low.min(), high.max(), self.bins + 1)
+        first = np.clip(np.searchsorted(edges, low, side="right") - 1, 0, self.bins - 1)
+        last = np.clip(np.searchsorted(edges, high, side="left") - 1, first, self.bins - 1)
+        share = volume / (last - first + 1)
+
+        # Mảng hiệu: +share từ bin đầu, -share sau bin cuối → cumsum ra volume mỗi bin
+        delta = np.bincount(first, weights=share, minlength=self.bins + 1) - \
+            np.bincount(last + 1, weights=share, minlength=self.bins + 1)
+        return np.cumsum(delta[:-1]), edges
+
+    def find_nodes(self, hist: np.ndarray):
+        """Chỉ số các đỉnh histogram (≥ 2 bin kề, > trung bình), sắp theo volume giảm dần"""
+        padded = np.pad(hist, 1, constant_values=-1.0)
+        peaks = np.flatnonzero((hist >= padded[:-2]) & (hist >= padded[2:]) & (hist > hist.mean()))
+        return peaks[np.argsort(-hist[peaks], kind="stable")]
+
+    def calculate_sr_levels(self, symbol: str, interval: str) -> Dict:
+        """Tính toán Support/Resistance levels (cùng schema với SupportResistanceCalculator)"""
+        arrays = self.get_arrays(symbol, interval, limit=self.loopback)  # Chỉ dùng `loopback` nến cuối
+
+        if arrays is None or len(arrays["close"]) < self.loopback:
+            return {
+                'support_zones': [],
+                'resistance_zones': [],
+                'current_price': 0,
+                'all_zones': []
+            }
+
+        current_price = arrays["close"][-1]
+        high = arrays["high"][-self.loopback:]
+        low = arrays["low"][-self.loopback:]
+        volume = arrays["volume"][-self.loopback:]
+        total_volume = volume.sum()
+
+        if total_volume <= 0 or high.max() <= low.min():
+            return {
+                'support_zones': [],
+                'resistance_zones': [],
+                'current_price': current_price,
+                'all_zones': []
+            }
+
+        hist, edges = self.volume_profile(high, low, volume)
+        bin_width = edges[1] - edges[0]
+        max_bins = max(1, int((high.max() - low.min()) * self.channel_width_pct / 100 / bin_width))
+
+        # Zone quanh mỗi đỉnh: mở rộng sang bin kề lớn hơn đến khi đủ rộng hoặc volume tụt dưới ngưỡng
+        zones = []
+        for peak in self.find_nodes(hist):
+            lo_bin = hi_bin = peak
+            threshold = hist[peak] * self.node_ratio
+            while hi_bin - lo_bin + 1 < max_bins:
+                left = hist[lo_bin - 1] if lo_bin > 0 else -1.0
+                right = hist[hi_bin + 1] if hi_bin < self.bins - 1 else -1.0
+                if max(left, right) < threshold:
+                    break
+                if left >= right:
+                    lo_bin -= 1
+                else:
+                    hi_bin += 1
+            zones.append((lo_bin, hi_bin))
+
+        if not zones:
+            zones = [(int(np.argmax(hist)),) * 2]
+        lo_bins, hi_bins = np.array(zones).T
+        cumulative = np.concatenate([[0.0], np.cumsum(hist)])
+        strength = ((cumulative[hi_bins + 1] - cumulative[lo_bins]) * 1000 / total_volume).astype(np.int64)
+
+        # Sắp xếp theo strength và lọc overlap (như channel của pivot)
+        channels = []
+        for i in np.argsort(-strength, kind="stable"):
+            if strength[i] >= self.min_strength * 20:
+                sr = {'strength': int(strength[i]), 'high': edges[hi_bins[i] + 1], 'low': edges[lo_bins[i]]}
+                is_overlap = any(
+                    (ch['low'] <= sr['high'] <= ch['high']) or (ch['low'] <= sr['low'] <= ch['high'])
+                    for ch in channels
+                )
+                if not is_overlap:
+                    channels.append(sr)
+
+                if len(channels) >= self.max_num_sr:
+                    break
+
+        support_zones = [(ch['low'], ch['high']) for ch in channels if ch['high'] < current_price]
+        resistance_zones = [(ch['low'], ch['high']) for ch in channels if ch['low'] > current_price]
+
+        return {
+            'support_zones': support_zones,
+            'resistance_zones': resistance_zones,
+            'current_price': current_price,
+            'all_zones': [{'low': ch['low'], 'high': ch['high'],
+                          'mid': (ch['low'] + ch['high'])/2,
+                          'strength': ch['strength']} for ch in channels]
+        }
+
+
+# Tên engine → "module:Class" (cùng tham số khởi tạo với SupportResistanceCalculator)
+SR_ENGINES = {
+    "reference": "sr_calculator:SupportResistanceCalculator",
+    "vectorized": "sr_engines:VectorizedSRCalculator",
+    "volume_profile": "sr_engines:VolumeProfileSRCalculator"
+}
+# Engine cùng thuật toán với reference (phải khớp golden); engine khác chỉ cần đúng schema
+EQUIVALENT_ENGINES = ["reference", "vectorized"]
+
+
+def create_sr_engine(name: str = "reference", **kwargs):
+    """Tạo SR engine theo tên trong SR_ENGINES (import module của engine lúc này)"""
+    if name not in SR_ENGINES:
+        raise ValueError(f"SR engine không tồn tại: {name} (có: {', '.join(SR_ENGINES)})")
+    module_name, class_name = SR_ENGINES[name].split(":")
+    return getattr(importlib.import_module(module_name), class_name)(**kwargs)
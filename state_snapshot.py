@@ -0,0 +1,124 @@
+"""
+State Snapshot - Lưu/khôi phục trạng thái detector để khởi động lại nhanh (warm restart)
+- Nội dung: signal_cache (chống gửi trùng), nến đóng đã xử lý của từng cặp, vùng S/R, chỉ báo,
+  cache nến của kline client
+- Quét nhiều sàn: mỗi sàn 1 trạng thái riêng trong cùng file, key theo tên sàn ("venues")
+- File JSON nén gzip, ghi nguyên tử (file tạm + os.replace) → không bao giờ đọc phải file ghi dở
+- Sau khi khôi phục, các cặp đã xử lý nến vừa đóng không gọi API lại → không dồn request lúc khởi động
+"""
+import os
+import gzip
+import json
+import time
+import tempfile
+from zone_index import SRZoneIndex
+
+STATE_FILE = os.getenv("STATE_FILE", "state.json.gz")
+SNAPSHOT_INTERVAL = 60     # Giây giữa 2 lần lưu định kỳ
+SNAPSHOT_KLINE_ROWS = 3    # Chỉ giữ vài nến cuối của mỗi entry cache (đủ cho lượt quét)
+SNAPSHOT_VERSION = 1
+
+
+def _key(symbol, timeframe):
+    return f"{symbol} {timeframe}"
+
+
+def _split_key(key):
+    symbol, timeframe = key.split(" ")
+    return symbol, timeframe
+
+
+def snapshot_state(detector):
+    """Trạng thái của detector dạng dict JSON được"""
+    return {
+        "version": SNAPSHOT_VERSION,
+        "saved_at": detector.clock.time(),
+        "signal_cache": list(detector.signal_cache.items()),
+        "last_close_times": {_key(*key): close_time for key, close_time in detector.last_close_times.items()},
+        "sr_zones": {
+            _key(*key): [detector.sr_cache_time[key], zone_index.to_dict()]
+            for key, zone_index in detector.sr_cache.items() if key in detector.sr_cache_time
+        },
+        "indicators": {_key(*key): state for key, state in detector.indicators.export_states().items()},
+        "klines": detector.kline_client.export_cache(SNAPSHOT_KLINE_ROWS)
+    }
+
+
+def restore_state(detector, state):
+    """Nạp trạng thái vào detector (bỏ qua nếu khác version)"""
+    if state.get("version") != SNAPSHOT_VERSION:
+        return False
+
+    for cache_key, sent in state.get("signal_cache", []):
+        detector.remember_signal(cache_key, sent)
+    for key, close_time in state.get("last_close_times", {}).items():
+        detector.last_close_times[_split_key(key)] = close_time
+    for key, (close_time, sr_levels) in state.get("sr_zones", {}).items():
+        detector.sr_cache[_split_key(key)] = SRZoneIndex(sr_levels)
+        detector.sr_cache_time[_split_key(key)] = close_time
+    detector.indicators.import_states({_split_key(key): values for key, values in state.get("indicators", {}).items()})
+    detector.kline_client.import_cache(state.get("klines", []))
+    return True
+
+
+def venue_name(detector):
+    """Key trạng thái của detector trong snapshot = tên sàn của kline client"""
+    return detector.kline_client.exchange.name
+
+
+def snapshot_venues(detectors):
+    """Trạng thái mọi sàn: {"version", "venues": {tên sàn: snapshot_state}}"""
+    return {
+        "version": SNAPSHOT_VERSION,
+        "venues": {venue_name(detector): snapshot_state(detector) for detector in detectors}
+    }
+
+
+def restore_venues(detectors, state):
+    """Nạp trạng thái từng sàn vào detector cùng tên - trả về danh sách sàn đã khôi phục"""
+    venues = state.get("venues")
+    if venues is None:
+        # Snapshot cũ (1 sàn, không có "venues") → trạng thái của sàn chính
+        venues = {venue_name(detectors[0]): state}
+    return [venue_name(detector) for detector in detectors
+            if venue_name(detector) in venues and restore_state(detector, venues[venue_name(detector)])]
+
+
+def write_snapshot(state, path=STATE_FILE):
+    """Ghi snapshot nguyên tử: ghi file tạm cùng thư mục rồi os.replace (chạy được trong thread)"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".state-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as f:
+            f.write(json.dumps(state, separators=(",", ":")).encode())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def save_snapshot(detectors, path=STATE_FILE):
+    write_snapshot(snapshot_venues(detectors), path)
+
+
+def load_snapshot(detectors, path=STATE_FILE):
+    """Khôi phục các detector (mỗi sàn 1) từ file snapshot nếu có - trả về True nếu khôi phục được sàn nào"""
+    if not os.path.exists(path):
+        return False
+    try:
+        started = time.perf_counter()
+        with gzip.open(path, "rt") as f:
+            state = json.load(f)
+        restored = restore_venues(detectors, state)
+        if not restored:
+            print(f"⚠️ Bỏ qua snapshot {path}: khác version hoặc không có sàn đang quét")
+            return False
+        for detector in detectors:
+            if venue_name(detector) in restored:
+                print(f"♻️ Đã khôi phục trạng thái {venue_name(detector)} từ {path} "
+                      f"({time.perf_counter() - started:.2f}s): {len(detector.signal_cache)} tín hiệu cache, "
+                      f"{len(detector.last_close_times)} cặp đã xử lý, {len(detector.sr_cache)} vùng S/R")
+        return True
+    except Exception as e:
+        print(f"⚠️ Không đọc được snapshot {path}: {e}")
+        return False
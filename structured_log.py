@@ -0,0 +1,149 @@
+"""
+Structured Log - Log JSON lines không chặn vòng quét
+- Vòng quét chỉ đưa LogRecord vào queue (QueueHandler); 1 thread nền (QueueListener) format JSON + ghi ra
+- Mỗi dòng: ts, level, event + các trường (symbol, timeframe, latency_ms, outcome, ...)
+- Lấy mẫu sự kiện lặp lại: LOG_SAMPLE="pair_scanned=100" → chỉ ghi 1/100 (có trường sample_rate),
+  cảnh báo/lỗi luôn được ghi đầy đủ
+- Ghi ra LOG_FILE nếu có, không thì stdout
+"""
+import os
+import sys
+import json
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+LOGGER_NAME = "dojiscan"
+LOG_FILE = os.getenv("LOG_FILE")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_QUEUE_SIZE = 10000   # Queue đầy → bỏ bản ghi thay vì chặn vòng quét
+# Sự kiện → ghi 1 trên N lần (ghi đè bằng LOG_SAMPLE="event=N,event2=M")
+DEFAULT_SAMPLE_RATES = {
+    "pair_scanned": 50,
+    "kline_fetched": 50
+}
+
+logger = logging.getLogger(LOGGER_NAME)
+
+
+def parse_sample_rates(text):
+    """'a=10,b=100' → {'a': 10, 'b': 100}"""
+    rates = {}
+    for item in (text or "").replace(" ", "").split(","):
+        if "=" in item:
+            event, rate = item.split("=", 1)
+            rates[event] = max(1, int(rate))
+    return rates
+
+
+class EventSampler:
+    """Lấy mẫu xác định 1/N theo tên sự kiện (đếm, không random → lặp lại được)"""
+
+    def __init__(self, rates=None):
+        self.rates = dict(rates or {})
+        self.counts = {}
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def rate(self, event):
+        return self.rates.get(event, 1)
+
+    def should_log(self, event):
+        rate = self.rates.get(event, 1)
+        if rate == 1:
+            return True
+        with self._lock:
+            count = self.counts.get(event, 0)
+            self.counts[event] = count + 1
+            if count % rate == 0:
+                return True
+            self.dropped += 1
+            return False
+
+
+class JsonFormatter(logging.Formatter):
+    """LogRecord → 1 dòng JSON (chạy trong thread của QueueListener)"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "event": record.getMessage()
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _DropQueueHandler(QueueHandler):
+    """QueueHandler không chặn: queue đầy → đếm số bản ghi bị bỏ"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # Bản ghi chỉ chứa dữ liệu thô, format JSON để thread nền làm
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+sampler = EventSampler(DEFAULT_SAMPLE_RATES)
+_listener = None
+
+
+def setup_logging(path=LOG_FILE, level=LOG_LEVEL, sample_rates=None):
+    """Bật pipeline log (gọi 1 lần khi khởi động bot) - trả về QueueListener đang chạy"""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    sampler.rates.update(sample_rates if sample_rates is not None else parse_sample_rates(os.getenv("LOG_SAMPLE")))
+
+    output = logging.FileHandler(path, encoding="utf-8") if path else logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter())
+
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    logger.addHandler(_DropQueueHandler(log_queue))
+    logger.setLevel(level)
+    logger.propagate = False
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=False)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """Ghi nốt các bản ghi còn trong queue rồi dừng thread nền"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def log_event(event, level=logging.INFO, exc_info=None, **fields):
+    """
+    Ghi 1 sự kiện có cấu trúc: log_event("signal_sent", symbol="BTCUSDT", latency_ms=12.3)
+    Sự kiện INFO/DEBUG bị lấy mẫu theo sampler; WARNING trở lên luôn ghi
+    """
+    if not logger.isEnabledFor(level):
+        return
+    if level < logging.WARNING:
+        if not sampler.should_log(event):
+            return
+        rate = sampler.rate(event)
+        if rate > 1:
+            fields["sample_rate"] = rate
+    logger.log(level, event, exc_info=exc_info, extra={"fields": fields})
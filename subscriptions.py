@@ -0,0 +1,141 @@
+"""
+Subscriptions - Mỗi chat đăng ký nhận tín hiệu theo bộ lọc (symbol, timeframe, hướng, sàn)
+- Mỗi trường có thể là "*" (tất cả): ("*", "4h", "LONG", "*") = mọi coin, khung H4, chỉ LONG, mọi sàn
+- Inverted index: khóa (symbol|*, timeframe|*, hướng|*, sàn|*) → tập chat_id
+  → 1 tín hiệu chỉ cần tra 16 khóa, chi phí O(số người nhận), không duyệt qua mọi subscriber
+- 1 lượt quét dùng chung cho mọi subscriber: thêm người nhận không thêm request nào tới sàn
+"""
+import os
+import json
+from itertools import product
+from exchanges import EXCHANGES
+
+SUBSCRIPTIONS_FILE = "subscriptions.json"
+WILDCARD = "*"
+TIMEFRAMES = ["1h", "2h", "4h", "1d"]
+DIRECTIONS = ["LONG", "SHORT"]
+MAX_FILTERS_PER_CHAT = 50
+
+
+def parse_filter(args):
+    """
+    Tham số lệnh → (symbol, timeframe, direction, venue) hoặc raise ValueError
+    Thứ tự tự do, thiếu trường nào coi là "*": ["BTCUSDT", "4h"] → ("BTCUSDT", "4h", "*", "*")
+    """
+    symbol = timeframe = direction = venue = WILDCARD
+    for arg in args:
+        value = arg.strip()
+        if value.lower() in TIMEFRAMES:
+            timeframe = value.lower()
+        elif value.lower() in EXCHANGES:
+            venue = value.lower()
+        elif value.upper() in DIRECTIONS:
+            direction = value.upper()
+        elif value.upper().endswith("USDT"):
+            symbol = value.upper()
+        elif value not in (WILDCARD, "all"):
+            raise ValueError(f"Không hiểu '{value}' (symbol XXXUSDT, khung {'/'.join(TIMEFRAMES)}, LONG/SHORT, "
+                             f"sàn {'/'.join(EXCHANGES)}, *)")
+    return symbol, timeframe, direction, venue
+
+
+def format_filter(flt):
+    symbol, timeframe, direction, venue = flt
+    return f"{'mọi coin' if symbol == WILDCARD else symbol} | " \
+           f"{'mọi khung' if timeframe == WILDCARD else timeframe} | " \
+           f"{'mọi hướng' if direction == WILDCARD else direction} | " \
+           f"{'mọi sàn' if venue == WILDCARD else getattr(EXCHANGES.get(venue), 'label', venue)}"
+
+
+class SubscriptionManager:
+
+    def __init__(self, filename=SUBSCRIPTIONS_FILE):
+        self.filename = filename
+        self.subscriptions = {}   # chat_id -> set (symbol, timeframe, direction, venue)
+        self.index = {}           # (symbol, timeframe, direction, venue) -> set chat_id
+        for chat_id, filters in self.load_subscriptions().items():
+            for flt in filters:
+                # Bộ lọc lưu trước khi có sàn (3 trường) = mọi sàn
+                self._add(chat_id, tuple(flt) + (WILDCARD,) * (4 - len(flt)))
+
+    def load_subscriptions(self):
+        """Load subscriptions từ file: {chat_id: [[symbol, timeframe, direction, venue], ...]}"""
+        if os.path.exists(self.filename):
+            try:
+                with open(self.filename, 'r') as f:
+                    data = json.load(f)
+                return {int(chat_id): filters for chat_id, filters in data.get('subscriptions', {}).items()}
+            except Exception as e:
+                print(f"❌ Lỗi khi đọc subscriptions: {e}")
+        return {}
+
+    def save_subscriptions(self):
+        """Lưu subscriptions vào file"""
+        try:
+            data = {str(chat_id): sorted(list(flt) for flt in filters)
+                    for chat_id, filters in self.subscriptions.items()}
+            with open(self.filename, 'w') as f:
+                json.dump({'subscriptions': data}, f, indent=2)
+            return True
+        except Exception as e:
+            print(f"❌ Lỗi khi lưu subscriptions: {e}")
+            return False
+
+    def _add(self, chat_id, flt):
+        self.subscriptions.setdefault(chat_id, set()).add(flt)
+        self.index.setdefault(flt, set()).add(chat_id)
+
+    def _remove(self, chat_id, flt):
+        self.subscriptions[chat_id].discard(flt)
+        if not self.subscriptions[chat_id]:
+            del self.subscriptions[chat_id]
+        chats = self.index.get(flt)
+        if chats is not None:
+            chats.discard(chat_id)
+            if not chats:
+                del self.index[flt]
+
+    def subscribe(self, chat_id, flt):
+        """Thêm bộ lọc cho chat"""
+        filters = self.subscriptions.get(chat_id, set())
+        if flt in filters:
+            return False, f"⚠️ Đã đăng ký: {format_filter(flt)}"
+        if len(filters) >= MAX_FILTERS_PER_CHAT:
+            return False, f"❌ Tối đa {MAX_FILTERS_PER_CHAT} bộ lọc mỗi chat"
+
+        self._add(chat_id, flt)
+        if self.save_subscriptions():
+            return True, f"✅ Đã đăng ký: {format_filter(flt)}"
+        self._remove(chat_id, flt)
+        return False, "❌ Lỗi khi lưu đăng ký"
+
+    def unsubscribe(self, chat_id, flt=None):
+        """Xóa 1 bộ lọc, hoặc mọi bộ lọc của chat nếu flt=None"""
+        filters = set(self.subscriptions.get(chat_id, set()))
+        removing = filters if flt is None else filters & {flt}
+        if not removing:
+            return False, "⚠️ Không có đăng ký nào phù hợp"
+
+        for item in removing:
+            self._remove(chat_id, item)
+        if self.save_subscriptions():
+            return True, f"✅ Đã hủy {len(removing)} đăng ký"
+        for item in removing:
+            self._add(chat_id, item)
+        return False, "❌ Lỗi khi lưu thay đổi"
+
+    def get_filters(self, chat_id):
+        return sorted(self.subscriptions.get(chat_id, set()))
+
+    def recipients(self, symbol, timeframe, direction, venue=WILDCARD):
+        """Mọi chat có bộ lọc khớp tín hiệu - tra 16 khóa (mỗi trường: giá trị thật hoặc *)"""
+        chats = set()
+        for key in product((symbol, WILDCARD), (timeframe, WILDCARD), (direction, WILDCARD), (venue, WILDCARD)):
+            matched = self.index.get(key)
+            if matched:
+                chats |= matched
+        return chats
+
+    def signal_recipients(self, signal):
+        return self.recipients(signal["symbol"], signal["interval"], signal["signal_type"],
+                               signal.get("exchange", WILDCARD))
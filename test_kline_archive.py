@@ -0,0 +1,125 @@
+"""
+Test kline_archive: ghi / ghi thêm / đọc lại đúng từng giá trị, và load_history tự tải lại khi archive hỏng
+- Dữ liệu tổng hợp + sàn giả trong bộ nhớ (StubExchange): không mạng
+"""
+import time
+import numpy as np
+import backtest_engine
+from exchanges import COLUMNS, StubExchange, rows_to_arrays
+from kline_archive import write_archive, append_archive, read_archive, read_index
+from kline_client import KlineClient, INTERVAL_MS
+
+HOUR_MS = INTERVAL_MS["1h"]
+CHUNK = 64   # Khối nhỏ để test nhiều khối + khối cuối chưa đầy với ít nến
+
+
+def make_arrays(count, start_ms=1_600_000_000_000 // HOUR_MS * HOUR_MS, gap_at=None, seed=0):
+    """Nến 1h tổng hợp (giá 2 chữ số thập phân, volume 5 chữ số), hụt 3 nến tại gap_at"""
+    rng = np.random.default_rng(seed)
+    open_time = start_ms + np.arange(count, dtype=np.int64) * HOUR_MS
+    if gap_at is not None:
+        open_time[gap_at:] += 3 * HOUR_MS
+    close = np.round(30000 * np.exp(np.cumsum(rng.normal(0, 0.005, count))), 2)
+    open_ = np.round(np.r_[close[0], close[:-1]], 2)
+    return {
+        "open_time": open_time,
+        "open": open_,
+        "high": np.round(np.maximum(open_, close) * 1.002, 2),
+        "low": np.round(np.minimum(open_, close) * 0.998, 2),
+        "close": close,
+        "volume": np.round(rng.lognormal(6, 1, count), 5),
+        "close_time": open_time + HOUR_MS - 1
+    }
+
+
+def assert_same(actual, expected):
+    for col in COLUMNS:
+        assert actual[col].dtype == expected[col].dtype, col
+        assert np.array_equal(actual[col], expected[col]), col
+
+
+def test_round_trip_with_partial_chunk_and_gap(tmp_path):
+    arrays = make_arrays(3 * CHUNK + 10, gap_at=100)
+    path = str(tmp_path / "BTCUSDT_1h.dka")
+    write_archive(path, arrays, "BTCUSDT", "1h", chunk_rows=CHUNK)
+
+    chunks = read_index(path)["chunks"]
+    assert [chunk["rows"] for chunk in chunks] == [CHUNK, CHUNK, CHUNK, 10]
+    assert_same(read_archive(path), arrays)
+
+
+def test_range_read(tmp_path):
+    arrays = make_arrays(3 * CHUNK + 10, gap_at=100)
+    path = str(tmp_path / "BTCUSDT_1h.dka")
+    write_archive(path, arrays, chunk_rows=CHUNK)
+
+    # Khoảng cắt ngang 2 khối, qua chỗ hụt nến; biên không trùng open_time nào
+    start, end = int(arrays["open_time"][90]) - 1, int(arrays["open_time"][150]) + 1
+    keep = (arrays["open_time"] >= start) & (arrays["open_time"] <= end)
+    assert_same(read_archive(path, start, end), {col: arrays[col][keep] for col in COLUMNS})
+    assert len(read_archive(path, start_ms=int(arrays["open_time"][-1]) + 1)["open_time"]) == 0
+
+
+def test_append_fills_last_chunk(tmp_path):
+    arrays = make_arrays(3 * CHUNK + 10, gap_at=100)
+    path = str(tmp_path / "BTCUSDT_1h.dka")
+    write_archive(path, {col: arrays[col][:CHUNK + 5] for col in COLUMNS}, chunk_rows=CHUNK)
+
+    # Ghi thêm từng phần, có phần chồng lên nến đã có (chỉ nến mới hơn được thêm)
+    assert append_archive(path, {col: arrays[col][CHUNK:2 * CHUNK + 1] for col in COLUMNS}) == CHUNK - 4
+    assert append_archive(path, {col: arrays[col][:CHUNK] for col in COLUMNS}) == 0
+    assert append_archive(path, {col: arrays[col][2 * CHUNK + 1:] for col in COLUMNS}) == CHUNK + 9
+
+    assert [chunk["rows"] for chunk in read_index(path)["chunks"]] == [CHUNK, CHUNK, CHUNK, 10]
+    assert_same(read_archive(path), arrays)
+
+
+# ========== LOAD_HISTORY ==========
+def stub_client(now_ms, count=800):
+    """Sàn giả có `count` nến 1h đến hết nến đang chạy tại now_ms"""
+    arrays = make_arrays(count, start_ms=(now_ms // HOUR_MS - count + 1) * HOUR_MS)
+    rows = [[int(arrays["open_time"][i]), *(float(arrays[col][i]) for col in COLUMNS[1:6]),
+             int(arrays["close_time"][i])] for i in range(count)]
+    return KlineClient(exchange=StubExchange({("BTCUSDT", "1h"): rows})), rows
+
+
+def assert_history(history, rows, days):
+    """Đúng mọi nến đã đóng của sàn giả trong `days` ngày (không phụ thuộc thời điểm chạy test)"""
+    now_ms = int(time.time() * 1000)
+    first, last = int(history["open_time"][0]), int(history["open_time"][-1])
+    assert now_ms - days * 24 * 3600 * 1000 - HOUR_MS <= first <= now_ms - days * 24 * 3600 * 1000 + HOUR_MS
+    assert history["close_time"][-1] < now_ms <= history["close_time"][-1] + 2 * HOUR_MS
+    assert_same(history, rows_to_arrays([row for row in rows if first <= row[0] <= last]))
+
+
+def test_load_history_rebuilds_corrupt_archive(tmp_path):
+    history_dir = str(tmp_path)
+    client, rows = stub_client(int(time.time() * 1000))
+    client.exchange.klines_data[("BTCUSDT", "1h")] = rows[:-50]
+    backtest_engine.load_history("BTCUSDT", "1h", 20, history_dir, client)
+
+    # Hỏng 1 khối (chỉ mục vẫn đọc được) → ghi thêm thất bại → xóa, tải lại từ đầu
+    path = backtest_engine._history_path("BTCUSDT", "1h", history_dir)
+    last = read_index(path)["chunks"][-1]
+    with open(path, "r+b") as f:
+        f.seek(last["offset"])
+        f.write(b"\0" * min(16, last["length"]))
+
+    client.exchange.klines_data[("BTCUSDT", "1h")] = rows
+    requests = client.stats["requests"]
+    history = backtest_engine.load_history("BTCUSDT", "1h", 20, history_dir, client)
+    assert client.stats["requests"] > requests + 1   # Lần ghi thêm + lần tải lại từ đầu
+    assert_history(history, rows, 20)
+    assert_same(read_archive(path, start_ms=int(history["open_time"][0])), history)
+
+
+def test_load_history_rewrites_unreadable_archive(tmp_path):
+    history_dir = str(tmp_path)
+    client, rows = stub_client(int(time.time() * 1000))
+    path = backtest_engine._history_path("BTCUSDT", "1h", history_dir)
+    with open(path, "wb") as f:
+        f.write(b"not an archive")
+
+    history = backtest_engine.load_history("BTCUSDT", "1h", 20, history_dir, client)
+    assert_history(history, rows, 20)
+    assert read_index(path)["rows"] >= len(history["open_time"])
@@ -0,0 +1,94 @@
+"""
+Test KlineClient: single-flight + cache theo nến đã đóng
+- Sàn giả trong bộ nhớ (StubExchange) + đồng hồ ảo: đếm đúng số request, không mạng
+"""
+import asyncio
+import threading
+from clock import VirtualClock
+from exchanges import StubExchange
+from kline_client import KlineClient, INTERVAL_MS
+
+HOUR_MS = INTERVAL_MS["1h"]
+START_MS = 1_700_006_400_000 + 30 * 60 * 1000   # Giữa 1 nến 1h
+CALLERS = 8
+
+
+def stub_rows(end_ms, count=500, step=HOUR_MS):
+    first = (end_ms // step - count + 1) * step
+    return [[open_time, "1.0", "1.1", "0.9", "1.05", "10.0", open_time + step - 1]
+            for open_time in range(first, end_ms + step, step)]
+
+
+class GatedStubExchange(StubExchange):
+    """Request chỉ trả về khi gate được mở → các caller chắc chắn chồng lên nhau"""
+
+    def __init__(self, klines=None, clock=None):
+        super().__init__(klines, clock)
+        self.gate = threading.Event()
+
+    def klines(self, symbol, interval, limit, **extra):
+        self.gate.wait(timeout=5)
+        return super().klines(symbol, interval, limit, **extra)
+
+
+def make_client(exchange_class=StubExchange):
+    clock = VirtualClock(START_MS / 1000)
+    exchange = exchange_class({("BTCUSDT", "1h"): stub_rows(START_MS + 10 * HOUR_MS)}, clock)
+    return KlineClient(exchange=exchange, clock=clock)
+
+
+def test_concurrent_fetches_share_one_request():
+    client = make_client(GatedStubExchange)
+
+    async def run():
+        callers = [asyncio.ensure_future(client.fetch_klines("BTCUSDT", "1h", 100)) for _ in range(CALLERS)]
+        await asyncio.sleep(0)   # Mọi caller đã vào fetch_klines và đang chờ chung 1 future
+        client.exchange.gate.set()
+        return await asyncio.gather(*callers)
+
+    results = asyncio.run(run())
+    assert client.stats["requests"] == 1
+    assert client.stats["coalesced"] == CALLERS - 1
+    assert all(rows is results[0] for rows in results)
+    assert len(results[0]) == 100
+    assert results[0][-1][0] <= START_MS
+
+    # Request xong → key được gỡ, lần sau lấy từ cache
+    assert client._tasks == {}
+    asyncio.run(client.fetch_klines("BTCUSDT", "1h", 100))
+    assert client.stats["requests"] == 1
+    assert client.stats["cache_hits"] == 1
+
+
+def test_smaller_limit_served_from_cached_tail():
+    client = make_client()
+    rows = client.get_klines("BTCUSDT", "1h", 200)
+
+    assert asyncio.run(client.fetch_klines("BTCUSDT", "1h", 3)) == rows[-3:]
+    assert client.get_klines("BTCUSDT", "1h", 200) == rows
+    assert client.stats["requests"] == 1
+    assert client.stats["cache_hits"] == 2
+
+    # Cần nhiều nến hơn lần lấy trước → phải gọi sàn
+    assert len(client.get_klines("BTCUSDT", "1h", 300)) == 300
+    assert client.stats["requests"] == 2
+
+
+def test_cache_invalidated_at_candle_boundary():
+    client = make_client()
+    clock = client.clock
+    clock.advance((HOUR_MS - START_MS % HOUR_MS) / 1000 - 2)   # 2 giây trước khi nến đóng
+
+    before = client.get_klines("BTCUSDT", "1h", 3)
+    assert client._get_cached("BTCUSDT", "1h", 3) == before
+
+    # Vẫn trong cache_ttl nhưng đã sang nến mới → không dùng cache, rows có nến vừa mở
+    clock.advance(3)
+    assert client._get_cached("BTCUSDT", "1h", 3) is None
+    after = client.get_klines("BTCUSDT", "1h", 3)
+    assert client.stats["requests"] == 2
+    assert after[-1][0] == before[-1][0] + HOUR_MS
+
+    # Cùng nến nhưng quá cache_ttl → cũng hết hạn
+    clock.advance(client.cache_ttl + 1)
+    assert client._get_cached("BTCUSDT", "1h", 3) is None
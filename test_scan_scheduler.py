@@ -0,0 +1,165 @@
+"""
+Test DeadlineScheduler + thứ tự quét của DojiDetector.scan_symbols
+- Đồng hồ ảo (VirtualClock) + sàn giả trong bộ nhớ (StubExchange): không mạng, kết quả xác định
+"""
+import asyncio
+from clock import VirtualClock
+from detector import DojiDetector
+from exchanges import StubExchange
+from kline_client import KlineClient, INTERVAL_MS
+from scan_scheduler import DeadlineScheduler
+
+DAY_MS = INTERVAL_MS["1d"]
+START_MS = 1_700_006_400_000 // DAY_MS * DAY_MS   # 00:00 UTC - nến 1h và 1d cùng vừa đóng
+SYMBOLS = ["BBBUSDT", "AAAUSDT"]
+STUB_BARS = 300
+
+
+# ========== DỮ LIỆU GIẢ ==========
+def stub_rows(interval, end_ms, count=STUB_BARS):
+    """Nến tăng đều (thân lớn → không bao giờ là Doji), nến cuối mở trước end_ms"""
+    step = INTERVAL_MS[interval]
+    first = (end_ms // step - count + 1) * step
+    return [[open_time, "100.0", "106.0", "99.0", "105.0", "10.0", open_time + step - 1]
+            for open_time in range(first, end_ms, step)]
+
+
+class SlowStubExchange(StubExchange):
+    """Mỗi request làm đồng hồ ảo tiến `latency` giây (mô phỏng sàn chậm / quá tải)"""
+
+    def __init__(self, klines=None, clock=None, latency=0.0):
+        super().__init__(klines, clock)
+        self.latency = latency
+
+    def klines(self, symbol, interval, limit, **extra):
+        self.clock.sleep_blocking(self.latency)
+        return super().klines(symbol, interval, limit, **extra)
+
+
+def make_detector(now_ms, timeframes=("1d", "1h"), latency=0.0):
+    clock = VirtualClock(now_ms / 1000)
+    end_ms = now_ms + 2 * DAY_MS
+    klines = {(symbol, tf): stub_rows(tf, end_ms) for symbol in SYMBOLS for tf in timeframes}
+    exchange = SlowStubExchange(klines, clock, latency)
+    detector = DojiDetector(kline_client=KlineClient(exchange=exchange, clock=clock), clock=clock)
+    detector.timeframes = list(timeframes)
+    return detector
+
+
+def timeframe_order(scanned):
+    """Thứ tự khung được quét (cùng hạn chót thì thứ tự symbol không xác định)"""
+    return [timeframe for _, timeframe in scanned]
+
+
+def scan(detector, record=None):
+    """1 lượt scan_symbols; record: list nhận (symbol, timeframe) theo thứ tự được quét"""
+    scan_pair = detector.scan_pair
+
+    async def recording_scan_pair(symbol, timeframe, current_time):
+        if record is not None:
+            record.append((symbol, timeframe))
+        return await scan_pair(symbol, timeframe, current_time)
+
+    detector.scan_pair = recording_scan_pair
+    return asyncio.run(detector.scan_symbols(SYMBOLS))
+
+
+# ========== SCHEDULER ==========
+def test_plan_orders_by_remaining_budget():
+    scheduler = DeadlineScheduler(DojiDetector.MAX_DELAY_MS)
+
+    # Nến 1h và 1d cùng đóng: 1h còn 5 phút, 1d còn 30 phút → 1h trước dù đứng sau trong danh sách
+    boundaries = {"1d": START_MS - 1, "1h": START_MS - 1}
+    tasks = scheduler.plan(SYMBOLS, ["1d", "1h"], boundaries, {})
+    order = [(task.timeframe, task.symbol) for task in (scheduler.pop(tasks) for _ in range(len(tasks)))]
+    assert [tf for tf, _ in order] == ["1h", "1h", "1d", "1d"]
+
+    # 01:00: nến 1h mới đóng còn 1h05 - nến 1d (chưa xử lý) chỉ còn 30 phút → 1d trước
+    boundaries = {"1d": START_MS - 1, "1h": START_MS + INTERVAL_MS["1h"] - 1}
+    tasks = scheduler.plan(SYMBOLS, ["1h", "1d"], boundaries, {("AAAUSDT", "1h"): boundaries["1h"]})
+    order = [(task.timeframe, task.symbol) for task in (scheduler.pop(tasks) for _ in range(len(tasks)))]
+    assert [tf for tf, _ in order] == ["1d", "1d", "1h"]
+    assert order[-1] == ("1h", "BBBUSDT")
+    assert scheduler.stats["scheduled"] == 7
+    assert scheduler.stats["backlog"] == 0
+
+
+def test_admit_sheds_when_estimated_cost_exceeds_deadline():
+    scheduler = DeadlineScheduler(DojiDetector.MAX_DELAY_MS)
+    task = scheduler.plan(["AAAUSDT"], ["1h"], {"1h": START_MS - 1}, {})[0]
+    scheduler.task_cost_ms = 60_000
+
+    assert scheduler.admit(task, task.deadline - 120_000)
+    assert not scheduler.admit(task, task.deadline - 30_000)
+    assert not scheduler.admit(task, task.deadline + 1)
+    assert scheduler.stats["shed"] == 2
+
+    # Tắt shed: chỉ bỏ task đã quá hạn
+    lenient = DeadlineScheduler(DojiDetector.MAX_DELAY_MS, shed=False)
+    lenient.task_cost_ms = 60_000
+    assert lenient.admit(task, task.deadline - 30_000)
+    assert not lenient.admit(task, task.deadline + 1)
+
+
+def test_complete_counts_missed_and_updates_cost():
+    scheduler = DeadlineScheduler(DojiDetector.MAX_DELAY_MS)
+    task = scheduler.plan(["AAAUSDT"], ["1h"], {"1h": START_MS - 1}, {})[0]
+    cost = scheduler.task_cost_ms
+
+    scheduler.complete(task, task.deadline - 1_000, task.deadline - 500)
+    assert scheduler.stats["missed"] == 0
+    assert scheduler.task_cost_ms == cost + 0.2 * (500 - cost)
+
+    scheduler.complete(task, task.deadline - 1_000, task.deadline + 2_000)
+    assert scheduler.stats == {**scheduler.stats, "completed": 2, "missed": 1, "max_lateness_ms": 2_000}
+
+
+# ========== DETECTOR.SCAN_SYMBOLS ==========
+def test_scan_symbols_scans_by_deadline():
+    detector = make_detector(START_MS + 60_000)
+    scanned = []
+    scan(detector, scanned)
+
+    assert timeframe_order(scanned) == ["1h", "1h", "1d", "1d"]
+    assert set(scanned) == {(symbol, tf) for symbol in SYMBOLS for tf in ["1h", "1d"]}
+    assert detector.scheduler.stats["completed"] == 4
+    assert detector.scheduler.stats["missed"] == 0
+
+    # Cùng nến → không lập lịch lại, không gọi sàn
+    requests = detector.kline_client.stats["requests"]
+    scanned.clear()
+    scan(detector, scanned)
+    assert scanned == []
+    assert detector.kline_client.stats["requests"] == requests
+
+
+def test_scan_symbols_defers_candle_not_closed_yet():
+    # 5 giây sau khi đóng (< 10 giây) → chưa xử lý, lượt sau quét lại
+    detector = make_detector(START_MS + 5_000, timeframes=("1h",))
+    scan(detector)
+    assert detector.scheduler.stats["deferred"] == 2
+    assert detector.scheduler.stats["completed"] == 0
+    assert detector.last_close_times == {}
+
+    detector.clock.advance(10)
+    scan(detector)
+    assert detector.scheduler.stats["completed"] == 2
+    assert detector.last_close_times == {(symbol, "1h"): START_MS - 1 for symbol in SYMBOLS}
+
+
+def test_scan_symbols_sheds_and_counts_missed():
+    # Mỗi request mất 5 phút, ước lượng ban đầu 100s: cặp 1h đầu được nhận nhưng xong sau hạn 5 phút → miss,
+    # cặp 1h thứ 2 đã quá hạn → shed (không gọi sàn, đánh dấu nến đã xử lý), 1d (hạn 30 phút) vẫn kịp
+    detector = make_detector(START_MS + 60_000, latency=300)
+    detector.scheduler.task_cost_ms = 100_000
+    scanned = []
+    scan(detector, scanned)
+
+    stats = detector.scheduler.stats
+    assert timeframe_order(scanned) == ["1h", "1d", "1d"]
+    assert stats["shed"] == 1
+    assert stats["missed"] == 1
+    assert stats["completed"] == 3
+    # Xong = lúc nhận + request 300s + giãn cách 0.3s của scan_pair; hạn = close_time + 5 phút
+    assert stats["max_lateness_ms"] == (60_000 + 300_000 + 300) - (300_000 - 1)
+    assert all(detector.last_close_times[(symbol, "1h")] == START_MS - 1 for symbol in SYMBOLS)
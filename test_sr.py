@@ -1,12 +1,248 @@
 """
 Script test để kiểm tra S/R zones có chính xác không
-So sánh với TradingView để verify
+- Offline (mặc định / pytest): so sánh SR engine cùng thuật toán (EQUIVALENT_ENGINES) với golden zones
+  của SupportResistanceCalculator gốc trên nến đã ghi (fixtures/sr/), engine khác chỉ kiểm tra schema
+  + báo cáo tốc độ
+- Live: so sánh với TradingView
+
+Cách dùng:
+  python test_sr.py                      # So sánh các engine với golden + tốc độ
+  python test_sr.py record [--synthetic] # Ghi lại nến fixtures (Binance, hoặc MockBinanceServer tổng hợp)
+  python test_sr.py golden               # Tạo lại golden zones từ engine reference
+  python test_sr.py live                 # In zones thật để so với TradingView
 """
 from sr_calculator import SupportResistanceCalculator
+from sr_engines import SR_ENGINES, EQUIVALENT_ENGINES, create_sr_engine
+from kline_client import KlineClient
+from tabulate import tabulate
+import os
+import sys
+import gzip
 import json
+import time
+
+# ========== CẤU HÌNH ==========
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "sr")
+KLINES_FIXTURE = os.path.join(FIXTURE_DIR, "klines.json.gz")
+GOLDEN_FIXTURE = os.path.join(FIXTURE_DIR, "golden.json")
+FIXTURE_SYMBOLS = ["BTCUSDT", "ETHUSDT", "BNBUSDT", "SOLUSDT", "XRPUSDT", "ADAUSDT", "DOGEUSDT", "LDOUSDT"]
+FIXTURE_TIMEFRAMES = ["1h", "2h", "4h", "1d"]
+FIXTURE_LIMIT = 500
+SYNTHETIC_TIME = 1_700_006_400   # Thời điểm cố định khi ghi fixtures tổng hợp
+
+# Bộ tham số được kiểm tra: mặc định của bot + cài đặt TradingView dùng khi verify
+PARAM_SETS = {
+    "default": {},
+    "tradingview": {"pivot_period": 10, "channel_width_pct": 5, "min_strength": 1, "max_num_sr": 6, "loopback": 400}
+}
+SR_TOLERANCE = 1e-9   # Sai số tương đối cho phép của giá (strength phải khớp tuyệt đối)
+SPEED_REPEAT = 3
+
+
+# ========== FIXTURES ==========
+class FixtureClient:
+    """Thay KlineClient: trả rows đã ghi, không gọi mạng"""
+
+    def __init__(self, klines):
+        self.klines = klines
+
+    def get_klines(self, symbol, interval, limit=500):
+        rows = self.klines[f"{symbol} {interval}"][-limit:]
+        return [row + ["0", 0, "0", "0", "0"] for row in rows]
+
+
+def load_klines(path=KLINES_FIXTURE):
+    """{"SYMBOL interval": rows (7 cột đầu của Binance)}"""
+    with gzip.open(path, "rt") as f:
+        return json.load(f)["klines"]
+
+
+def load_golden(path=GOLDEN_FIXTURE):
+    with open(path) as f:
+        return json.load(f)
+
+
+def record_klines(synthetic=False, path=KLINES_FIXTURE):
+    """Ghi nến fixtures: từ Binance (BINANCE_BASE_URL) hoặc MockBinanceServer với dữ liệu tổng hợp"""
+    from clock import SimulatedClock
+    from mock_binance import MockBinanceServer, SyntheticKlines
+
+    def fetch(client):
+        klines = {}
+        for symbol in FIXTURE_SYMBOLS:
+            for timeframe in FIXTURE_TIMEFRAMES:
+                rows = client.get_klines(symbol, timeframe, FIXTURE_LIMIT)
+                klines[f"{symbol} {timeframe}"] = [row[:7] for row in rows]
+                print(f"   • {symbol} {timeframe}: {len(rows)} nến")
+        return klines
+
+    if synthetic:
+        clock = SimulatedClock(SYNTHETIC_TIME, 1.0)
+        with MockBinanceServer(SyntheticKlines(), clock) as server:
+            klines = fetch(KlineClient(url=server.klines_url, clock=clock))
+        source = "synthetic"
+    else:
+        client = KlineClient()
+        klines = fetch(client)
+        source = client.url
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with gzip.GzipFile(path, "wb", mtime=0) as f:
+        f.write(json.dumps({"source": source, "klines": klines}, separators=(",", ":")).encode())
+    print(f"✅ Đã ghi {len(klines)} fixtures vào {path}")
+
+
+def zones_to_json(result):
+    """Kết quả calculate_sr_levels → dict JSON (tuple → list, numpy → float)"""
+    return {
+        'current_price': float(result['current_price']),
+        'support_zones': [[float(low), float(high)] for low, high in result['support_zones']],
+        'resistance_zones': [[float(low), float(high)] for low, high in result['resistance_zones']],
+        'all_zones': [{'low': float(zone['low']), 'high': float(zone['high']), 'strength': int(zone['strength'])}
+                      for zone in result['all_zones']]
+    }
+
+
+def run_engine(name, params, klines, repeat=1):
+    """Chạy 1 engine trên mọi fixture → ({key: zones}, thời gian (giây) tốt nhất cho toàn bộ fixtures)"""
+    engine = create_sr_engine(name, kline_client=FixtureClient(klines), **params)
+    results = {}
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for key in klines:
+            symbol, timeframe = key.split()
+            results[key] = engine.calculate_sr_levels(symbol, timeframe)
+        best = min(best, time.perf_counter() - started)
+    return {key: zones_to_json(result) for key, result in results.items()}, best
+
+
+def write_golden(path=GOLDEN_FIXTURE):
+    """Golden = kết quả của engine reference (SupportResistanceCalculator) trên fixtures"""
+    klines = load_klines()
+    golden = {param_set: run_engine("reference", params, klines)[0] for param_set, params in PARAM_SETS.items()}
+    with open(path, "w") as f:
+        json.dump(golden, f, indent=1, sort_keys=True)
+    print(f"✅ Đã ghi golden zones ({len(klines)} fixtures × {len(PARAM_SETS)} bộ tham số) vào {path}")
+
+
+# ========== SO SÁNH ==========
+def _close(a, b, tolerance=SR_TOLERANCE):
+    return abs(a - b) <= tolerance * max(abs(a), abs(b), 1e-12)
+
+
+def compare_zones(expected, actual, tolerance=SR_TOLERANCE):
+    """Danh sách khác biệt giữa 2 kết quả (rỗng = khớp)"""
+    diffs = []
+    if not _close(expected['current_price'], actual['current_price'], tolerance):
+        diffs.append(f"current_price {expected['current_price']} ≠ {actual['current_price']}")
+
+    for field in ['support_zones', 'resistance_zones']:
+        if len(expected[field]) != len(actual[field]):
+            diffs.append(f"{field}: {len(expected[field])} ≠ {len(actual[field])} zones")
+            continue
+        for (exp_low, exp_high), (low, high) in zip(expected[field], actual[field]):
+            if not (_close(exp_low, low, tolerance) and _close(exp_high, high, tolerance)):
+                diffs.append(f"{field}: {exp_low}-{exp_high} ≠ {low}-{high}")
+
+    if len(expected['all_zones']) != len(actual['all_zones']):
+        diffs.append(f"all_zones: {len(expected['all_zones'])} ≠ {len(actual['all_zones'])} zones")
+    else:
+        for exp, zone in zip(expected['all_zones'], actual['all_zones']):
+            if exp['strength'] != zone['strength'] or not (
+                    _close(exp['low'], zone['low'], tolerance) and _close(exp['high'], zone['high'], tolerance)):
+                diffs.append(f"all_zones: {exp} ≠ {zone}")
+    return diffs
+
+
+def check_engine(name, klines=None, golden=None, repeat=1):
+    """So sánh 1 engine với golden → ({param_set: {key: diffs}}, {param_set: thời gian})"""
+    klines = klines or load_klines()
+    golden = golden or load_golden()
+    mismatches, timings = {}, {}
+    for param_set, params in PARAM_SETS.items():
+        results, timings[param_set] = run_engine(name, params, klines, repeat)
+        mismatches[param_set] = {
+            key: diffs for key, expected in golden[param_set].items()
+            if (diffs := compare_zones(expected, results[key]))
+        }
+    return mismatches, timings
+
+
+def test_reference_matches_golden():
+    mismatches, _ = check_engine("reference")
+    assert not any(mismatches.values()), mismatches
+
+
+def test_engines_match_golden():
+    klines, golden = load_klines(), load_golden()
+    for name in EQUIVALENT_ENGINES:
+        if name == "reference":
+            continue
+        mismatches, _ = check_engine(name, klines, golden)
+        assert not any(mismatches.values()), (name, mismatches)
+
+
+def test_alternative_engines_schema():
+    """Engine khác thuật toán: không so golden, chỉ kiểm tra schema và tính hợp lệ của zones"""
+    klines = load_klines()
+    for name in SR_ENGINES:
+        if name in EQUIVALENT_ENGINES:
+            continue
+        for param_set, params in PARAM_SETS.items():
+            results, _ = run_engine(name, params, klines)
+            for key, result in results.items():
+                price = result['current_price']
+                zones = result['all_zones']
+                assert len(zones) <= params.get('max_num_sr', 6), (name, param_set, key)
+                assert all(zone['low'] < zone['high'] for zone in zones), (name, param_set, key)
+                assert [z['strength'] for z in zones] == sorted((z['strength'] for z in zones), reverse=True)
+                assert all(high < price for _, high in result['support_zones']), (name, param_set, key)
+                assert all(low > price for low, _ in result['resistance_zones']), (name, param_set, key)
+                for i, a in enumerate(zones):
+                    for b in zones[i + 1:]:
+                        assert a['high'] < b['low'] or b['high'] < a['low'], (name, param_set, key)
+
+
+def compare_engines():
+    """So sánh mọi engine với golden, in tốc độ tương đối so với reference"""
+    klines, golden = load_klines(), load_golden()
+    print("\n" + "="*80)
+    print(f"🧪 SO SÁNH SR ENGINES VỚI GOLDEN ({len(klines)} fixtures × {len(PARAM_SETS)} bộ tham số)")
+    print("="*80)
+
+    reports = {name: check_engine(name, klines, golden, SPEED_REPEAT) for name in SR_ENGINES}
+    reference_time = sum(reports["reference"][1].values())
+
+    table = []
+    failed = False
+    for name, (mismatches, timings) in reports.items():
+        total = sum(timings.values())
+        mismatch_count = sum(len(keys) for keys in mismatches.values())
+        match_text = f"{len(klines) * len(PARAM_SETS) - mismatch_count}/{len(klines) * len(PARAM_SETS)}"
+        if name not in EQUIVALENT_ENGINES:
+            match_text = "- (thuật toán khác)"
+            mismatches.clear()
+        failed |= mismatch_count > 0 and name in EQUIVALENT_ENGINES
+        table.append([name, match_text,
+                      f"{total * 1000:.0f}ms", f"{total / len(klines) / len(PARAM_SETS) * 1000:.2f}ms",
+                      f"{reference_time / total:.1f}×"])
+    print("\n" + tabulate(table, headers=["Engine", "Khớp golden", "Tổng", "Mỗi fixture", "Nhanh hơn reference"],
+                          tablefmt="grid"))
+
+    for name, (mismatches, _) in reports.items():
+        for param_set, keys in mismatches.items():
+            for key, diffs in list(keys.items())[:5]:
+                print(f"\n❌ {name} [{param_set}] {key}:")
+                for diff in diffs[:5]:
+                    print(f"   • {diff}")
+
+    print("\n" + ("❌ Có engine không khớp golden!" if failed else "✅ Mọi engine khớp golden"))
+    return 1 if failed else 0
+
 
-def test_sr_zones():
-    """Test S/R zones cho nhiều symbols và timeframes"""
+def show_live_zones():
+    """In S/R zones thật (Binance) để so sánh với TradingView"""
     
     # Symbols để test
     test_symbols = ["LDOUSDT"]
@@ -173,11 +409,19 @@ def test_sr_zones():
     print("5. Kiểm tra file sr_zones_result.json để xem chi tiết")
 
 if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "compare"
     try:
-        test_sr_zones()
+        if command == "record":
+            record_klines(synthetic="--synthetic" in sys.argv)
+        elif command == "golden":
+            write_golden()
+        elif command == "live":
+            show_live_zones()
+        else:
+            sys.exit(compare_engines())
     except KeyboardInterrupt:
         print("\n\n⛔ Đã dừng test!")
     except Exception as e:
         print(f"\n\n❌ Lỗi: {e}")
         import traceback
-        traceback.print_exc()
\ No newline at end of file
+        traceback.print_exc()
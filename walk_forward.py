@@ -0,0 +1,210 @@
+"""
+Walk-Forward - Đánh giá ngưỡng Doji ngoài mẫu (out-of-sample)
+- Cửa sổ train/test trượt theo thời gian: tối ưu trên train, đo trên test ngay sau đó
+- Đặc trưng tính 1 lần trên toàn lịch sử (param_sweep.prepare_dataset), mỗi cửa sổ chỉ là 1 lát cắt
+- Lịch sử chia thành block dài = TEST_DAYS, thống kê (lệnh, thắng, tổng %) tính 1 lần cho mỗi
+  (block, tổ hợp) → cửa sổ train chồng nhau chỉ cộng lại block, không đánh giá lại
+- Purge: lệnh train vào trước test_start nhưng thoát (chạm TP/SL/hết giờ) từ test_start trở đi bị loại
+  → nhãn của train không dùng giá trong khoảng test
+"""
+import time
+import numpy as np
+from tabulate import tabulate
+from backtest_engine import SYMBOLS, TIMEFRAMES, HISTORY_DAYS, load_history, summarize
+import param_sweep
+from param_sweep import PARAM_GRID, prepare_dataset, block_to_features, trade_masks, grid_combinations, map_shared
+
+# ========== CẤU HÌNH ==========
+TRAIN_DAYS = 360
+TEST_DAYS = 90            # Cũng là bước trượt cửa sổ
+MIN_TRAIN_TRADES = 30
+DAY_MS = 24 * 60 * 60 * 1000
+
+
+def make_block_edges(datasets, test_days=TEST_DAYS):
+    """Mốc thời gian các block (chỉ lấy block đủ độ dài)"""
+    close_times = [block[param_sweep.FEATURE_ROWS.index("close_time")] for block in datasets.values()]
+    close_times = [ct for ct in close_times if len(ct)]
+    if not close_times:
+        return np.empty(0, dtype=np.int64)
+
+    start = int(min(ct[0] for ct in close_times))
+    end = int(max(ct[-1] for ct in close_times))
+    return np.arange(start, end + 1, test_days * DAY_MS, dtype=np.int64)
+
+
+def _block_ids(block_edges, times):
+    """Block chứa mỗi mốc thời gian - ngoài các block đầy đủ → dồn vào bin thừa (n_blocks) rồi bỏ"""
+    n_blocks = len(block_edges) - 1
+    ids = np.searchsorted(block_edges, times, side="right") - 1
+    ids[(ids < 0) | (ids >= n_blocks)] = n_blocks
+    return ids
+
+
+def _add_stats(stats, ids, trade_return, sign=1):
+    """Cộng [số lệnh, số lệnh thắng, tổng %] của các lệnh vào bin ids"""
+    size = len(stats)
+    stats[:, 0] += sign * np.bincount(ids, minlength=size)
+    stats[:, 1] += sign * np.bincount(ids, weights=(trade_return > 0), minlength=size)
+    stats[:, 2] += sign * np.bincount(ids, weights=trade_return, minlength=size)
+
+
+def _block_stats_chunk(chunk, block_edges):
+    """
+    Worker: thống kê theo block cho từng tổ hợp trong chunk
+    Trả về list array shape (2, n_blocks, 3), mỗi dòng [số lệnh, số lệnh thắng, tổng % lợi nhuận]:
+    - [0, b]: lệnh vào trong block b
+    - [1, b]: lệnh vào trước block b nhưng thoát trong / sau block b (cần purge khi b là block test đầu)
+    """
+    n_blocks = len(block_edges) - 1
+    block_ids = []
+    for _, _, features in param_sweep._WORKER_DATASETS:
+        block_ids.append((_block_ids(block_edges, features["close_time"]),
+                          _block_ids(block_edges, features["exit_long"]),
+                          _block_ids(block_edges, features["exit_short"])))
+
+    results = []
+    for params in chunk:
+        entered = np.zeros((n_blocks + 1, 3))
+        # Hiệu (difference array): +lệnh ở block sau block vào, -lệnh ở block sau block thoát → cumsum
+        crossing = np.zeros((n_blocks + 2, 3))
+        for (_, timeframe, features), (ids, exit_long, exit_short) in zip(param_sweep._WORKER_DATASETS, block_ids):
+            long_mask, short_mask = trade_masks(features, params, timeframe)
+            trade_return = np.where(long_mask, features["ret_long"], features["ret_short"])
+            exit_ids = np.where(long_mask, exit_long, exit_short)
+            taken = long_mask | short_mask
+            _add_stats(entered, ids[taken], trade_return[taken])
+
+            spans = taken & (exit_ids > ids) & (ids < n_blocks)
+            _add_stats(crossing, ids[spans] + 1, trade_return[spans])
+            _add_stats(crossing, exit_ids[spans] + 1, trade_return[spans], sign=-1)
+        results.append(np.stack([entered[:n_blocks], np.cumsum(crossing, axis=0)[:n_blocks]]))
+    return results
+
+
+def out_of_sample(datasets, params, start, end):
+    """Đánh giá 1 tổ hợp trên khoảng [start, end) - trả về lợi nhuận từng lệnh theo thứ tự thời gian"""
+    returns = []
+    close_times = []
+    for (_, timeframe), block in datasets.items():
+        features = block_to_features(block)
+        in_window = (features["close_time"] >= start) & (features["close_time"] < end)
+        long_mask, short_mask = trade_masks(features, params, timeframe)
+        taken = in_window & (long_mask | short_mask)
+        returns.append(np.where(long_mask, features["ret_long"], features["ret_short"])[taken])
+        close_times.append(features["close_time"][taken])
+
+    if not returns:
+        return np.empty(0)
+    order = np.argsort(np.concatenate(close_times), kind="stable")
+    return np.concatenate(returns)[order]
+
+
+def run_walk_forward(datasets, combinations, train_days=TRAIN_DAYS, test_days=TEST_DAYS,
+                     min_train_trades=MIN_TRAIN_TRADES):
+    """
+    Walk-forward trên datasets đã chuẩn bị ({(symbol, timeframe): block})
+    Trả về (windows, oos_returns): thông tin từng cửa sổ + toàn bộ lệnh ngoài mẫu
+    """
+    block_edges = make_block_edges(datasets, test_days)
+    train_blocks = max(1, round(train_days / test_days))
+    n_blocks = len(block_edges) - 1
+    if n_blocks <= train_blocks:
+        return [], np.empty(0)
+
+    # (n_combos, 2, n_blocks, 3) → cộng dồn theo block để lấy tổng của cửa sổ bất kỳ trong O(1)
+    stats = np.stack(map_shared(datasets, _block_stats_chunk, combinations, (block_edges,)))
+    entered, crossing = stats[:, 0], stats[:, 1]
+    cumulative = np.concatenate([np.zeros((len(combinations), 1, 3)), np.cumsum(entered, axis=1)], axis=1)
+
+    windows = []
+    oos_returns = []
+    for test_block in range(train_blocks, n_blocks):
+        # Purge lệnh train thoát trong khoảng test (MAX_HOLD nến luôn ngắn hơn cửa sổ train
+        # → mọi lệnh vắt qua test_start đều vào trong cửa sổ train)
+        train = cumulative[:, test_block] - cumulative[:, test_block - train_blocks] - crossing[:, test_block]
+        trades, wins, total = train[:, 0], train[:, 1], train[:, 2]
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            expectancy = np.where(trades >= min_train_trades, total / trades, -np.inf)
+            win_rate = wins / trades * 100
+        best = int(np.argmax(expectancy))
+        if not np.isfinite(expectancy[best]):
+            continue
+
+        params = combinations[best]
+        test_start, test_end = int(block_edges[test_block]), int(block_edges[test_block + 1])
+        test_returns = out_of_sample(datasets, params, test_start, test_end)
+        oos_returns.append(test_returns)
+
+        windows.append({
+            "train_start": int(block_edges[test_block - train_blocks]),
+            "test_start": test_start,
+            "test_end": test_end,
+            "params": params,
+            "train_trades": int(trades[best]),
+            "train_win_rate": float(win_rate[best]),
+            "train_expectancy": float(expectancy[best]),
+            "test": summarize(test_returns)
+        })
+
+    return windows, np.concatenate(oos_returns) if oos_returns else np.empty(0)
+
+
+def _date(timestamp_ms):
+    return time.strftime("%d/%m/%Y", time.gmtime(timestamp_ms / 1000))
+
+
+def main():
+    print("\n" + "="*100)
+    print("🚶 WALK-FORWARD - ĐÁNH GIÁ NGOÀI MẪU")
+    print("="*100)
+
+    started = time.perf_counter()
+    datasets = {}
+    for symbol in SYMBOLS:
+        for timeframe in TIMEFRAMES:
+            try:
+                arrays = load_history(symbol, timeframe, HISTORY_DAYS)
+            except Exception as e:
+                print(f"❌ Lỗi khi lấy dữ liệu {symbol} {timeframe}: {e}")
+                continue
+            datasets[(symbol, timeframe)] = prepare_dataset(arrays, timeframe)
+
+    combinations = list(grid_combinations())
+    print(f"\n📊 {len(datasets)} datasets, {len(combinations)} tổ hợp, train {TRAIN_DAYS} ngày / test {TEST_DAYS} ngày")
+
+    windows, oos_returns = run_walk_forward(datasets, combinations)
+    if not windows:
+        print("\n❌ Không đủ lịch sử cho 1 cửa sổ train + test")
+        return
+
+    names = list(PARAM_GRID)
+    table = []
+    for w in windows:
+        test = w["test"]
+        table.append([
+            f"{_date(w['train_start'])} → {_date(w['test_start'])}",
+            f"{_date(w['test_start'])} → {_date(w['test_end'])}",
+            "/".join(str(w["params"][name]) for name in names),
+            w["train_trades"], f"{w['train_win_rate']:.1f}%", f"{w['train_expectancy']:.3f}%",
+            test["trades"], f"{test['win_rate']:.1f}%", f"{test['expectancy']:.3f}%", f"{test['total_return']:.1f}%"
+        ])
+
+    headers = ["Train", "Test", "Tham số", "Lệnh IS", "Win IS", "Exp IS", "Lệnh OOS", "Win OOS", "Exp OOS", "Tổng OOS"]
+    print(tabulate(table, headers=headers, tablefmt="grid"))
+
+    oos = summarize(oos_returns)
+    print(f"\n🎯 Tổng hợp ngoài mẫu ({len(windows)} cửa sổ):")
+    print(f"  • Lệnh: {oos['trades']}")
+    print(f"  • Win rate: {oos['win_rate']:.1f}%")
+    print(f"  • Expectancy: {oos['expectancy']:.3f}%")
+    print(f"  • Tổng: {oos['total_return']:.1f}% | Max DD: {oos['max_drawdown']:.1f}%")
+    print(f"\n⏱️ Hoàn thành trong {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n\n⛔ Đã dừng!")
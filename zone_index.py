@@ -0,0 +1,140 @@
+"""
+Zone Index - Tra cứu vùng S/R nhanh bằng bisect (O(log n) mỗi truy vấn)
+Thay cho việc quét tuyến tính list zones trong is_price_in_zone / is_candle_touching_zone / get_nearest_zone
+"""
+from bisect import bisect_right
+from typing import Dict, List, Optional, Tuple
+
+
+class ZoneIndex:
+    """
+    Index cho 1 list zones (low, high):
+    - lows sắp xếp tăng dần + max(high) tích lũy → chứa/chạm trong O(log n)
+    - mids sắp xếp tăng dần → zone gần nhất trong O(log n)
+    Zone có thể lồng nhau (channel lớn bao channel nhỏ) nên dùng max tích lũy thay vì high[i]
+    """
+
+    def __init__(self, zones: List[Tuple[float, float]]):
+        self.zones = sorted((float(low), float(high)) for low, high in zones)
+        self.lows = [low for low, _ in self.zones]
+
+        # max_high_idx[i] = vị trí zone có high lớn nhất trong zones[0..i]
+        self.max_highs = []
+        self.max_high_idx = []
+        best = -1
+        for i, (_, high) in enumerate(self.zones):
+            if best < 0 or high > self.zones[best][1]:
+                best = i
+            self.max_highs.append(self.zones[best][1])
+            self.max_high_idx.append(best)
+
+        self.by_mid = sorted(self.zones, key=lambda z: (z[0] + z[1]) / 2)
+        self.mids = [(low + high) / 2 for low, high in self.by_mid]
+
+    def __len__(self):
+        return len(self.zones)
+
+    def _overlapping(self, low: float, high: float) -> Optional[Tuple[float, float]]:
+        """Zone giao với đoạn [low, high] (zone có high lớn nhất trong các ứng viên)"""
+        i = bisect_right(self.lows, high)
+        if i == 0 or self.max_highs[i - 1] < low:
+            return None
+        return self.zones[self.max_high_idx[i - 1]]
+
+    def contains(self, price: float) -> bool:
+        """Giá có nằm trong zone nào không"""
+        return self._overlapping(price, price) is not None
+
+    def find_containing(self, price: float) -> Optional[Tuple[float, float]]:
+        """Zone chứa giá (None nếu không có)"""
+        return self._overlapping(price, price)
+
+    def touches(self, candle_low: float, candle_high: float) -> bool:
+        """Nến có chạm zone nào không (đầu nến trong zone hoặc nến bao trùm zone)"""
+        return self._overlapping(candle_low, candle_high) is not None
+
+    def find_touching(self, candle_low: float, candle_high: float) -> Optional[Tuple[float, float]]:
+        """Zone bị nến chạm vào (None nếu không có)"""
+        return self._overlapping(candle_low, candle_high)
+
+    def nearest(self, price: float) -> Optional[Tuple[float, float]]:
+        """Zone có mid gần giá nhất"""
+        if not self.by_mid:
+            return None
+
+        i = bisect_right(self.mids, price)
+        if i == 0:
+            return self.by_mid[0]
+        if i == len(self.mids):
+            return self.by_mid[-1]
+
+        # Hòa khoảng cách → lấy zone thấp hơn
+        if price - self.mids[i - 1] <= self.mids[i] - price:
+            return self.by_mid[i - 1]
+        return self.by_mid[i]
+
+    # ============ BATCH (NumPy - chỉ import khi dùng, bot live không cần) ============
+    def _overlapping_many(self, lows, highs):
+        import numpy as np
+        lows = np.asarray(lows, dtype=float)
+        highs = np.asarray(highs, dtype=float)
+        if not self.zones:
+            return np.full(lows.shape, -1)
+
+        idx = np.searchsorted(np.asarray(self.lows), highs, side="right") - 1
+        safe_idx = np.maximum(idx, 0)
+        hit = (idx >= 0) & (np.asarray(self.max_highs)[safe_idx] >= lows)
+        return np.where(hit, np.asarray(self.max_high_idx)[safe_idx], -1)
+
+    def contains_many(self, prices):
+        """Batch contains: array giá → array bool"""
+        return self._overlapping_many(prices, prices) >= 0
+
+    def touches_many(self, candle_lows, candle_highs):
+        """Batch touches: array low/high của nhiều nến → array bool"""
+        return self._overlapping_many(candle_lows, candle_highs) >= 0
+
+    def touching_indices(self, candle_lows, candle_highs):
+        """Batch find_touching: vị trí zone trong self.zones, -1 nếu không chạm"""
+        return self._overlapping_many(candle_lows, candle_highs)
+
+    def nearest_indices(self, prices):
+        """Batch nearest: vị trí zone trong self.by_mid, -1 nếu index rỗng"""
+        import numpy as np
+        prices = np.asarray(prices, dtype=float)
+        if not self.by_mid:
+            return np.full(prices.shape, -1)
+
+        mids = np.asarray(self.mids)
+        if len(mids) == 1:
+            return np.zeros(prices.shape, dtype=int)
+
+        right = np.clip(np.searchsorted(mids, prices, side="right"), 1, len(mids) - 1)
+        left = right - 1
+        use_left = (prices - mids[left]) <= (mids[right] - prices)
+        return np.where(use_left, left, right)
+
+
+class SRZoneIndex:
+    """Index cho kết quả SupportResistanceCalculator.calculate_sr_levels của 1 (symbol, interval)"""
+
+    def __init__(self, sr_levels: Dict):
+        self.sr_levels = sr_levels
+        self.current_price = sr_levels.get('current_price', 0)
+        self.support = ZoneIndex(sr_levels.get('support_zones', []))
+        self.resistance = ZoneIndex(sr_levels.get('resistance_zones', []))
+        self.all = ZoneIndex([(z['low'], z['high']) for z in sr_levels.get('all_zones', [])])
+
+    def confluence(self, candle_low: float, candle_high: float) -> Optional[Tuple[float, float]]:
+        """Zone S/R mà nến chạm vào (None nếu không có confluence)"""
+        return self.all.find_touching(candle_low, candle_high)
+
+    def to_dict(self) -> Dict:
+        """sr_levels dạng JSON được (tuple → list, số NumPy → float) - dựng lại bằng SRZoneIndex(...)"""
+        return {
+            'current_price': float(self.sr_levels.get('current_price', 0)),
+            'support_zones': [[float(low), float(high)] for low, high in self.sr_levels.get('support_zones', [])],
+            'resistance_zones': [[float(low), float(high)] for low, high in self.sr_levels.get('resistance_zones', [])],
+            'all_zones': [{'low': float(zone['low']), 'high': float(zone['high']), 'mid': float(zone['mid']),
+                           'strength': int(zone['strength'])} for zone in self.sr_levels.get('all_zones', [])]
+        }